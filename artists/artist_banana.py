@@ -1,7 +1,9 @@
 from pathlib import Path
 from typing import Any
 from artists.base_artist import Artist
-from google import genai
+from core.metrics import metrics
+from core.rate_limit import AdaptiveLimiter
+from core.transport import get_genai_client
 from google.genai.types import (
 	GenerateContentResponse,
 	GenerateContentConfig,
@@ -12,7 +14,26 @@ from google.genai.types import (
 class BananaArtist(Artist):
 	def __init__(self, config: dict[str, Any]) -> None:
 		super().__init__(config)
-		self.client = genai.Client()
+		self.client = get_genai_client()
+		self.limiter = AdaptiveLimiter("Banana", **config.get("rate_limit", {}))
+
+	def _build_request(
+		self, prompt: str, paint_cfg: dict[str, Any]
+	) -> tuple[str, GenerateContentConfig]:
+		"""Returns the final prompt and the generation config."""
+		ar: str = paint_cfg["aspect_ratio"]
+
+		negative_prompt = paint_cfg.get("negative_prompt", "")
+		if negative_prompt:
+			prompt = f"{prompt}\n\nNegative prompt: {negative_prompt}."
+
+		config = GenerateContentConfig(
+			image_config=ImageConfig(
+				aspect_ratio=ar,
+				# image_size='1K'
+			)
+		)
+		return prompt, config
 
 	def paint(
 		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
@@ -20,30 +41,50 @@ class BananaArtist(Artist):
 		try:
 			# generate the image
 			model: str = self.config["model"]
-			ar: str = paint_cfg["aspect_ratio"]
+			final_prompt, config = self._build_request(prompt, paint_cfg)
 
-			negative_prompt = paint_cfg.get("negative_prompt", "")
-			if negative_prompt:
-				prompt = f"{prompt}\n\nNegative prompt: {negative_prompt}."
-			else:
-				prompt = prompt
+			image_response: GenerateContentResponse = self.limiter.call(
+				lambda: self.client.models.generate_content(
+					model=model,
+					contents=final_prompt,
+					config=config,
+				)
+			)
+		except Exception as e:
+			print(f"Banana Error: {e}")
+			return False
 
-			image_response: GenerateContentResponse = (
-				self.client.models.generate_content(
+		return self._save_image(image_response, image_name_stem, paint_cfg)
+
+	async def apaint(
+		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+	) -> bool:
+		try:
+			model: str = self.config["model"]
+			final_prompt, config = self._build_request(prompt, paint_cfg)
+
+			image_response: GenerateContentResponse = await self.limiter.acall(
+				lambda: self.client.aio.models.generate_content(
 					model=model,
-					contents=prompt,
-					config=GenerateContentConfig(
-						image_config=ImageConfig(
-							aspect_ratio=ar,
-							# image_size='1K'
-						)
-					),
+					contents=final_prompt,
+					config=config,
 				)
 			)
 		except Exception as e:
 			print(f"Banana Error: {e}")
 			return False
 
+		return self._save_image(image_response, image_name_stem, paint_cfg)
+
+	def report(self) -> str:
+		return self.limiter.report()
+
+	def _save_image(
+		self,
+		image_response: GenerateContentResponse,
+		image_name_stem: str,
+		paint_cfg: dict[str, Any],
+	) -> bool:
 		if image_response.parts is None:
 			print("Banana Error: No proper response!")
 			return False
@@ -55,7 +96,8 @@ class BananaArtist(Artist):
 				output_dir.mkdir(parents=True, exist_ok=True)
 				img_ext = paint_cfg["image_extension"]
 				output_image_path: Path = output_dir / f"{image_name_stem}.{img_ext}"
-				image.save(str(output_image_path.resolve()))
+				with metrics.timer("stage", stage="transfer", mode="inline"):
+					image.save(str(output_image_path.resolve()))
 				break
 		else:
 			print("Banana Error: No image was generated!")
@@ -1,8 +1,23 @@
+import asyncio
+import base64
+import codecs
+import contextvars
+import os
 import requests
 import shutil
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
 from typing import Any
 from pathlib import Path
+from urllib.parse import urlsplit
 from artists.base_artist import Artist
+from core.json_stream import iter_json_array
+from core.metrics import metrics
+from core.transport import get_session
+from settings import TransferMode
 
 
 def get_real_images_paths(
@@ -33,6 +48,34 @@ def get_real_images_paths(
 	return paths
 
 
+def final_image_path(
+	base_image_name: str, index: int, n_images: int, suffix: str, output_dir: Path
+) -> Path:
+	"""
+	Final path of the index-th (1-based) image of a job.
+	A single image keeps the base name, several ones get a _1, _2... suffix.
+	"""
+	if n_images == 1:
+		return output_dir / f"{base_image_name}{suffix}"
+	return output_dir / f"{base_image_name}_{index}{suffix}"
+
+
+def save_atomically(path: Path, chunks: Iterable[bytes]) -> None:
+	"""
+	Writes the chunks to a temporary file that replaces path once complete,
+	so a failed transfer leaves no partial image behind.
+	"""
+	tmp_path: Path = path.with_name(path.name + ".part")
+	try:
+		with open(tmp_path, mode="wb") as file:
+			for chunk in chunks:
+				file.write(chunk)
+		os.replace(tmp_path, path)
+	except BaseException:
+		tmp_path.unlink(missing_ok=True)
+		raise
+
+
 def move_rename_images(
 	real_paths: list[Path], base_image_name: str, output_dir: Path
 ) -> None:
@@ -44,24 +87,129 @@ def move_rename_images(
 	# ensure path existance
 	output_dir.mkdir(parents=True, exist_ok=True)
 
-	if len(real_paths) == 1:
-		new_path = output_dir / f"{base_image_name}{real_paths[0].suffix}"
-		shutil.move(str(real_paths[0].resolve()), str(new_path.resolve()))
+	for i, path in enumerate(real_paths, start=1):
+		new_path = final_image_path(
+			base_image_name, i, len(real_paths), path.suffix, output_dir
+		)
+		shutil.move(str(path.resolve()), str(new_path.resolve()))
+		print(f"✅ Saved to: {new_path}")
+
+
+def download_images(
+	api_response: list[dict[str, Any]],
+	base_url: str,
+	base_image_name: str,
+	output_dir: Path,
+	chunk_size: int = 1 << 16,
+	timeout: float | None = None,
+) -> None:
+	"""
+	Downloads the images of a remote Fooocus-API server to the destination
+	folder, streaming each one to disk in chunks.
+	timeout: Seconds to wait for the server, for the connection and for each
+		chunk.
+
+	The host of the returned urls is what the server thinks it is called
+	(often 127.0.0.1), so only their path is kept and joined to base_url.
+	"""
+	output_dir.mkdir(parents=True, exist_ok=True)
+
+	for i, entry in enumerate(api_response, start=1):
+		if not entry.get("url"):
+			raise ValueError("Response did not contain `url` key!")
+
+		url_path: str = urlsplit(entry["url"]).path
+		new_path = final_image_path(
+			base_image_name, i, len(api_response), Path(url_path).suffix, output_dir
+		)
+
+		with get_session().get(
+			f"{base_url}{url_path}", stream=True, timeout=timeout
+		) as response:
+			response.raise_for_status()
+			save_atomically(new_path, response.iter_content(chunk_size=chunk_size))
+		print(f"✅ Saved to: {new_path}")
+
+
+def decode_base64_images(
+	api_response: Iterable[dict[str, Any]],
+	base_image_name: str,
+	output_dir: Path,
+	n_images: int,
+	default_suffix: str = ".png",
+) -> int:
+	"""
+	Writes the base64 payloads of a `require_base64` response to the
+	destination folder. Images are decoded one by one, so with a lazily
+	parsed response (see iter_json_array) only one is held in memory.
+	Returns the number of images written.
+	"""
+	output_dir.mkdir(parents=True, exist_ok=True)
+
+	n_written: int = 0
+	for i, entry in enumerate(api_response, start=1):
+		payload: str | None = entry.pop("base64", None)
+		if not payload:
+			raise ValueError("Response did not contain `base64` key!")
+
+		suffix: str = Path(urlsplit(entry.get("url") or "").path).suffix
+		new_path = final_image_path(
+			base_image_name, i, n_images, suffix or default_suffix, output_dir
+		)
+
+		save_atomically(new_path, [base64.b64decode(payload)])
+		n_written += 1
 		print(f"✅ Saved to: {new_path}")
-	else:
-		for i, path in enumerate(real_paths, start=1):
-			new_path = output_dir / f"{base_image_name}_{i}{path.suffix}"
-			shutil.move(str(path.resolve()), str(new_path.resolve()))
-			print(f"✅ Saved to: {new_path}")
+	return n_written
+
+
+@dataclass
+class _QueuedJob:
+	"""A job submitted to the Fooocus-API queue, waiting for its result."""
+
+	job_id: str
+	image_name_stem: str
+	paint_cfg: dict[str, Any]
+	future: Future[bool] = field(default_factory=Future)
+	poll_errors: int = 0
+	# of the submitting job, so the poller saves its images with its metric labels
+	context: contextvars.Context = field(default_factory=contextvars.copy_context)
 
 
 class FooocusArtist(Artist):
-	def paint(
-		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
-	) -> bool:
-		base_url: str = self.config["url"].rstrip("/")
-		url: str = f"{base_url}/v1/generation/text-to-image"
+	"""
+	Paints with a Fooocus-API server.
+
+	In the default (sync) mode every request is held open for the whole
+	render. With `async_jobs` enabled, jobs are put in the server's own queue
+	and a single poller thread collects their results, moving each job's
+	images as soon as it is done. Up to `max_queued_jobs` jobs wait in the
+	server queue at once, so renders follow each other without gaps, as long
+	as there are enough artist workers (or async jobs in flight) to feed it.
+	"""
+
+	# consecutive failed status queries before a job is given up
+	MAX_POLL_ERRORS: int = 10
+
+	def __init__(self, config: dict[str, Any]) -> None:
+		super().__init__(config)
+		self.base_url: str = self.config["url"].rstrip("/")
+		self.async_jobs: bool = self.config.get("async_jobs", False)
+		self.transfer_mode = TransferMode(
+			self.config.get("transfer_mode", TransferMode.AUTO)
+		)
+		self.poll_interval: float = self.config.get("poll_interval", 1.0)
+		# of the queue requests, a hung one would stall every queued job
+		self.request_timeout: float = self.config.get("request_timeout", 30.0)
 
+		self._queue_slots = threading.BoundedSemaphore(
+			self.config.get("max_queued_jobs", 4)
+		)
+		self._jobs: dict[str, _QueuedJob] = {}
+		self._jobs_lock = threading.Lock()
+		self._poller: threading.Thread | None = None
+
+	def _build_payload(self, prompt: str, paint_cfg: dict[str, Any]) -> dict[str, Any]:
 		seed: int = paint_cfg["seed"]
 		n_images: int = paint_cfg["N_images"]
 		base_model: str = self.config["checkpoint"]
@@ -78,8 +226,8 @@ class FooocusArtist(Artist):
 
 		basic_payload_params: dict[str, Any] = {
 			"advanced_params": {"disable_preview": True},
-			"require_base64": False,
-			"async_process": False,
+			"require_base64": self.transfer_mode == TransferMode.BASE64,
+			"async_process": self.async_jobs,
 			"sharpness": 2,
 			"image_number": n_images,
 			"refiner_model_name": "None",
@@ -100,30 +248,273 @@ class FooocusArtist(Artist):
 			"guidance_scale": paint_cfg["guidance_scale"],
 		}
 		payload.update(basic_payload_params)
+		return payload
+
+	def _save_results(
+		self,
+		results: list[dict[str, Any]],
+		image_name_stem: str,
+		paint_cfg: dict[str, Any],
+	) -> None:
+		# use default dir
+		output_dir: Path = Path(paint_cfg["output_folder"])
 
+		if self.transfer_mode == TransferMode.BASE64:
+			with metrics.timer("stage", stage="transfer", mode="base64"):
+				decode_base64_images(results, image_name_stem, output_dir, len(results))
+			return
+
+		if self.transfer_mode != TransferMode.DOWNLOAD:
+			real_images_paths: list[Path] = self._local_images_paths(results)
+			# AUTO only renames when the server shares our filesystem
+			if self.transfer_mode == TransferMode.MOVE or real_images_paths:
+				# move and rename images to the desired location and name
+				with metrics.timer("stage", stage="transfer", mode="move"):
+					move_rename_images(real_images_paths, image_name_stem, output_dir)
+				return
+
+		with metrics.timer("stage", stage="transfer", mode="download"):
+			download_images(
+				results,
+				self.base_url,
+				image_name_stem,
+				output_dir,
+				timeout=self.request_timeout,
+			)
+
+	def _stream_base64_results(
+		self,
+		response: requests.Response,
+		image_name_stem: str,
+		paint_cfg: dict[str, Any],
+	) -> bool:
+		"""
+		Decodes the images of a `require_base64` response while it is read,
+		instead of loading the whole batch of payloads at once.
+		"""
+		chunks: Iterable[str] = codecs.iterdecode(
+			response.iter_content(chunk_size=1 << 16), "utf-8"
+		)
+		with metrics.timer("stage", stage="transfer", mode="base64"):
+			n_written: int = decode_base64_images(
+				iter_json_array(chunks),
+				image_name_stem,
+				Path(paint_cfg["output_folder"]),
+				paint_cfg["N_images"],
+			)
+		return n_written > 0
+
+	def _local_images_paths(self, results: list[dict[str, Any]]) -> list[Path]:
+		"""
+		Paths of the generated images on our disk. Empty if the Fooocus root
+		is unknown or the images are not there (e.g. a remote server),
+		unless the transfer mode is MOVE, where the paths are always trusted.
+		"""
+		fooocus_root: Path | None = self.config.get("path")
+		if fooocus_root is None:
+			if self.transfer_mode == TransferMode.MOVE:
+				raise ValueError("FOOOCUS__PATH is required to move images!")
+			return []
+
+		# get generated images paths from data
+		paths: list[Path] = get_real_images_paths(results, Path(fooocus_root))
+		if self.transfer_mode == TransferMode.MOVE:
+			return paths
+		return paths if all(path.exists() for path in paths) else []
+
+	def paint(
+		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+	) -> bool:
+		if self.async_jobs:
+			return self.submit(prompt, image_name_stem, paint_cfg).result()
+
+		url: str = f"{self.base_url}/v1/generation/text-to-image"
+		payload: dict[str, Any] = self._build_payload(prompt, paint_cfg)
+
+		# base64 images are decoded while the response is read
+		stream: bool = self.transfer_mode == TransferMode.BASE64
 		try:
-			response = requests.post(url, json=payload)
+			response = get_session().post(url, json=payload, stream=stream)
 			response.raise_for_status()
 
 		except requests.HTTPError as e:
 			print(f"Fooocus Error: {e}")
 			return False
 
+		if stream:
+			with response:
+				return self._stream_base64_results(response, image_name_stem, paint_cfg)
+
 		data = response.json()
 
 		if response.status_code == 200 and data:
-			# get generated images paths from data
-			real_images_paths: list[Path] = get_real_images_paths(
-				data, self.config["path"]
-			)
-
-			# move and rename images to the desired location and name
-			# use default dir
-			output_dir: Path = Path(paint_cfg["output_folder"])
-			move_rename_images(real_images_paths, image_name_stem, output_dir)
-
+			self._save_results(data, image_name_stem, paint_cfg)
 			return True
 
 		print(f"API Error {response.status_code}: {response.text}")
 		print(f"Retrieved data: {data}")
 		return False
+
+	def warm_up(self) -> bool:
+		"""
+		Renders one image of one step, which makes the server load the
+		checkpoint. The image is deleted when it is on our disk.
+		"""
+		warm_up_cfg: dict[str, Any] = {
+			"seed": 0,
+			"N_images": 1,
+			"performance": "Extreme Speed",
+			"image_size": "1024*1024",
+			"styles": [],
+			"negative_prompt": "",
+			"guidance_scale": 4.0,
+		}
+		payload: dict[str, Any] = self._build_payload("warm up", warm_up_cfg)
+		payload.update(async_process=False, require_base64=False)
+		payload["advanced_params"]["overwrite_step"] = 1
+
+		url: str = f"{self.base_url}/v1/generation/text-to-image"
+		try:
+			response = get_session().post(url, json=payload)
+			response.raise_for_status()
+			results: list[dict[str, Any]] = response.json()
+		except (requests.RequestException, ValueError) as e:
+			print(f"Fooocus warm-up failed: {e}")
+			return False
+
+		try:
+			for path in self._local_images_paths(results):
+				path.unlink(missing_ok=True)
+		except (OSError, ValueError):
+			# a leftover image of the warm-up is not worth failing for
+			pass
+		return True
+
+	async def apaint(
+		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+	) -> bool:
+		if not self.async_jobs:
+			return await super().apaint(prompt, image_name_stem, paint_cfg)
+
+		# submitting may wait for a free queue slot, so keep it off the loop
+		future: Future[bool] = await asyncio.to_thread(
+			self.submit, prompt, image_name_stem, paint_cfg
+		)
+		return await asyncio.wrap_future(future)
+
+	def submit(
+		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+	) -> Future[bool]:
+		"""
+		Puts a job in the Fooocus-API queue and returns right away.
+		Blocks only while `max_queued_jobs` jobs are already queued.
+
+		The returned future resolves to True once the job's images were moved
+		to the output folder, or to False if the job failed.
+		"""
+		url: str = f"{self.base_url}/v1/generation/text-to-image"
+		payload: dict[str, Any] = self._build_payload(prompt, paint_cfg)
+		payload["async_process"] = True
+
+		self._queue_slots.acquire()
+		try:
+			response = get_session().post(
+				url, json=payload, timeout=self.request_timeout
+			)
+			response.raise_for_status()
+			job_id: str = response.json()["job_id"]
+		except (requests.RequestException, KeyError, ValueError) as e:
+			self._queue_slots.release()
+			print(f"Fooocus Error: could not submit job: {e}")
+			failed: Future[bool] = Future()
+			failed.set_result(False)
+			return failed
+
+		job = _QueuedJob(job_id, image_name_stem, paint_cfg)
+		with self._jobs_lock:
+			self._jobs[job_id] = job
+			if self._poller is None or not self._poller.is_alive():
+				self._poller = threading.Thread(
+					target=self._poll_jobs, name="fooocus-poller", daemon=True
+				)
+				self._poller.start()
+
+		return job.future
+
+	def _finish(self, job: _QueuedJob, success: bool) -> None:
+		with self._jobs_lock:
+			if self._jobs.pop(job.job_id, None) is None:
+				# already failed by a crashed poller
+				return
+		self._queue_slots.release()
+		job.future.set_result(success)
+
+	def _fail_queued_jobs(self) -> None:
+		"""Fails every queued job, their results won't be collected."""
+		with self._jobs_lock:
+			jobs: list[_QueuedJob] = list(self._jobs.values())
+			self._jobs.clear()
+			self._poller = None
+		for job in jobs:
+			self._queue_slots.release()
+			job.future.set_result(False)
+
+	def _poll_job(self, job: _QueuedJob) -> None:
+		"""Queries the status of one job, and finishes it if it is done."""
+		params: dict[str, str] = {"job_id": job.job_id, "require_step_preview": "false"}
+		try:
+			response = get_session().get(
+				f"{self.base_url}/v1/generation/query-job",
+				params=params,
+				timeout=self.request_timeout,
+			)
+			response.raise_for_status()
+			status: dict[str, Any] = response.json()
+		except (requests.RequestException, ValueError) as e:
+			job.poll_errors += 1
+			if job.poll_errors >= self.MAX_POLL_ERRORS:
+				print(f"Fooocus Error: lost track of job {job.job_id}: {e}")
+				self._finish(job, False)
+			return
+
+		job.poll_errors = 0
+		stage: str = status.get("job_stage", "")
+
+		if stage == "SUCCESS":
+			results: list[dict[str, Any]] = status.get("job_result") or []
+			if not results:
+				print(f"Fooocus Error: job {job.job_id} finished without images!")
+				self._finish(job, False)
+				return
+			try:
+				job.context.run(
+					self._save_results, results, job.image_name_stem, job.paint_cfg
+				)
+			except (ValueError, OSError) as e:
+				print(f"Fooocus Error: could not save job {job.job_id}: {e}")
+				self._finish(job, False)
+				return
+			self._finish(job, True)
+
+		elif stage == "ERROR":
+			print(f"Fooocus Error: job {job.job_id} failed: {status}")
+			self._finish(job, False)
+
+	def _poll_jobs(self) -> None:
+		"""Poller thread, runs as long as there are queued jobs."""
+		try:
+			while True:
+				with self._jobs_lock:
+					jobs: list[_QueuedJob] = list(self._jobs.values())
+					if not jobs:
+						self._poller = None
+						return
+
+				for job in jobs:
+					self._poll_job(job)
+
+				time.sleep(self.poll_interval)
+		except Exception as e:
+			# nobody else would resolve the futures the workers wait on
+			print(f"Fooocus Error: job poller crashed: {e}")
+			self._fail_queued_jobs()
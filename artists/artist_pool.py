@@ -0,0 +1,157 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+
+from artists.base_artist import Artist
+from artists.artist_fooocus import FooocusArtist
+
+
+@dataclass
+class EndpointStats:
+	"""Bookkeeping of one endpoint of the pool."""
+
+	outstanding: int = 0
+	succeeded: int = 0
+	failed: int = 0
+	consecutive_failures: int = 0
+	busy_seconds: float = 0.0
+	drained: bool = False
+
+
+class ArtistPool(Artist):
+	"""
+	Spreads jobs over several artists (usually one per GPU host).
+
+	Every job goes to the endpoint with the fewest outstanding jobs.
+	An endpoint that fails `max_failures` jobs in a row is drained:
+	it gets no new jobs for the rest of the run.
+	"""
+
+	def __init__(self, artists: dict[str, Artist], max_failures: int = 3) -> None:
+		"""
+		artists: The artist of every endpoint, by endpoint name (e.g. its url).
+		Raises:
+			ValueError: If no artist is given.
+		"""
+		if not artists:
+			raise ValueError("ArtistPool needs at least one artist!")
+
+		super().__init__({})
+		self.artists = artists
+		self.max_failures = max_failures
+		self.stats: dict[str, EndpointStats] = {
+			name: EndpointStats() for name in artists
+		}
+		self._lock = threading.Lock()
+		self._started_at: float | None = None
+
+	@classmethod
+	def from_fooocus_config(cls, config: dict[str, Any]) -> "ArtistPool":
+		"""Builds one FooocusArtist per url of `config["urls"]`."""
+		artists: dict[str, Artist] = {
+			url: FooocusArtist({**config, "url": url}) for url in config["urls"]
+		}
+		return cls(artists, max_failures=config.get("max_endpoint_failures", 3))
+
+	def _acquire(self) -> str | None:
+		"""Reserves the least busy healthy endpoint, None if all are drained."""
+		with self._lock:
+			if self._started_at is None:
+				self._started_at = time.monotonic()
+
+			healthy = [name for name, st in self.stats.items() if not st.drained]
+			if not healthy:
+				return None
+
+			name = min(healthy, key=lambda n: self.stats[n].outstanding)
+			self.stats[name].outstanding += 1
+			return name
+
+	def _release(self, name: str, success: bool, elapsed: float) -> None:
+		with self._lock:
+			st = self.stats[name]
+			st.outstanding -= 1
+			st.busy_seconds += elapsed
+
+			if success:
+				st.succeeded += 1
+				st.consecutive_failures = 0
+				return
+
+			st.failed += 1
+			st.consecutive_failures += 1
+			if st.consecutive_failures >= self.max_failures and not st.drained:
+				st.drained = True
+				print(
+					f"❌ Artist pool: draining {name} after "
+					f"{st.consecutive_failures} failures in a row."
+				)
+
+	def paint(
+		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+	) -> bool:
+		name: str | None = self._acquire()
+		if name is None:
+			print("❌ Artist pool: every endpoint is drained!")
+			return False
+
+		start = time.monotonic()
+		success = False
+		try:
+			success = self.artists[name].paint(prompt, image_name_stem, paint_cfg)
+		finally:
+			self._release(name, success, time.monotonic() - start)
+		return success
+
+	async def apaint(
+		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+	) -> bool:
+		name: str | None = self._acquire()
+		if name is None:
+			print("❌ Artist pool: every endpoint is drained!")
+			return False
+
+		start = time.monotonic()
+		success = False
+		try:
+			success = await self.artists[name].apaint(
+				prompt, image_name_stem, paint_cfg
+			)
+		finally:
+			self._release(name, success, time.monotonic() - start)
+		return success
+
+	def warm_up(self) -> bool:
+		"""
+		Warms every endpoint at once, before the run's clock starts.
+		Returns True if at least one endpoint is ready.
+		"""
+		with ThreadPoolExecutor(max_workers=len(self.artists)) as pool:
+			results: dict[str, bool] = dict(
+				zip(self.artists, pool.map(Artist.warm_up, self.artists.values()))
+			)
+
+		for name, ready in results.items():
+			if not ready:
+				print(f"⚠️ Endpoint {name} failed to warm up.")
+		return any(results.values())
+
+	def report(self) -> str:
+		"""Per-endpoint summary: jobs, failures and throughput of the run."""
+		with self._lock:
+			wall_hours: float = 0.0
+			if self._started_at is not None:
+				wall_hours = (time.monotonic() - self._started_at) / 3600
+
+			lines: list[str] = ["Artist pool report:"]
+			for name, st in self.stats.items():
+				per_hour = st.succeeded / wall_hours if wall_hours else 0.0
+				avg_job = st.busy_seconds / max(st.succeeded + st.failed, 1)
+				lines.append(
+					f"  {name}: {st.succeeded} ok, {st.failed} failed, "
+					f"{per_hour:.1f} jobs/hour, {avg_job:.1f}s per job"
+					+ (" (drained)" if st.drained else "")
+				)
+		return "\n".join(lines)
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Any
 
@@ -15,3 +16,25 @@ class Artist(ABC):
 		paint_cfg: Per-image settings (aspect_ratio, style, etc.)
 		Returns True if image generation was successful, else False"""
 		pass
+
+	def warm_up(self) -> bool:
+		"""
+		Loads the model with a tiny render, so the first job doesn't pay
+		for it. Artists without a model to load do nothing.
+		Returns False if the warm-up failed.
+		"""
+		return True
+
+	def report(self) -> str | None:
+		"""Summary of the artist's requests for the end of a run, if it has one."""
+		return None
+
+	async def apaint(
+		self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+	) -> bool:
+		"""
+		Async variant of paint.
+		By default the blocking call runs in a worker thread, artists with a
+		native async client should override it.
+		"""
+		return await asyncio.to_thread(self.paint, prompt, image_name_stem, paint_cfg)
@@ -0,0 +1,377 @@
+"""
+End-to-end load benchmark: main.run_pipeline against the local stand-ins
+of benchmarks.fake_servers, without any GPU.
+
+A temporary workspace (wildcards, niche prompts and configs) is generated,
+the settings are pointed at it and at the fakes through the environment,
+and the run reports jobs/hour, latency percentiles of the brain and
+artist calls, and the peak memory of the benchmark process (the fakes run
+in a separate one). With the same arguments, runs are repeatable: the
+fakes and the wildcards are seeded.
+
+Run from the project root:
+	python -m benchmarks.bench_load
+	python -m benchmarks.bench_load --images 10 --artist-latency 0.5 \\
+		--engine asyncio --json load.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from benchmarks.fake_servers import FakeBehaviour, FakeServersProcess, FakeSetup
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+WILDCARDS: dict[str, list[str]] = {
+	"color": ["amber", "teal", "crimson", "ivory", "2::golden"],
+	"subject": ["a lighthouse", "an old tram", "a fox", "__color__ tulips"],
+	"place": ["in fog", "at dusk", "by the sea", "in a __color__ room"],
+}
+RAW_PROMPT = "__subject__ __place__, __color__ palette"
+
+
+def peak_rss_mb() -> float | None:
+	"""Peak resident memory of this process, None where it isn't known."""
+	try:
+		import resource
+	except ImportError:
+		return None
+	peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# bytes on macOS, kilobytes on linux
+	return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def make_workspace(root: Path, n_niches: int, n_prompts: int, image_px: int) -> None:
+	"""Writes the prompts, wildcards and configs of the benchmark run."""
+	(root / "wildcards").mkdir()
+	for name, lines in WILDCARDS.items():
+		(root / "wildcards" / f"{name}.txt").write_text("\n".join(lines))
+
+	(root / "niche_configs").mkdir()
+	config: dict[str, Any] = {
+		"seed": -1,
+		"N_images": 1,
+		"performance": "Speed",
+		"image_size": f"{image_px}*{image_px}",
+		"aspect_ratio": "1:1",
+		"styles": [],
+		"negative_prompt": "blurry",
+		"guidance_scale": 4.0,
+		"output_folder": str(root / "images"),
+		"image_extension": "png",
+	}
+	(root / "niche_configs" / "default.json").write_text(json.dumps(config))
+
+	(root / "meta_prompts").mkdir()
+	for n in range(1, n_niches + 1):
+		niche_dir: Path = root / "wildcard_prompts" / f"niche_{n}"
+		niche_dir.mkdir(parents=True)
+		for p in range(1, n_prompts + 1):
+			(niche_dir / f"prompt_{p}.txt").write_text(RAW_PROMPT)
+		meta_prompt: str = (
+			PROJECT_ROOT / "prompts" / "instructions" / "json_instruction.txt"
+		).read_text(encoding="utf-8")
+		(root / "meta_prompts" / f"niche_{n}.txt").write_text(meta_prompt)
+
+
+def configure(args: argparse.Namespace, root: Path, urls: dict[str, str]) -> None:
+	"""Points the settings at the workspace and the fakes."""
+	env: dict[str, str] = {
+		"ACTIVE_BRAIN": args.brain,
+		"ACTIVE_ARTIST": args.artist,
+		"ACTIVE_PIPELINE": args.pipeline,
+		"WILDCARD_SEED": str(args.seed),
+		"WARM_UP": "false",
+		"CSV_PATH": str(root / "metadata"),
+		"LOG_PATH": str(root / "log"),
+		"WILDCARDS_PATH": str(root / "wildcards"),
+		"WILDCARD_PROMPTS_PATH": str(root / "wildcard_prompts"),
+		"META_PROMPTS_PATH": str(root / "meta_prompts"),
+		"NICHE_CONFIGS_PATH": str(root / "niche_configs"),
+		"INSTRUCTION_PATH": str(PROJECT_ROOT / "prompts" / "instructions"),
+		"OLLAMA__URL": urls["ollama"],
+		"OLLAMA__MODEL": "fake",
+		"FOOOCUS__URL": urls["fooocus"],
+		"FOOOCUS__TRANSFER_MODE": args.transfer_mode,
+		"FOOOCUS__ASYNC_JOBS": str(args.async_jobs).lower(),
+		"FOOOCUS__POLL_INTERVAL": "0.05",
+		"HTTP__GENAI_BASE_URL": urls["genai"],
+		"GEMINI_API_KEY": "fake",
+		"BANANA__API_KEY": "fake",
+		"ENGINE__MODE": args.engine,
+		"ENGINE__BRAIN_WORKERS": str(args.brain_workers),
+		"ENGINE__ARTIST_WORKERS": str(args.artist_workers),
+		"ENGINE__BRAIN_BATCH_SIZE": str(args.batch_size),
+	}
+	os.environ.update(env)
+
+
+@dataclass
+class StageTimes:
+	"""Durations of the brain and artist calls, from any worker."""
+
+	seconds: dict[str, list[float]] = field(default_factory=dict)
+	failures: dict[str, int] = field(default_factory=dict)
+	lock: threading.Lock = field(default_factory=threading.Lock)
+
+	def add(self, stage: str, seconds: float, ok: bool) -> None:
+		with self.lock:
+			self.seconds.setdefault(stage, []).append(seconds)
+			self.failures.setdefault(stage, 0)
+			if not ok:
+				self.failures[stage] += 1
+
+	def percentiles(self) -> dict[str, dict[str, float]]:
+		result: dict[str, dict[str, float]] = {}
+		for stage, values in self.seconds.items():
+			cuts: list[float] = (
+				statistics.quantiles(values, n=100, method="inclusive")
+				if len(values) > 1
+				else values * 99
+			)
+			result[stage] = {
+				"n": len(values),
+				"failed": self.failures[stage],
+				"p50": cuts[49],
+				"p90": cuts[89],
+				"p99": cuts[98],
+				"max": max(values),
+			}
+		return result
+
+
+def timed_workers(times: StageTimes) -> tuple[Any, Any]:
+	"""The run's brain and artist, wrapped so every call is timed."""
+	import main
+	from artists.base_artist import Artist
+	from brains.base_brain import Brain
+	from core.models import ImageIdea
+
+	brain, artist = main.get_workers()
+
+	def timed[R](stage: str, call: Callable[[], R], ok: Callable[[R], bool]) -> R:
+		start: float = time.perf_counter()
+		result: R = call()
+		times.add(stage, time.perf_counter() - start, ok(result))
+		return result
+
+	async def atimed[R](
+		stage: str, call: Callable[[], Awaitable[R]], ok: Callable[[R], bool]
+	) -> R:
+		start: float = time.perf_counter()
+		result: R = await call()
+		times.add(stage, time.perf_counter() - start, ok(result))
+		return result
+
+	class TimedBrain(Brain):
+		def __init__(self) -> None:
+			super().__init__({})
+			self.stats = brain.stats
+
+		def get_response(self, meta_prompt: str, prefix: str = "") -> ImageIdea | None:
+			return timed(
+				"brain",
+				lambda: brain.get_response(meta_prompt, prefix),
+				lambda idea: idea is not None,
+			)
+
+		def get_responses(
+			self, meta_prompt: str, n: int, prefix: str = ""
+		) -> list[ImageIdea | None]:
+			return timed(
+				"brain",
+				lambda: brain.get_responses(meta_prompt, n, prefix),
+				any,
+			)
+
+		async def aget_response(
+			self, meta_prompt: str, prefix: str = ""
+		) -> ImageIdea | None:
+			return await atimed(
+				"brain",
+				lambda: brain.aget_response(meta_prompt, prefix),
+				lambda idea: idea is not None,
+			)
+
+		async def aget_responses(
+			self, meta_prompt: str, n: int, prefix: str = ""
+		) -> list[ImageIdea | None]:
+			return await atimed(
+				"brain",
+				lambda: brain.aget_responses(meta_prompt, n, prefix),
+				any,
+			)
+
+		def report(self) -> str | None:
+			return brain.report()
+
+	class TimedArtist(Artist):
+		def paint(
+			self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+		) -> bool:
+			return timed(
+				"artist",
+				lambda: artist.paint(prompt, image_name_stem, paint_cfg),
+				bool,
+			)
+
+		async def apaint(
+			self, prompt: str, image_name_stem: str, paint_cfg: dict[str, Any]
+		) -> bool:
+			return await atimed(
+				"artist",
+				lambda: artist.apaint(prompt, image_name_stem, paint_cfg),
+				bool,
+			)
+
+		def report(self) -> str | None:
+			return artist.report()
+
+	return TimedBrain(), TimedArtist({})
+
+
+@dataclass
+class LoadResult:
+	jobs: int
+	images: int
+	seconds: float
+	jobs_per_hour: float
+	peak_rss_mb: float | None
+	stages: dict[str, dict[str, float]]
+	requests: dict[str, dict[str, int]]
+
+
+def run(args: argparse.Namespace) -> LoadResult:
+	setup = FakeSetup(
+		ollama=FakeBehaviour(
+			latency=args.brain_latency,
+			error_rate=args.error_rate,
+			token_latency=args.token_latency,
+			seed=args.seed,
+		),
+		fooocus=FakeBehaviour(
+			latency=args.artist_latency,
+			error_rate=args.error_rate,
+			image_px=args.image_px,
+			seed=args.seed + 1,
+		),
+		genai=FakeBehaviour(
+			latency=args.brain_latency,
+			error_rate=args.error_rate,
+			image_px=args.image_px,
+			seed=args.seed + 2,
+		),
+	)
+	if args.artist == "banana":
+		# the genai fake paints for banana, with the artist's latency
+		setup.genai.latency = args.artist_latency
+
+	with tempfile.TemporaryDirectory(prefix="bench_load_") as workspace:
+		root = Path(workspace)
+		make_workspace(root, args.niches, args.prompts, args.image_px)
+		fakes = FakeServersProcess(setup)
+		with fakes as urls:
+			configure(args, root, urls)
+
+			import main
+			from core.csv_manager import AdobeCsvManager
+			from logging_system.prompt_logger import PromptLogManager
+			from settings import settings
+
+			settings.ensure_paths()
+			times = StageTimes()
+			brain, artist = timed_workers(times)
+			csv_manager = AdobeCsvManager(filepath=settings.csv_path / "metadata.csv")
+			prompt_log = PromptLogManager(filepath=settings.log_path / "log.csv")
+
+			start: float = time.perf_counter()
+			try:
+				main.run_pipeline(brain, artist, csv_manager, prompt_log, args.images)
+			finally:
+				csv_manager.close()
+				prompt_log.close()
+			seconds: float = time.perf_counter() - start
+			print(f"🧠 {brain.report()}")
+
+		images: int = sum(1 for _ in (root / "images").glob("*.png"))
+
+	n_jobs: int = args.niches * args.prompts * args.images
+	if args.pipeline == "meta":
+		n_jobs = args.niches * args.images
+	return LoadResult(
+		jobs=n_jobs,
+		images=images,
+		seconds=seconds,
+		jobs_per_hour=images / seconds * 3600 if seconds else 0.0,
+		peak_rss_mb=peak_rss_mb(),
+		stages=times.percentiles(),
+		requests=fakes.requests,
+	)
+
+
+def print_result(result: LoadResult) -> None:
+	rss: str = "n/a" if result.peak_rss_mb is None else f"{result.peak_rss_mb:.0f} MB"
+	print(
+		f"{result.images}/{result.jobs} jobs in {result.seconds:.1f}s: "
+		f"{result.jobs_per_hour:.0f} jobs/hour, peak RSS {rss}"
+	)
+	print("  stage    calls  failed     p50      p90      p99      max")
+	for stage, p in result.stages.items():
+		print(
+			f"  {stage:<7} {p['n']:6.0f} {p['failed']:7.0f} "
+			f"{p['p50']:7.3f}s {p['p90']:7.3f}s {p['p99']:7.3f}s {p['max']:7.3f}s"
+		)
+	for name, counts in result.requests.items():
+		if counts:
+			print(f"  {name} requests: {counts}")
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(
+		description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+	)
+	parser.add_argument("--pipeline", choices=("wildcard", "meta"), default="wildcard")
+	parser.add_argument("--brain", choices=("ollama", "gemini"), default="ollama")
+	parser.add_argument("--artist", choices=("fooocus", "banana"), default="fooocus")
+	parser.add_argument("--engine", choices=("threaded", "asyncio"), default="threaded")
+	parser.add_argument("--niches", type=int, default=2)
+	parser.add_argument("--prompts", type=int, default=2, help="per niche")
+	parser.add_argument("--images", type=int, default=5, help="per prompt (niche)")
+	parser.add_argument("--brain-workers", type=int, default=1)
+	parser.add_argument("--artist-workers", type=int, default=1)
+	parser.add_argument("--batch-size", type=int, default=1)
+	parser.add_argument("--brain-latency", type=float, default=0.2, help="seconds")
+	parser.add_argument("--token-latency", type=float, default=0.002, help="seconds")
+	parser.add_argument("--artist-latency", type=float, default=0.5, help="seconds")
+	parser.add_argument("--error-rate", type=float, default=0.0)
+	parser.add_argument("--image-px", type=int, default=256)
+	parser.add_argument(
+		"--transfer-mode", choices=("base64", "download"), default="base64"
+	)
+	parser.add_argument("--async-jobs", action="store_true", help="Fooocus queue")
+	parser.add_argument("--seed", type=int, default=1234)
+	parser.add_argument("--json", type=Path, help="also write the results here")
+	args = parser.parse_args()
+
+	result: LoadResult = run(args)
+	print_result(result)
+	if args.json is not None:
+		report: dict[str, Any] = {"arguments": vars(args) | {"json": None}}
+		report |= asdict(result)
+		args.json.write_text(json.dumps(report, indent=2, default=str))
+		print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,263 @@
+"""
+Microbenchmarks of the pure python code every job runs, compared against
+stored baselines: a case slower than its baseline by more than --threshold
+(a ratio) fails the run (exit code 1).
+
+Baselines depend on the machine, so store them where the numbers are
+compared (e.g. the CI runner), and refresh them with --save when a change
+is meant to move them. Cases whose modules can't be imported (a missing
+dependency) are skipped and keep their baseline.
+
+Run from the project root:
+	python -m benchmarks.bench_micro
+	python -m benchmarks.bench_micro --filter resolve --threshold 1.1
+	python -m benchmarks.bench_micro --save
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from benchmarks.bench_wildcards import build_wildcards
+
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baselines" / "micro.json"
+
+# the settings the cases load need these, no request is ever sent
+REQUIRED_ENV: dict[str, str] = {
+	"BANANA__API_KEY": "fake",
+	"FOOOCUS__URL": "http://127.0.0.1:8888",
+}
+
+type Setup = Callable[[Path], Callable[[], object]]
+
+
+@dataclass(frozen=True)
+class Case:
+	name: str
+	# prepares the data in a temporary directory, returns the timed call
+	setup: Setup
+	# calls per round
+	number: int
+
+
+def resolve_nested(tmp: Path) -> Callable[[], object]:
+	from prompts.wildcard_manager import WildcardResolver
+
+	raw_prompt: str = build_wildcards(tmp, n_lines=20, depth=15)
+	resolver = WildcardResolver(tmp, seed=0)
+	return lambda: resolver.resolve(raw_prompt)
+
+
+def resolve_large_files(tmp: Path) -> Callable[[], object]:
+	from prompts.wildcard_manager import WildcardResolver
+
+	raw_prompt: str = build_wildcards(tmp, n_lines=200_000, depth=3)
+	# every file is above the threshold, so they are all memory-mapped
+	resolver = WildcardResolver(tmp, seed=0, mmap_threshold=1 << 16)
+	return lambda: resolver.resolve(raw_prompt)
+
+
+def idea_from_llm_json(tmp: Path) -> Callable[[], object]:
+	from core.mappers import IdeaMapper
+
+	raw_data: dict[str, Any] = {
+		"prompt": ' "a lighthouse at dusk, teal palette, volumetric fog" ',
+		"title": '"Lighthouse at Dusk"',
+		"keywords": ["lighthouse", "dusk", "fog", "sea", "teal", "coast"] * 5,
+		"category": "11",
+	}
+	return lambda: IdeaMapper.from_llm_json(raw_data)
+
+
+def save_10k_metadata_rows(tmp: Path) -> Callable[[], object]:
+	from core.csv_manager import AdobeCsvManager
+	from core.models import ImageIdea
+
+	idea = ImageIdea(
+		prompt="a lighthouse at dusk",
+		title="Lighthouse at Dusk",
+		keywords="lighthouse,dusk,fog,sea,teal,coast",
+		category=11,
+	)
+	runs = itertools.count()
+
+	def save_rows() -> None:
+		manager = AdobeCsvManager(filepath=tmp / f"metadata_{next(runs)}.csv")
+		# the progress prints are part of the cost, but not of the output
+		with contextlib.redirect_stdout(io.StringIO()):
+			for i in range(10_000):
+				manager.save_job_metadata(idea, f"image_{i}", 1)
+		manager.close()
+
+	return save_rows
+
+
+def _write_niches(root: Path, n_niches: int, n_prompts: int) -> tuple[Path, Path]:
+	prompts_path: Path = root / "wildcard_prompts"
+	configs_path: Path = root / "niche_configs"
+	configs_path.mkdir()
+	(configs_path / "default.json").write_text(json.dumps({"N_images": 1}))
+	for n in range(n_niches):
+		niche_dir: Path = prompts_path / f"niche_{n}"
+		niche_dir.mkdir(parents=True)
+		(configs_path / f"niche_{n}.json").write_text(json.dumps({"seed": n}))
+		for p in range(n_prompts):
+			(niche_dir / f"prompt_{p}.txt").write_text(
+				f"__subject__ {p} in __place__, __color__ palette, niche {n}"
+			)
+	return prompts_path, configs_path
+
+
+def niches_cold(tmp: Path) -> Callable[[], object]:
+	from prompts.config_manager import ConfigManager
+	from prompts.file_cache import FileCache
+	from prompts.prompt_manager import NicheManager
+
+	prompts_path, configs_path = _write_niches(tmp, n_niches=20, n_prompts=150)
+
+	def read_all() -> object:
+		# a new cache every round, so every file is read and parsed
+		cache = FileCache()
+		config_manager = ConfigManager(configs_path, cache)
+		return list(NicheManager(prompts_path, config_manager, cache).niches())
+
+	return read_all
+
+
+def niches_warm(tmp: Path) -> Callable[[], object]:
+	from prompts.config_manager import ConfigManager
+	from prompts.file_cache import FileCache
+	from prompts.prompt_manager import NicheManager
+
+	prompts_path, configs_path = _write_niches(tmp, n_niches=20, n_prompts=150)
+	cache = FileCache()
+	manager = NicheManager(prompts_path, ConfigManager(configs_path, cache), cache)
+	list(manager.niches())
+	return lambda: list(manager.niches())
+
+
+def real_images_paths(tmp: Path) -> Callable[[], object]:
+	from artists.artist_fooocus import get_real_images_paths
+
+	api_response: list[dict[str, Any]] = [
+		{"url": f"http://127.0.0.1:8888/files/2026-10-18/{i:032x}.png", "seed": "1"}
+		for i in range(4)
+	]
+	return lambda: get_real_images_paths(api_response, tmp)
+
+
+CASES: tuple[Case, ...] = (
+	Case("resolve/nested x15", resolve_nested, 2000),
+	Case("resolve/200k-line mmap files", resolve_large_files, 2000),
+	Case("IdeaMapper.from_llm_json", idea_from_llm_json, 20_000),
+	Case("save_job_metadata x10k rows", save_10k_metadata_rows, 1),
+	Case("NicheManager.niches/3000 files cold", niches_cold, 1),
+	Case("NicheManager.niches/3000 files warm", niches_warm, 5),
+	Case("get_real_images_paths x4", real_images_paths, 20_000),
+)
+
+
+def measure(case: Case, repeat: int) -> float:
+	"""Seconds per call, the best of `repeat` rounds."""
+	with tempfile.TemporaryDirectory(prefix="bench_micro_") as tmp:
+		call: Callable[[], object] = case.setup(Path(tmp))
+		rounds: list[float] = timeit.repeat(call, number=case.number, repeat=repeat)
+	return min(rounds) / case.number
+
+
+def format_seconds(seconds: float) -> str:
+	if seconds >= 1:
+		return f"{seconds:8.2f} s "
+	if seconds >= 1e-3:
+		return f"{seconds * 1e3:8.2f} ms"
+	return f"{seconds * 1e6:8.2f} us"
+
+
+def machine() -> str:
+	return f"{platform.machine()} {platform.python_implementation()} " + (
+		platform.python_version()
+	)
+
+
+def load_baseline(path: Path) -> dict[str, Any]:
+	if not path.exists():
+		return {"machine": machine(), "results": {}}
+	baseline: dict[str, Any] = json.loads(path.read_text(encoding="utf-8"))
+	return baseline
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(
+		description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+	)
+	parser.add_argument("--filter", default="", help="only cases containing this")
+	parser.add_argument("--repeat", type=int, default=5, help="rounds per case")
+	parser.add_argument(
+		"--threshold", type=float, default=1.25, help="slowdown ratio that fails"
+	)
+	parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+	parser.add_argument("--save", action="store_true", help="store as baseline")
+	args = parser.parse_args()
+
+	# without a .env, e.g. on a CI runner
+	for name, value in REQUIRED_ENV.items():
+		os.environ.setdefault(name, value)
+
+	baseline: dict[str, Any] = load_baseline(args.baseline)
+	stored: dict[str, float] = baseline["results"]
+	if stored and baseline.get("machine") != machine():
+		print(f"⚠️ Baseline from {baseline.get('machine')}, this is {machine()}.")
+
+	results: dict[str, float] = {}
+	regressions: list[str] = []
+	print(f"{'case':<38} {'time/call':>11} {'baseline':>11}  ratio")
+	for case in CASES:
+		if args.filter not in case.name:
+			continue
+		try:
+			seconds: float = measure(case, args.repeat)
+		except ImportError as e:
+			print(f"{case.name:<38} skipped ({e})")
+			continue
+		results[case.name] = seconds
+
+		line: str = f"{case.name:<38} {format_seconds(seconds):>11}"
+		if case.name in stored:
+			ratio: float = seconds / stored[case.name]
+			line += f" {format_seconds(stored[case.name]):>11} {ratio:6.2f}"
+			if ratio > args.threshold:
+				regressions.append(case.name)
+				line += " ❌"
+		print(line)
+
+	if args.save:
+		# cases that didn't run keep their stored numbers
+		baseline = {"machine": machine(), "results": stored | results}
+		args.baseline.parent.mkdir(parents=True, exist_ok=True)
+		args.baseline.write_text(json.dumps(baseline, indent=2) + "\n")
+		print(f"Baseline saved to {args.baseline}")
+		return
+
+	if regressions:
+		print(
+			f"❌ {len(regressions)} cases slower than {args.threshold}x "
+			f"their baseline: {', '.join(regressions)}"
+		)
+		sys.exit(1)
+	print("✅ No regression.")
+
+
+if __name__ == "__main__":
+	main()
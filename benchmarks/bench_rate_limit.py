@@ -0,0 +1,182 @@
+"""
+Drives AdaptiveLimiter against a local fake api that has a quota: above
+--quota requests per second it answers 429 with a Retry-After, like the
+Gemini api does once the key's limit is reached.
+
+The same jobs run twice, with the calls sent as fast as the workers can
+(a throttled job is lost, as before the limiter) and through the limiter.
+
+Run from the project root:
+	python -m benchmarks.bench_rate_limit
+	python -m benchmarks.bench_rate_limit --jobs 200 --workers 16 --quota 20
+"""
+
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.rate_limit import AdaptiveLimiter
+
+
+class FakeQuotaServer(ThreadingHTTPServer):
+	"""Answers every request after `latency` seconds, or 429 above the quota."""
+
+	daemon_threads = True
+
+	def __init__(self, quota: float, latency: float, retry_after: int) -> None:
+		super().__init__(("127.0.0.1", 0), QuotaHandler)
+		self.quota = quota
+		self.latency = latency
+		self.retry_after = retry_after
+		self.served: int = 0
+		self.throttled: int = 0
+		self._tokens: float = quota
+		self._refilled_at: float = time.monotonic()
+		self._lock = threading.Lock()
+
+	@property
+	def url(self) -> str:
+		host, port = self.server_address[:2]
+		return f"http://{host!s}:{port}/generate"
+
+	def admit(self) -> bool:
+		"""Takes a token of the server's own bucket (one second of quota)."""
+		with self._lock:
+			now: float = time.monotonic()
+			self._tokens = min(
+				self._tokens + (now - self._refilled_at) * self.quota, self.quota
+			)
+			self._refilled_at = now
+			if self._tokens < 1:
+				self.throttled += 1
+				return False
+			self._tokens -= 1
+			self.served += 1
+			return True
+
+
+class QuotaHandler(BaseHTTPRequestHandler):
+	server: FakeQuotaServer
+
+	def do_POST(self) -> None:
+		self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		if not self.server.admit():
+			self.send_response(429)
+			self.send_header("Retry-After", str(self.server.retry_after))
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+
+		time.sleep(self.server.latency)
+		body = b'{"ok": true}'
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format: str, *args: object) -> None:
+		pass
+
+
+@dataclass
+class RunResult:
+	name: str
+	succeeded: int
+	lost: int
+	seconds: float
+	throttled: int
+
+	def line(self) -> str:
+		per_second = self.succeeded / self.seconds if self.seconds else 0.0
+		return (
+			f"  {self.name:<10} {self.succeeded:5d} ok {self.lost:5d} lost "
+			f"{self.throttled:6d} 429s {self.seconds:7.1f}s {per_second:6.1f} jobs/s"
+		)
+
+
+def post(url: str) -> bytes:
+	request = urllib.request.Request(url, data=b"{}", method="POST")
+	with urllib.request.urlopen(request, timeout=30) as response:
+		body: bytes = response.read()
+		return body
+
+
+def run_jobs(
+	name: str,
+	server: FakeQuotaServer,
+	job: Callable[[], bytes],
+	args: argparse.Namespace,
+) -> RunResult:
+	def attempt(_: int) -> bool:
+		try:
+			job()
+			return True
+		except urllib.error.HTTPError:
+			return False
+
+	throttled_before: int = server.throttled
+	start: float = time.perf_counter()
+	with ThreadPoolExecutor(max_workers=args.workers) as pool:
+		results: list[bool] = list(pool.map(attempt, range(args.jobs)))
+	seconds: float = time.perf_counter() - start
+
+	succeeded: int = sum(results)
+	return RunResult(
+		name,
+		succeeded,
+		len(results) - succeeded,
+		seconds,
+		server.throttled - throttled_before,
+	)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--jobs", type=int, default=120)
+	parser.add_argument("--workers", type=int, default=16)
+	parser.add_argument("--quota", type=float, default=20.0, help="requests/s")
+	parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+	parser.add_argument("--retry-after", type=int, default=1, help="seconds")
+	args = parser.parse_args()
+
+	server = FakeQuotaServer(args.quota, args.latency, args.retry_after)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+
+	# the configured maximum is well above the quota, the limiter has to
+	# find the real rate from the 429s
+	limiter = AdaptiveLimiter(
+		"fake api",
+		requests_per_minute=args.quota * 60 * 4,
+		burst=args.workers,
+		max_concurrency=args.workers,
+		max_retries=10,
+	)
+
+	print(
+		f"{args.jobs} jobs, {args.workers} workers, quota {args.quota:g} req/s, "
+		f"latency {args.latency * 1000:.0f} ms"
+	)
+	try:
+		unlimited = run_jobs("unlimited", server, lambda: post(server.url), args)
+		# let the server's quota refill between the runs
+		time.sleep(1.0)
+		limited = run_jobs(
+			"limiter", server, lambda: limiter.call(lambda: post(server.url)), args
+		)
+	finally:
+		server.shutdown()
+
+	print(unlimited.line())
+	print(limited.line())
+	print(f"  {limiter.report()}")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,137 @@
+"""
+Cold start benchmark: how long `import main` takes, measured with
+`python -X importtime` in fresh interpreters.
+
+It fails (exit code 1) when the import is slower than --max-ms, or when a
+module that should only be loaded on demand (a backend sdk, the logger...)
+is imported by `import main`.
+
+Run from the project root:
+	python -m benchmarks.bench_startup
+	python -m benchmarks.bench_startup --max-ms 400
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# modules `import main` must not load, they are imported when first used
+LAZY_MODULES: tuple[str, ...] = (
+	"google.genai",
+	"httpx",
+	"loguru",
+	"requests",
+	"brains.brain_gemini",
+	"brains.brain_ollama",
+	"artists.artist_banana",
+	"artists.artist_fooocus",
+	"artists.artist_pool",
+	"core.pipeline.async_engine",
+	"core.services",
+)
+
+
+@dataclass
+class ImportProfile:
+	wall_ms: float
+	# cumulative import time of every module, in microseconds
+	cumulative_us: dict[str, int]
+	# time spent in the module itself, in microseconds
+	self_us: dict[str, int]
+
+
+def profile_import(module: str) -> ImportProfile:
+	"""
+	Imports the module in a new interpreter with -X importtime.
+	Raises:
+		RuntimeError: If the import fails.
+	"""
+	command = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+	start = time.perf_counter()
+	result = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True)
+	wall_ms = (time.perf_counter() - start) * 1000
+
+	if result.returncode != 0:
+		errors = [
+			line
+			for line in result.stderr.splitlines()
+			if not line.startswith("import time:")
+		]
+		raise RuntimeError(f"import {module} failed:\n" + "\n".join(errors))
+
+	cumulative_us: dict[str, int] = {}
+	self_us: dict[str, int] = {}
+	for line in result.stderr.splitlines():
+		# import time:  self [us] | cumulative | imported package
+		if not line.startswith("import time:") or "imported package" in line:
+			continue
+		own, cumulative, name = line.removeprefix("import time:").split("|")
+		name = name.strip()
+		self_us[name] = int(own)
+		cumulative_us[name] = int(cumulative)
+
+	return ImportProfile(wall_ms, cumulative_us, self_us)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--module", default="main", help="module to import")
+	parser.add_argument("-n", type=int, default=5, help="fresh interpreters")
+	parser.add_argument(
+		"--max-ms", type=float, default=None, help="fail above this import time"
+	)
+	parser.add_argument("--top", type=int, default=15, help="slowest modules shown")
+	args = parser.parse_args()
+
+	try:
+		baseline = [profile_import("sys") for _ in range(args.n)]
+		profiles = [profile_import(args.module) for _ in range(args.n)]
+	except RuntimeError as e:
+		print(f"❌ {e}")
+		sys.exit(1)
+
+	import_ms: float = statistics.median(
+		p.cumulative_us[args.module] / 1000 for p in profiles
+	)
+	wall_ms: float = statistics.median(p.wall_ms for p in profiles)
+	interpreter_ms: float = statistics.median(p.wall_ms for p in baseline)
+
+	print(f"import {args.module} (median of {args.n} cold starts):")
+	print(f"  import time      {import_ms:8.1f} ms")
+	print(f"  process wall     {wall_ms:8.1f} ms")
+	print(f"  bare interpreter {interpreter_ms:8.1f} ms")
+
+	last = profiles[-1]
+	print(f"slowest modules (self time, top {args.top}):")
+	slowest = sorted(last.self_us.items(), key=lambda item: item[1], reverse=True)
+	for name, own in slowest[: args.top]:
+		print(f"  {own / 1000:8.1f} ms  {name}")
+
+	failed: bool = False
+	eager: list[str] = [
+		name
+		for name in last.cumulative_us
+		if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)
+	]
+	if eager:
+		failed = True
+		print(f"❌ Imported eagerly: {', '.join(sorted(eager))}")
+
+	if args.max_ms is not None and import_ms > args.max_ms:
+		failed = True
+		print(f"❌ import {args.module} took {import_ms:.1f} ms > {args.max_ms} ms")
+
+	if failed:
+		sys.exit(1)
+	print("✅ Startup within limits.")
+
+
+if __name__ == "__main__":
+	main()
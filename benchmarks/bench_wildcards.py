@@ -0,0 +1,101 @@
+"""
+Microbenchmarks of WildcardResolver.resolve: compiled templates against the
+previous implementation (repeated regex passes over the whole string).
+
+Run from the project root:
+	python -m benchmarks.bench_wildcards
+"""
+
+import argparse
+import random
+import re
+import tempfile
+import timeit
+from pathlib import Path
+
+from prompts.wildcard_manager import WildcardResolver
+
+
+class RegexWildcardResolver(WildcardResolver):
+	"""The resolver as it was before templates: up to 20 re.sub passes."""
+
+	def _replacer(self, match: re.Match[str]) -> str:
+		wildcard_name = match.group(1)
+		if wildcard_name in self._wildcards:
+			return random.choice(self._wildcards[wildcard_name])
+		return ""
+
+	def resolve(self, raw_prompt: str, rng: random.Random | None = None) -> str:
+		resolved_prompt: str = raw_prompt
+
+		for _ in range(20):  # recursion limit
+			if "__" not in resolved_prompt:
+				break
+
+			previous_prompt = resolved_prompt
+			resolved_prompt = re.sub(r"__(.*?)__", self._replacer, resolved_prompt)
+
+			if previous_prompt == resolved_prompt:
+				break
+
+		return resolved_prompt
+
+
+def build_wildcards(root: Path, n_lines: int, depth: int) -> str:
+	"""
+	Writes a wildcard tree `depth` levels deep (level_0 uses level_1, ...),
+	plus a few flat files, and returns a raw prompt that uses all of them.
+	"""
+	for level in range(depth):
+		lines: list[str] = []
+		for i in range(n_lines):
+			if level + 1 < depth:
+				lines.append(f"variant {i} of level {level}, __level_{level + 1}__")
+			else:
+				lines.append(f"leaf {i}")
+		(root / f"level_{level}.txt").write_text("\n".join(lines), encoding="utf-8")
+
+	for name in ("color", "light", "style"):
+		lines = [f"{name} {i}" for i in range(n_lines)]
+		(root / f"{name}.txt").write_text("\n".join(lines), encoding="utf-8")
+
+	return (
+		"smooth gradient background, __color__ to __color__ transition, "
+		"__light__, __style__, __level_0__, professional, 8k uhd"
+	)
+
+
+def bench(name: str, resolver: WildcardResolver, raw_prompt: str, n: int) -> float:
+	seconds = min(
+		timeit.repeat(lambda: resolver.resolve(raw_prompt), number=n, repeat=5)
+	)
+	per_call_us = seconds / n * 1e6
+	print(f"  {name:<10} {per_call_us:9.2f} us/resolve")
+	return per_call_us
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("-n", type=int, default=2000, help="resolves per round")
+	args = parser.parse_args()
+
+	cases: list[tuple[str, int, int]] = [
+		("flat, small files", 20, 1),
+		("nested x5", 20, 5),
+		("nested x10", 20, 10),
+		("nested x5, 100k lines", 100_000, 5),
+	]
+
+	for title, n_lines, depth in cases:
+		with tempfile.TemporaryDirectory() as tmp:
+			raw_prompt = build_wildcards(Path(tmp), n_lines, depth)
+			print(f"{title}:")
+			regex = bench("regex", RegexWildcardResolver(Path(tmp)), raw_prompt, args.n)
+			compiled = bench(
+				"compiled", WildcardResolver(Path(tmp)), raw_prompt, args.n
+			)
+			print(f"  speedup    {regex / compiled:9.2f}x")
+
+
+if __name__ == "__main__":
+	main()
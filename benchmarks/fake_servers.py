@@ -0,0 +1,500 @@
+"""
+Local stand-ins for the backends, speaking just enough of their protocols
+for the brains and artists of this project:
+
+- Ollama: POST /api/generate, streamed (ndjson) or not, json ideas that
+  follow the requested schema (one idea or an {"ideas": [...]} batch).
+- Fooocus-API: POST /v1/generation/text-to-image (sync, base64 or async),
+  GET /v1/generation/query-job and GET /files/... for the images.
+- GenAI: POST /v1beta/models/<model>:generateContent (text ideas, or an
+  inline image when an image config is sent) and POST /v1beta/cachedContents.
+
+Every server has a configurable latency (with jitter) and error rate, and
+answers with synthetic images. They can run in a separate process
+(FakeServersProcess), so they don't count in the memory of the benchmark.
+
+Run alone to try a client against them:
+	python -m benchmarks.fake_servers
+"""
+
+import argparse
+import base64
+import json
+import multiprocessing
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.connection import Connection
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+
+WORDS: tuple[str, ...] = (
+	"amber", "harbor", "lantern", "misty", "forest", "neon", "quiet", "river",
+	"copper", "garden", "velvet", "desert", "glass", "orchid", "storm", "marble",
+)  # fmt: skip
+
+
+@dataclass
+class FakeBehaviour:
+	"""How a fake server answers."""
+
+	# seconds before the answer (the render time of Fooocus, the time to
+	# first token of Ollama), +- jitter (a fraction of it)
+	latency: float = 0.5
+	jitter: float = 0.2
+	# fraction of the requests that fail (500, 429 for genai)
+	error_rate: float = 0.0
+	# ollama: seconds per streamed token
+	token_latency: float = 0.002
+	# side of the square synthetic images, in pixels
+	image_px: int = 256
+	seed: int = 0
+
+
+def synthetic_png(size: int, rng: random.Random) -> bytes:
+	"""A size x size png of rgb noise, which doesn't compress (like a photo)."""
+
+	def chunk(kind: bytes, data: bytes) -> bytes:
+		checksum: int = zlib.crc32(kind + data) & 0xFFFFFFFF
+		return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", checksum)
+
+	rows = b"".join(b"\x00" + rng.randbytes(size * 3) for _ in range(size))
+	header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+	return (
+		b"\x89PNG\r\n\x1a\n"
+		+ chunk(b"IHDR", header)
+		+ chunk(b"IDAT", zlib.compress(rows, 1))
+		+ chunk(b"IEND", b"")
+	)
+
+
+class FakeServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(
+		self, handler: type[BaseHTTPRequestHandler], behaviour: FakeBehaviour
+	) -> None:
+		super().__init__(("127.0.0.1", 0), handler)
+		self.behaviour = behaviour
+		self.requests: Counter[str] = Counter()
+		self._rng = random.Random(behaviour.seed)
+		self._lock = threading.Lock()
+		self.image: bytes = synthetic_png(behaviour.image_px, self._rng)
+
+	@property
+	def url(self) -> str:
+		host, port = self.server_address[:2]
+		return f"http://{host!s}:{port}"
+
+	def delay(self) -> float:
+		b = self.behaviour
+		with self._lock:
+			return max(b.latency * (1 + self._rng.uniform(-b.jitter, b.jitter)), 0)
+
+	def fails(self) -> bool:
+		with self._lock:
+			return self._rng.random() < self.behaviour.error_rate
+
+	def count(self, name: str) -> None:
+		with self._lock:
+			self.requests[name] += 1
+
+	def idea(self) -> dict[str, Any]:
+		with self._lock:
+			words: list[str] = self._rng.sample(WORDS, 6)
+			category: int = self._rng.randint(1, 21)
+		return {
+			"prompt": f"a {' '.join(words)} scene, soft light, highly detailed",
+			"title": " ".join(words[:3]).title(),
+			"keywords": ", ".join(words),
+			"category": category,
+		}
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+	server: FakeServer
+	protocol_version = "HTTP/1.1"
+
+	def read_json(self) -> Any:
+		body: bytes = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		return json.loads(body) if body else {}
+
+	def send_bytes(
+		self,
+		status: int,
+		body: bytes,
+		content_type: str = "application/json",
+		headers: dict[str, str] | None = None,
+	) -> None:
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		for name, value in (headers or {}).items():
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def send_json(
+		self, status: int, data: Any, headers: dict[str, str] | None = None
+	) -> None:
+		self.send_bytes(status, json.dumps(data).encode(), headers=headers)
+
+	def not_found(self) -> None:
+		self.send_json(404, {"error": f"no route {self.path}"})
+
+	def log_message(self, format: str, *args: object) -> None:
+		pass
+
+
+def _batch_size(schema: Any, prompt: str) -> int | None:
+	"""How many ideas are asked for, None for a single idea."""
+	if isinstance(schema, dict):
+		ideas: Any = schema.get("properties", {}).get("ideas")
+		if isinstance(ideas, dict):
+			return int(ideas.get("maxItems", 1))
+	match = re.search(r"Generate (\d+) independent results", prompt)
+	return int(match.group(1)) if match else None
+
+
+class OllamaHandler(FakeHandler):
+	server: "FakeOllamaServer"
+
+	def do_GET(self) -> None:
+		self.server.count("status")
+		self.send_bytes(200, b"Ollama is running", content_type="text/plain")
+
+	def do_POST(self) -> None:
+		if self.path != "/api/generate":
+			self.not_found()
+			return
+		request: dict[str, Any] = self.read_json()
+		self.server.count("generate")
+		time.sleep(self.server.delay())
+		if self.server.fails():
+			self.send_json(500, {"error": "fake failure"})
+			return
+
+		prompt: str = request.get("prompt", "")
+		n: int | None = _batch_size(request.get("format"), prompt)
+		answer: Any = self.server.idea()
+		if n is not None:
+			answer = {"ideas": [self.server.idea() for _ in range(n)]}
+		text: str = json.dumps(answer, indent=1)
+		# like a real model, some whitespace comes after the json
+		tokens: list[str] = [text[i : i + 4] for i in range(0, len(text), 4)]
+		tokens.append("\n\n\n")
+		durations: dict[str, int] = {
+			"prompt_eval_count": self.server.evaluate(prompt) // 4 + 1,
+			"prompt_eval_duration": int(self.server.behaviour.latency * 1e9),
+			"eval_count": len(tokens),
+			"eval_duration": int(
+				len(tokens) * self.server.behaviour.token_latency * 1e9
+			),
+		}
+
+		if not request.get("stream", True):
+			time.sleep(len(tokens) * self.server.behaviour.token_latency)
+			self.send_json(
+				200,
+				{"model": request.get("model"), "response": text, "done": True}
+				| durations,
+			)
+			return
+
+		self.send_response(200)
+		self.send_header("Content-Type", "application/x-ndjson")
+		self.send_header("Transfer-Encoding", "chunked")
+		self.end_headers()
+		try:
+			for token in tokens:
+				time.sleep(self.server.behaviour.token_latency)
+				self._write_chunk({"response": token, "done": False})
+			self._write_chunk({"response": "", "done": True} | durations)
+			self.wfile.write(b"0\r\n\r\n")
+		except (BrokenPipeError, ConnectionResetError):
+			# the client stops reading once the json is complete
+			self.close_connection = True
+
+	def _write_chunk(self, data: dict[str, Any]) -> None:
+		line: bytes = json.dumps(data).encode() + b"\n"
+		self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+		self.wfile.flush()
+
+
+class FooocusHandler(FakeHandler):
+	server: "FakeFooocusServer"
+
+	def do_GET(self) -> None:
+		path: str = urlsplit(self.path).path
+		if path == "/docs":
+			self.server.count("docs")
+			self.send_bytes(200, b"<html>fake</html>", content_type="text/html")
+		elif path.startswith("/files/"):
+			self.server.count("download")
+			self.send_bytes(200, self.server.image, content_type="image/png")
+		elif path == "/v1/generation/query-job":
+			self.server.count("query")
+			job_id: str = parse_qs(urlsplit(self.path).query).get("job_id", [""])[0]
+			self.send_json(200, self.server.job_status(job_id))
+		else:
+			self.not_found()
+
+	def do_POST(self) -> None:
+		if self.path != "/v1/generation/text-to-image":
+			self.not_found()
+			return
+		request: dict[str, Any] = self.read_json()
+		self.server.count("text-to-image")
+		n_images: int = int(request.get("image_number", 1))
+		with_base64: bool = bool(request.get("require_base64"))
+
+		if request.get("async_process"):
+			job_id: str = self.server.queue_job(n_images, with_base64)
+			self.send_json(200, {"job_id": job_id, "job_stage": "WAITING"})
+			return
+
+		self.server.render()
+		if self.server.fails():
+			self.send_json(500, {"detail": "fake failure"})
+			return
+		self.send_json(200, self.server.results(n_images, with_base64))
+
+
+class FakeOllamaServer(FakeServer):
+	"""Keeps the last prompt, like the kv cache of a loaded model."""
+
+	def __init__(self, behaviour: FakeBehaviour) -> None:
+		super().__init__(OllamaHandler, behaviour)
+		self._last_prompt: str = ""
+
+	def evaluate(self, prompt: str) -> int:
+		"""Characters of the prompt after the part it shares with the last one."""
+		with self._lock:
+			last, self._last_prompt = self._last_prompt, prompt
+		shared: int = 0
+		for a, b in zip(prompt, last):
+			if a != b:
+				break
+			shared += 1
+		return len(prompt) - shared
+
+
+class FakeFooocusServer(FakeServer):
+	"""Renders one job at a time, like a single GPU."""
+
+	def __init__(self, behaviour: FakeBehaviour) -> None:
+		super().__init__(FooocusHandler, behaviour)
+		self.image_base64: str = base64.b64encode(self.image).decode()
+		self._gpu = threading.Lock()
+		self._jobs: dict[str, dict[str, Any]] = {}
+		self._gpu_free_at: float = 0.0
+
+	def render(self) -> None:
+		"""Holds the gpu for the render time of one job."""
+		with self._gpu:
+			time.sleep(self.delay())
+
+	def results(self, n_images: int, with_base64: bool) -> list[dict[str, Any]]:
+		day: str = time.strftime("%Y-%m-%d")
+		results: list[dict[str, Any]] = []
+		for _ in range(n_images):
+			result: dict[str, Any] = {
+				"url": f"{self.url}/files/{day}/{uuid.uuid4().hex}.png",
+				"seed": "0",
+				"finish_reason": "SUCCESS",
+			}
+			if with_base64:
+				result["base64"] = self.image_base64
+			results.append(result)
+		return results
+
+	def queue_job(self, n_images: int, with_base64: bool) -> str:
+		"""Queues the job after the ones on the gpu, returns its id."""
+		job_id: str = uuid.uuid4().hex
+		with self._lock:
+			start: float = max(time.monotonic(), self._gpu_free_at)
+		done_at: float = start + self.delay()
+		failed: bool = self.fails()
+		with self._lock:
+			self._gpu_free_at = done_at
+			self._jobs[job_id] = {
+				"done_at": done_at,
+				"failed": failed,
+				"n_images": n_images,
+				"base64": with_base64,
+			}
+		return job_id
+
+	def job_status(self, job_id: str) -> dict[str, Any]:
+		with self._lock:
+			job: dict[str, Any] | None = self._jobs.get(job_id)
+		if job is None:
+			return {"job_id": job_id, "job_stage": "ERROR"}
+		if time.monotonic() < job["done_at"]:
+			return {"job_id": job_id, "job_stage": "RUNNING"}
+		with self._lock:
+			self._jobs.pop(job_id, None)
+		if job["failed"]:
+			return {"job_id": job_id, "job_stage": "ERROR"}
+		return {
+			"job_id": job_id,
+			"job_stage": "SUCCESS",
+			"job_result": self.results(job["n_images"], job["base64"]),
+		}
+
+
+class GenAIHandler(FakeHandler):
+	server: "FakeGenAIServer"
+
+	def do_POST(self) -> None:
+		path: str = urlsplit(self.path).path
+		request: dict[str, Any] = self.read_json()
+
+		if path.endswith("/cachedContents"):
+			self.server.count("cache")
+			name: str = f"cachedContents/{uuid.uuid4().hex}"
+			self.server.cached_tokens[name] = len(json.dumps(request)) // 4
+			self.send_json(200, {"name": name, "model": request.get("model")})
+			return
+		if not path.endswith(":generateContent"):
+			self.not_found()
+			return
+
+		self.server.count("generate")
+		time.sleep(self.server.delay())
+		if self.server.fails():
+			error = {"code": 429, "message": "quota", "status": "RESOURCE_EXHAUSTED"}
+			self.send_json(429, {"error": error}, headers={"Retry-After": "1"})
+			return
+
+		config: dict[str, Any] = request.get("generationConfig", {})
+		part: dict[str, Any]
+		if "imageConfig" in config:
+			image: str = self.server.image_base64
+			part = {"inlineData": {"mimeType": "image/png", "data": image}}
+		else:
+			prompt: str = json.dumps(request.get("contents", []))
+			n: int | None = _batch_size(config.get("responseJsonSchema"), prompt)
+			answer: Any = self.server.idea()
+			if n is not None:
+				answer = {"ideas": [self.server.idea() for _ in range(n)]}
+			part = {"text": json.dumps(answer)}
+
+		cached: int = self.server.cached_tokens.get(request.get("cachedContent", ""), 0)
+		prompt_tokens: int = len(json.dumps(request.get("contents", []))) // 4
+		self.send_json(
+			200,
+			{
+				"candidates": [
+					{
+						"content": {"role": "model", "parts": [part]},
+						"finishReason": "STOP",
+						"index": 0,
+					}
+				],
+				"usageMetadata": {
+					"promptTokenCount": prompt_tokens + cached,
+					"cachedContentTokenCount": cached,
+					"candidatesTokenCount": 100,
+					"totalTokenCount": prompt_tokens + cached + 100,
+				},
+			},
+		)
+
+
+class FakeGenAIServer(FakeServer):
+	def __init__(self, behaviour: FakeBehaviour) -> None:
+		super().__init__(GenAIHandler, behaviour)
+		self.image_base64: str = base64.b64encode(self.image).decode()
+		# cached content name -> its size in tokens
+		self.cached_tokens: dict[str, int] = {}
+
+
+@dataclass
+class FakeSetup:
+	"""Behaviour of each fake, as sent to the server process."""
+
+	ollama: FakeBehaviour = field(default_factory=FakeBehaviour)
+	fooocus: FakeBehaviour = field(default_factory=FakeBehaviour)
+	genai: FakeBehaviour = field(default_factory=FakeBehaviour)
+
+
+def start_servers(setup: FakeSetup) -> dict[str, FakeServer]:
+	"""Starts the fakes in threads of this process."""
+	servers: dict[str, FakeServer] = {
+		"ollama": FakeOllamaServer(setup.ollama),
+		"fooocus": FakeFooocusServer(setup.fooocus),
+		"genai": FakeGenAIServer(setup.genai),
+	}
+	for name, server in servers.items():
+		threading.Thread(
+			target=server.serve_forever, name=f"fake-{name}", daemon=True
+		).start()
+	return servers
+
+
+def _serve(setup: dict[str, Any], conn: Connection) -> None:
+	servers = start_servers(
+		FakeSetup(**{name: FakeBehaviour(**b) for name, b in setup.items()})
+	)
+	conn.send({name: server.url for name, server in servers.items()})
+	# any message means stop, the request counts are the answer
+	conn.recv()
+	conn.send({name: dict(server.requests) for name, server in servers.items()})
+	for server in servers.values():
+		server.shutdown()
+
+
+class FakeServersProcess:
+	"""
+	Runs the fakes in a child process:
+		with FakeServersProcess(setup) as urls:
+			... urls["ollama"], urls["fooocus"], urls["genai"]
+	The request counts of every server are in `requests` afterwards.
+	"""
+
+	def __init__(self, setup: FakeSetup) -> None:
+		self.setup = setup
+		self.requests: dict[str, dict[str, int]] = {}
+		self._conn, child_conn = multiprocessing.Pipe()
+		self._process = multiprocessing.Process(
+			target=_serve, args=(asdict(setup), child_conn), daemon=True
+		)
+
+	def __enter__(self) -> dict[str, str]:
+		self._process.start()
+		urls: dict[str, str] = self._conn.recv()
+		return urls
+
+	def __exit__(self, exc_type, exc_val, exc_tb) -> None:  # type: ignore
+		self._conn.send("stop")
+		self.requests = self._conn.recv()
+		self._process.join(timeout=5)
+
+
+def main() -> None:
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--latency", type=float, default=0.5)
+	parser.add_argument("--error-rate", type=float, default=0.0)
+	args = parser.parse_args()
+
+	behaviour = FakeBehaviour(latency=args.latency, error_rate=args.error_rate)
+	servers = start_servers(FakeSetup(behaviour, behaviour, behaviour))
+	for name, server in servers.items():
+		print(f"{name}: {server.url}")
+	try:
+		threading.Event().wait()
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
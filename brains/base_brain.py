@@ -1,10 +1,43 @@
+import asyncio
 from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable
 from typing import Any
+from brains.stats import BrainStats
+from core.mappers import IdeaMapper, load_llm_json
 from core.models import ImageIdea
 
+
+BATCH_INSTRUCTION = """
+
+[BATCH_MODE]
+Generate {n} independent results instead of one.
+If several ideas are given (idea_1, idea_2, ...), result number i must be based on idea_i.
+Output ONLY a raw JSON object of this form, without markdown or any other text:
+{{"ideas": [<result 1>, <result 2>, ..., <result {n}>]}}
+where every result is a JSON object with exactly the structure described above."""
+
+
+REPAIR_INSTRUCTION = """
+
+[REPAIR]
+Your previous answer could not be used: {error}
+Previous answer:
+{answer}
+Answer again with ONLY the raw JSON described above, nothing else."""
+
+
 class Brain(ABC):
+	def __init__(self, config: dict[str, Any]) -> None:
+		"""
+		config["max_repairs"]: How many extra llm calls may be spent to fix
+			an answer that can't be used, before the idea is given up.
+		"""
+		self.config = config
+		self.max_repairs: int = config.get("max_repairs", 1)
+		self.stats = BrainStats(type(self).__name__)
+
 	@abstractmethod
-	def get_response(self, meta_prompt: str) -> ImageIdea | None:
+	def get_response(self, meta_prompt: str, prefix: str = "") -> ImageIdea | None:
 		"""
 		Takes a meta prompt, which ideally has clear instructions for
 		the llm to output a json like this:
@@ -17,10 +50,160 @@ class Brain(ABC):
 		}
 		Then the class returns the ImageIdea object based on this json.
 
+		prefix: The start of meta_prompt that is the same for many calls (e.g.
+			the llm instruction). Brains with prompt caching process it once.
+
 		returns None in case of failiure
 		"""
 		pass
 
+	async def aget_response(
+		self, meta_prompt: str, prefix: str = ""
+	) -> ImageIdea | None:
+		"""
+		Async variant of get_response.
+		By default the blocking call runs in a worker thread, brains with a
+		native async client should override it.
+		"""
+		return await asyncio.to_thread(self.get_response, meta_prompt, prefix)
+
+	def warm_up(self) -> bool:
+		"""
+		Loads the model with a tiny generation, so the first job doesn't pay
+		for it. Brains without a model to load do nothing.
+		Returns False if the warm-up failed.
+		"""
+		return True
+
+	def report(self) -> str | None:
+		"""Summary of the brain's requests for the end of a run."""
+		return self.stats.summary()
+
+	def close(self) -> None:
+		"""
+		Releases what the brain holds on its server at the end of a run
+		(e.g. cached contents). Brains without such state do nothing.
+		"""
+
+	def idea_from_answer(self, answer: str) -> ImageIdea:
+		"""
+		Raises:
+			ValueError: If the answer has no usable idea.
+		"""
+		content: Any = load_llm_json(answer)
+		if not isinstance(content, dict) or not self.validate_json(content):
+			raise ValueError("JSON missing required keys!")
+		try:
+			return IdeaMapper.from_llm_json(content)
+		except (TypeError, AttributeError) as e:
+			raise ValueError(f"Bad JSON values: {e}") from e
+
+	@staticmethod
+	def ideas_from_answer(answer: str) -> list[ImageIdea | None]:
+		"""
+		The ideas in the order of the answer, None where one is unusable.
+
+		Raises:
+			ValueError: If the answer has no usable idea at all.
+		"""
+		ideas: list[ImageIdea | None] = IdeaMapper.from_llm_json_batch(
+			load_llm_json(answer)
+		)
+		if not any(ideas):
+			raise ValueError("No usable idea in the batch!")
+		return ideas
+
+	def _repair_prompt(self, prompt: str, answer: str, error: Exception) -> str:
+		self.stats.count("repairs")
+		print(f"{self.stats.name}: unusable answer ({error}), asking again.")
+		# a runaway answer is cut, the model only needs to see what went wrong
+		return prompt + REPAIR_INSTRUCTION.format(error=error, answer=answer[:2000])
+
+	def generate_with_repair[R](
+		self,
+		prompt: str,
+		generate: Callable[[str], str],
+		parse: Callable[[str], R],
+	) -> R | None:
+		"""
+		Asks the llm (generate) and parses its answer. An unusable answer is
+		sent back with the error, at most max_repairs times.
+		Errors of generate itself (network...) are raised as they are.
+		"""
+		current_prompt: str = prompt
+		for attempt in range(self.max_repairs + 1):
+			self.stats.count("calls")
+			answer: str = generate(current_prompt)
+			try:
+				result: R = parse(answer)
+			except ValueError as e:
+				if attempt == self.max_repairs:
+					print(f"{self.stats.name}: unusable answer ({e}), giving up.")
+					break
+				current_prompt = self._repair_prompt(prompt, answer, e)
+				continue
+
+			if attempt:
+				self.stats.count("repaired")
+			return result
+
+		self.stats.count("failures")
+		return None
+
+	async def agenerate_with_repair[R](
+		self,
+		prompt: str,
+		generate: Callable[[str], Awaitable[str]],
+		parse: Callable[[str], R],
+	) -> R | None:
+		"""Async variant of generate_with_repair."""
+		current_prompt: str = prompt
+		for attempt in range(self.max_repairs + 1):
+			self.stats.count("calls")
+			answer: str = await generate(current_prompt)
+			try:
+				result: R = parse(answer)
+			except ValueError as e:
+				if attempt == self.max_repairs:
+					print(f"{self.stats.name}: unusable answer ({e}), giving up.")
+					break
+				current_prompt = self._repair_prompt(prompt, answer, e)
+				continue
+
+			if attempt:
+				self.stats.count("repaired")
+			return result
+
+		self.stats.count("failures")
+		return None
+
+	def get_responses(
+		self, meta_prompt: str, n: int, prefix: str = ""
+	) -> list[ImageIdea | None]:
+		"""
+		Brainstorms up to n ideas for the meta prompt.
+		Brains that support it ask for all of them in one single llm call
+		(see batch_prompt), the default falls back to n separate calls.
+
+		Idea i is at index i (it was asked for idea_i of the prompt), failed
+		ideas are None. The result is shorter than n if the llm answered
+		fewer ideas, and empty if the call failed.
+		"""
+		return [self.get_response(meta_prompt, prefix) for _ in range(n)]
+
+	async def aget_responses(
+		self, meta_prompt: str, n: int, prefix: str = ""
+	) -> list[ImageIdea | None]:
+		"""
+		Async variant of get_responses.
+		"""
+		return await asyncio.to_thread(self.get_responses, meta_prompt, n, prefix)
+
+	@staticmethod
+	def batch_prompt(meta_prompt: str, n: int) -> str:
+		"""Appends the instructions to answer with a json array of n ideas."""
+		return meta_prompt + BATCH_INSTRUCTION.format(n=n)
+
 	def validate_json(self, output: dict[str, Any]) -> bool:
 		"""
 		Checks if the output is really a valid json with desired keys.
@@ -1,64 +1,265 @@
-import json
+import asyncio
+import threading
+import time
 from typing import Any
-from google import genai
 from google.genai.types import (
+	CreateCachedContentConfig,
 	GenerateContentResponse,
 	GenerateContentConfig,
 	ThinkingConfig,
+	UpdateCachedContentConfig,
 )
 from brains.base_brain import Brain
+from brains.stats import BrainStats
 from core.models import ImageIdea
-from core.mappers import IdeaMapper
+from core.mappers import IDEA_JSON_SCHEMA, batch_json_schema
+from core.rate_limit import AdaptiveLimiter
+from core.transport import get_genai_client
 
 
 class GeminiBrain(Brain):
+	# seconds before a prefix that couldn't be cached is tried again,
+	# doubled after each failure up to the cache ttl
+	CACHE_RETRY_DELAY = 30.0
+
 	def __init__(self, config: dict[str, Any]) -> None:
+		super().__init__(config)
 		self.model = config["model"]
-		self.client = genai.Client()
+		self.client = get_genai_client()
+		self.stats = BrainStats(f"Gemini {self.model}")
+		self.limiter = AdaptiveLimiter("Gemini", **config.get("rate_limit", {}))
 
-	def get_response(self, prompt: str) -> ImageIdea | None:
-		try:
-			response: GenerateContentResponse | None = (
-				self.client.models.generate_content(
-					model=self.model,
-					contents=prompt,
-					config=GenerateContentConfig(
-						thinking_config=ThinkingConfig(thinking_budget=0)
-					),
+		# put the prompt prefixes (the instruction) in cached contents
+		self.cache_prefix: bool = config.get("cache_prefix", True)
+		self.cache_ttl: int = config.get("cache_ttl", 3600)
+		# prefix -> (cached content name or None if it couldn't be cached,
+		# when to renew it or to try again)
+		self._caches: dict[str, tuple[str | None, float]] = {}
+		# prefix -> failed cache creations in a row
+		self._cache_failures: dict[str, int] = {}
+		self._cache_lock = threading.Lock()
+
+	def _generate_config(
+		self, schema: dict[str, Any], cached_content: str | None = None
+	) -> GenerateContentConfig:
+		return GenerateContentConfig(
+			thinking_config=ThinkingConfig(thinking_budget=0),
+			response_mime_type="application/json",
+			response_json_schema=schema,
+			cached_content=cached_content,
+		)
+
+	def _cached_content(self, prefix: str) -> str | None:
+		"""
+		Name of the cached content holding the prefix, created on first use
+		and renewed shortly before it expires.
+		None if the prefix couldn't be cached (e.g. it's below the minimum
+		size of the model, or the api failed), then it is just sent with every
+		prompt until the next try.
+		"""
+		entry = self._caches.get(prefix)
+		if entry is not None and time.monotonic() < entry[1]:
+			return entry[0]
+
+		with self._cache_lock:
+			entry = self._caches.get(prefix)
+			if entry is not None and time.monotonic() < entry[1]:
+				return entry[0]
+
+			name: str | None = None
+			if entry is not None and entry[0] is not None:
+				name = self._renew_cache(entry[0])
+			if name is None:
+				name = self._create_cache(prefix)
+
+			if name is None:
+				failures: int = self._cache_failures.get(prefix, 0)
+				self._cache_failures[prefix] = failures + 1
+				delay: float = min(
+					self.CACHE_RETRY_DELAY * 2**failures, float(self.cache_ttl)
 				)
+			else:
+				self._cache_failures.pop(prefix, None)
+				# renewed a minute before it expires, so no call uses a dead cache
+				delay = max(self.cache_ttl - 60, 0)
+			self._caches[prefix] = (name, time.monotonic() + delay)
+			return name
+
+	def _create_cache(self, prefix: str) -> str | None:
+		try:
+			cache = self.client.caches.create(
+				model=self.model,
+				config=CreateCachedContentConfig(
+					contents=[prefix], ttl=f"{self.cache_ttl}s"
+				),
 			)
 		except Exception as e:
-			print(f"Gemini Error: {e}")
+			print(f"Gemini: prompt prefix not cached ({e}), sending it in full.")
+			return None
+		print(f"Gemini: prompt prefix cached as {cache.name}.")
+		return cache.name
+
+	def _renew_cache(self, name: str) -> str | None:
+		"""Extends the ttl of a cached content, None if that failed."""
+		try:
+			self.client.caches.update(
+				name=name, config=UpdateCachedContentConfig(ttl=f"{self.cache_ttl}s")
+			)
+		except Exception as e:
+			print(f"Gemini: cached content {name} not renewed ({e}).")
 			return None
+		return name
 
+	def close(self) -> None:
+		"""Deletes the cached contents of the run, instead of waiting for their ttl."""
+		with self._cache_lock:
+			names: list[str] = [name for name, _ in self._caches.values() if name]
+			self._caches.clear()
+		for name in names:
+			try:
+				self.client.caches.delete(name=name)
+			except Exception as e:
+				print(f"Gemini: cached content {name} not deleted ({e}).")
+
+	def _split_prompt(self, prompt: str, prefix: str) -> tuple[str, str | None]:
+		"""The contents to send, and the cached content holding the prefix."""
+		if not (self.cache_prefix and prefix and prompt.startswith(prefix)):
+			return prompt, None
+		cached_content: str | None = self._cached_content(prefix)
+		if cached_content is None:
+			return prompt, None
+		return prompt[len(prefix) :], cached_content
+
+	def _record_usage(
+		self, response: GenerateContentResponse | None, prefix: str
+	) -> None:
+		"""
+		Counts the prompt tokens served from a cache. Besides the explicit
+		caches, gemini caches repeated prompt prefixes implicitly.
+		"""
+		if response is None or response.usage_metadata is None:
+			return
+		usage = response.usage_metadata
+		cached_tokens: int = usage.cached_content_token_count or 0
+		self.stats.count("prompt_tokens", usage.prompt_token_count or 0)
+		self.stats.count("cached_tokens", cached_tokens)
+		if prefix:
+			self.stats.count("cache_lookups")
+			if cached_tokens:
+				self.stats.count("cache_hits")
+
+	@staticmethod
+	def _text(response: GenerateContentResponse | None) -> str:
+		"""
+		Raises:
+			ValueError: If the response has no text (e.g. it was blocked).
+		"""
 		if response is None:
-			print("Gemini Error: No response!")
+			raise ValueError("No response!")
+		text: str | None = response.text
+		if not isinstance(text, str):
+			raise ValueError("No proper response!")
+		return text
+
+	def _generate_text(
+		self, prompt: str, schema: dict[str, Any], prefix: str = ""
+	) -> str:
+		contents, cached_content = self._split_prompt(prompt, prefix)
+		response: GenerateContentResponse | None = self.limiter.call(
+			lambda: self.client.models.generate_content(
+				model=self.model,
+				contents=contents,
+				config=self._generate_config(schema, cached_content),
+			)
+		)
+		self._record_usage(response, prefix)
+		return self._text(response)
+
+	async def _agenerate_text(
+		self, prompt: str, schema: dict[str, Any], prefix: str = ""
+	) -> str:
+		# creating the cache blocks, so it doesn't run on the event loop
+		contents, cached_content = await asyncio.to_thread(
+			self._split_prompt, prompt, prefix
+		)
+		response: GenerateContentResponse | None = await self.limiter.acall(
+			lambda: self.client.aio.models.generate_content(
+				model=self.model,
+				contents=contents,
+				config=self._generate_config(schema, cached_content),
+			)
+		)
+		self._record_usage(response, prefix)
+		return self._text(response)
+
+	def report(self) -> str:
+		return f"{self.stats.summary()}; {self.limiter.report()}"
+
+	def get_response(self, prompt: str, prefix: str = "") -> ImageIdea | None:
+		try:
+			return self.generate_with_repair(
+				prompt,
+				lambda p: self._generate_text(p, IDEA_JSON_SCHEMA, prefix),
+				self.idea_from_answer,
+			)
+		except Exception as e:
+			print(f"Gemini Error: {e}")
+			self.stats.count("failures")
 			return None
 
+	async def aget_response(self, prompt: str, prefix: str = "") -> ImageIdea | None:
 		try:
-			json_str = response.text
-			if not isinstance(json_str, str):
-				raise ValueError
-		except ValueError:
-			print("Gemini Error: No proper response!")
+			return await self.agenerate_with_repair(
+				prompt,
+				lambda p: self._agenerate_text(p, IDEA_JSON_SCHEMA, prefix),
+				self.idea_from_answer,
+			)
+		except Exception as e:
+			print(f"Gemini Error: {e}")
+			self.stats.count("failures")
 			return None
 
-		# since sometimes the json string output from gemini could start
-		# with ```json, we should clean it up first
-		clean_json_s: str = json_str.removeprefix("```json").removesuffix("```")
+	def get_responses(
+		self, prompt: str, n: int, prefix: str = ""
+	) -> list[ImageIdea | None]:
+		schema: dict[str, Any] = batch_json_schema(n)
+		try:
+			ideas: list[ImageIdea | None] | None = self.generate_with_repair(
+				self.batch_prompt(prompt, n),
+				lambda p: self._generate_text(p, schema, prefix),
+				self.ideas_from_answer,
+			)
+		except Exception as e:
+			print(f"Gemini Error: {e}")
+			self.stats.count("failures")
+			return []
+
+		return self._first_ideas(ideas, n)
 
+	async def aget_responses(
+		self, prompt: str, n: int, prefix: str = ""
+	) -> list[ImageIdea | None]:
+		schema: dict[str, Any] = batch_json_schema(n)
 		try:
-			content: dict[str, Any] = json.loads(clean_json_s)
-		except json.JSONDecodeError as e:
-			print(f"Gemini Error: json error: {e}")
-			return None
+			ideas: list[ImageIdea | None] | None = await self.agenerate_with_repair(
+				self.batch_prompt(prompt, n),
+				lambda p: self._agenerate_text(p, schema, prefix),
+				self.ideas_from_answer,
+			)
+		except Exception as e:
+			print(f"Gemini Error: {e}")
+			self.stats.count("failures")
+			return []
 
-		if self.validate_json(content):
-			try:
-				return IdeaMapper.from_llm_json(content)
-			except Exception as e:
-				print(f"Error while mapping the json output to ImageIdea!\n{e}")
-				return None
+		return self._first_ideas(ideas, n)
 
-		print("Gemini Error: JSON missing required keys!")
-		return None
+	@staticmethod
+	def _first_ideas(
+		ideas: list[ImageIdea | None] | None, n: int
+	) -> list[ImageIdea | None]:
+		if ideas is None:
+			return []
+		n_usable: int = sum(idea is not None for idea in ideas[:n])
+		if n_usable < n:
+			print(f"Gemini: only {n_usable} of {n} ideas were usable.")
+		return ideas[:n]
@@ -1,48 +1,215 @@
 import json
+import time
 from typing import Any
 import requests
 from brains.base_brain import Brain
+from brains.stats import BrainStats, GenerationTiming
+from core.json_stream import JsonObjectScanner
+from core.transport import get_session
 from core.models import ImageIdea
-from core.mappers import IdeaMapper
+from core.mappers import IDEA_JSON_SCHEMA, batch_json_schema
 
 
 class OllamaBrain(Brain):
 	def __init__(self, config: dict[str, Any]) -> None:
+		super().__init__(config)
 		self.model = config["model"]
 		self.url = config["url"] + "/api/generate"
+		self.keep_alive: str = config.get("keep_alive", "30m")
+		# stream the tokens and stop as soon as the json object is complete
+		self.stream: bool = config.get("stream", True)
+		# constrain the output to the idea json schema instead of any json
+		self.structured_output: bool = config.get("structured_output", True)
+		self.stats = BrainStats(f"Ollama {self.model}")
+		# most prompt tokens per character evaluated so far, which is the rate
+		# of a prompt evaluated in full, see _track_prefix
+		self._token_rate: float = 0.0
 
-	def get_response(self, meta_prompt: str) -> ImageIdea | None:
+	def _track_prefix(
+		self, prompt: str, prefix: str, prompt_eval_count: int | None
+	) -> None:
+		"""
+		While the model stays loaded (keep_alive), ollama keeps the kv state
+		of the last prompts and only evaluates what follows the longest
+		cached prefix, prompt_eval_count is the number of tokens it did
+		evaluate. A call counts as a cache hit when that is less than the
+		prompt minus half its prefix, at the rate of a full evaluation.
+		Until a full evaluation was seen (e.g. the model kept the prefix from
+		an earlier run) hits are counted as misses.
+		"""
+		if not prefix or not prompt.startswith(prefix) or not prompt_eval_count:
+			return
+		self.stats.count("cache_lookups")
+		self._token_rate = max(self._token_rate, prompt_eval_count / len(prompt))
+		if prompt_eval_count < self._token_rate * (len(prompt) - len(prefix) / 2):
+			self.stats.count("cache_hits")
+
+	def _generate_text(
+		self, prompt: str, schema: dict[str, Any], prefix: str = ""
+	) -> str:
+		"""
+		Sends the prompt to ollama and returns the text of its json answer.
+		Raises requests errors as they are.
+		"""
 		payload = {
 			"model": self.model,
-			"prompt": meta_prompt,
-			"stream": False,
-			"format": "json",
+			"prompt": prompt,
+			"stream": self.stream,
+			"format": schema if self.structured_output else "json",
 			"options": {"temperature": 0.8},
+			"keep_alive": self.keep_alive,
 		}
 
-		try:
-			response = requests.post(self.url, json=payload)
+		if self.stream:
+			# the count only comes in the last chunk, the prompt is evaluated
+			# by then, reading on only costs the trailing tokens
+			text, prompt_eval_count = self._stream_json(
+				payload, read_to_end=bool(prefix)
+			)
+			self._track_prefix(prompt, prefix, prompt_eval_count)
+			return text
+
+		response = get_session().post(self.url, json=payload)
+		response.raise_for_status()
+		data: dict[str, Any] = response.json()
+
+		# ollama reports its own durations, in nanoseconds
+		ttft_ns: int = data.get("load_duration", 0)
+		ttft_ns += data.get("prompt_eval_duration", 0)
+		self.stats.record_timing(
+			GenerationTiming(
+				ttft=ttft_ns / 1e9, decode_seconds=data.get("eval_duration", 0) / 1e9
+			)
+		)
+
+		self._track_prefix(prompt, prefix, data.get("prompt_eval_count"))
+		answer: str = data.get("response", "")
+		return answer
+
+	def _stream_json(
+		self, payload: dict[str, Any], read_to_end: bool = False
+	) -> tuple[str, int | None]:
+		"""
+		Streams the answer and returns the text of its json object, and the
+		prompt_eval_count of ollama if the stream got to its last chunk.
+		The connection is closed as soon as the object is complete, which
+		makes ollama stop generating (e.g. trailing whitespace), unless
+		read_to_end is set.
+		"""
+		scanner = JsonObjectScanner(accept=_is_answer)
+		sent_at: float = time.monotonic()
+		first_token_at: float | None = None
+		answered_at: float | None = None
+		stopped_early: bool = False
+		prompt_eval_count: int | None = None
+
+		with get_session().post(self.url, json=payload, stream=True) as response:
 			response.raise_for_status()
+			for line in response.iter_lines():
+				if not line:
+					continue
+				chunk: dict[str, Any] = json.loads(line)
+				if "error" in chunk:
+					raise ValueError(chunk["error"])
 
-			raw_json = response.json().get("response")
-			content: dict[str, Any] = json.loads(raw_json)
+				token: str = chunk.get("response", "")
+				if token and first_token_at is None:
+					first_token_at = time.monotonic()
 
-			if self.validate_json(content):
-				try:
-					return IdeaMapper.from_llm_json(content)
-				except Exception as e:
-					print(f"Error while mapping the json output to ImageIdea!\n{e}")
-					return None
+				done: bool = chunk.get("done", False)
+				if answered_at is None and scanner.feed(token) is not None:
+					answered_at = time.monotonic()
+					if not (read_to_end or done):
+						stopped_early = True
+						break
+				if done:
+					prompt_eval_count = chunk.get("prompt_eval_count")
+					break
 
-			print("❌OLLAMA: JSON missing required keys!")
+		finished_at: float = answered_at or time.monotonic()
+		if first_token_at is None:
+			first_token_at = finished_at
+		self.stats.record_timing(
+			GenerationTiming(
+				ttft=first_token_at - sent_at,
+				decode_seconds=finished_at - first_token_at,
+				stopped_early=stopped_early,
+			)
+		)
+		return scanner.text, prompt_eval_count
 
+	def warm_up(self) -> bool:
+		payload = {
+			"model": self.model,
+			"prompt": "Hi",
+			"stream": False,
+			"options": {"num_predict": 1},
+			"keep_alive": self.keep_alive,
+		}
+		try:
+			response = get_session().post(self.url, json=payload)
+			response.raise_for_status()
+			return True
 		except requests.exceptions.RequestException as e:
-			print(f"OLLAMA: requests error: {e}")
+			print(f"OLLAMA: warm-up failed: {e}")
+			return False
 
-		except json.JSONDecodeError as e:
-			print(f"OLLAMA: json error: {e}")
+	def get_response(self, meta_prompt: str, prefix: str = "") -> ImageIdea | None:
+		try:
+			return self.generate_with_repair(
+				meta_prompt,
+				lambda prompt: self._generate_text(prompt, IDEA_JSON_SCHEMA, prefix),
+				self.idea_from_answer,
+			)
+
+		except requests.exceptions.RequestException as e:
+			print(f"OLLAMA: requests error: {e}")
 
 		except Exception as e:
 			print(f"OLLAMA Error: {e}")
 
+		self.stats.count("failures")
 		return None
+
+	def get_responses(
+		self, meta_prompt: str, n: int, prefix: str = ""
+	) -> list[ImageIdea | None]:
+		schema: dict[str, Any] = batch_json_schema(n)
+		try:
+			ideas: list[ImageIdea | None] | None = self.generate_with_repair(
+				self.batch_prompt(meta_prompt, n),
+				lambda prompt: self._generate_text(prompt, schema, prefix),
+				self.ideas_from_answer,
+			)
+			if ideas is None:
+				return []
+
+			n_usable: int = sum(idea is not None for idea in ideas[:n])
+			if n_usable < n:
+				print(f"OLLAMA: only {n_usable} of {n} ideas were usable.")
+			return ideas[:n]
+
+		except requests.exceptions.RequestException as e:
+			print(f"OLLAMA: requests error: {e}")
+
+		except Exception as e:
+			print(f"OLLAMA Error: {e}")
+
+		self.stats.count("failures")
+		return []
+
+
+def _is_answer(text: str) -> bool:
+	"""
+	Whether a streamed object can be the answer: an idea with every required
+	key or a batch of ideas. Text that isn't valid json is accepted, the
+	lenient parsing and the repair loop deal with it.
+	"""
+	try:
+		value: Any = json.loads(text)
+	except ValueError:
+		return True
+	if not isinstance(value, dict):
+		return True
+	required: list[str] = IDEA_JSON_SCHEMA["required"]
+	return "ideas" in value or all(key in value for key in required)
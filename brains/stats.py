@@ -0,0 +1,71 @@
+import statistics
+import threading
+from collections import Counter
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class GenerationTiming:
+	"""Timing of one llm request."""
+
+	# from sending the request to the first token
+	ttft: float
+	# from the first token to the last one used
+	decode_seconds: float
+	# the generation was cancelled once the json was complete
+	stopped_early: bool = False
+
+
+class BrainStats:
+	"""
+	Per-brain request timings and counters, safe to update from several
+	workers. Counters: "calls" (llm calls), "repairs" (calls spent to fix an
+	unusable answer), "repaired" (answers fixed that way), "failures"
+	(ideas given up on), "cache_lookups"/"cache_hits" (calls with a prompt
+	prefix, and those whose prefix came from a cache) and "prompt_tokens"/
+	"cached_tokens" (when the backend reports them).
+	"""
+
+	def __init__(self, name: str) -> None:
+		self.name = name
+		self.timings: list[GenerationTiming] = []
+		self.counts: Counter[str] = Counter()
+		self._lock = threading.Lock()
+
+	def count(self, name: str, n: int = 1) -> None:
+		with self._lock:
+			self.counts[name] += n
+
+	def record_timing(self, timing: GenerationTiming) -> None:
+		with self._lock:
+			self.timings.append(timing)
+
+	def summary(self) -> str:
+		with self._lock:
+			timings: list[GenerationTiming] = list(self.timings)
+			counts: Counter[str] = self.counts.copy()
+
+		summary: str = (
+			f"{self.name}: {counts['calls']} calls, "
+			f"{counts['repairs']} repair retries ({counts['repaired']} repaired), "
+			f"{counts['failures']} failures"
+		)
+		if counts["cache_lookups"]:
+			summary += (
+				f", prompt prefix cached for {counts['cache_hits']} of "
+				f"{counts['cache_lookups']} calls"
+			)
+		if counts["prompt_tokens"]:
+			summary += (
+				f" ({counts['cached_tokens']} of {counts['prompt_tokens']} "
+				"prompt tokens)"
+			)
+		if timings:
+			n_early: int = sum(timing.stopped_early for timing in timings)
+			ttft: float = statistics.median(timing.ttft for timing in timings)
+			decode: float = statistics.median(t.decode_seconds for t in timings)
+			summary += (
+				f", median ttft {ttft:.2f}s, median decode {decode:.2f}s, "
+				f"{n_early} stopped early"
+			)
+		return summary
@@ -1,5 +1,6 @@
 import csv
 from pathlib import Path
+from core.csv_writer import BufferedCsvWriter
 from core.models import ImageIdea
 from settings import settings
 
@@ -9,6 +10,8 @@ class AdobeCsvManager:
 		self.filepath = filepath
 		self._ensure_path()
 		self._ensure_header()
+		# one writer thread, since artist workers save records concurrently
+		self._writer = BufferedCsvWriter(filepath, **settings.csv_sink.model_dump())
 
 	def _ensure_path(self) -> None:
 		"""Creates the directory if it doesn't exist."""
@@ -30,17 +33,23 @@ class AdobeCsvManager:
 
 		# TODO: limit keywords to 49 maximum, also remove unnecessary spaces
 
-		with open(self.filepath, mode="a", newline="", encoding="utf-8") as file:
-			writer = csv.writer(file, delimiter=",")
-			writer.writerow(
-				[
-					final_filename,
-					image_idea.title,
-					image_idea.keywords,
-					image_idea.category,
-					"",  # empty for releases column
-				]
-			)
+		self._writer.write(
+			[
+				final_filename,
+				image_idea.title,
+				image_idea.keywords,
+				image_idea.category,
+				"",  # empty for releases column
+			]
+		)
+
+	def flush(self) -> None:
+		"""Blocks until the records saved so far are on disk."""
+		self._writer.flush()
+
+	def close(self) -> None:
+		"""Writes the pending records to disk and stops the writer."""
+		self._writer.close()
 
 	def save_job_metadata(
 		self,
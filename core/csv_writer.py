@@ -0,0 +1,160 @@
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from core.metrics import metrics
+
+
+class _FlushRequest:
+	"""Queue marker, set once every row queued before it is written."""
+
+	def __init__(self) -> None:
+		self.done = threading.Event()
+
+
+_CLOSE = object()
+
+# seconds between checks that the writer thread is still alive
+_FLUSH_CHECK_INTERVAL = 1.0
+
+
+class BufferedCsvWriter:
+	"""
+	Single writer thread that appends rows to a csv file.
+
+	Rows are queued by any number of threads and written in batches by one
+	thread that keeps the file open, so appends never interleave and the file
+	isn't reopened for every row.
+	A batch is written when `batch_size` rows are pending or the oldest one
+	waited `flush_interval` seconds, and the file is fsynced at most every
+	`fsync_interval` seconds. Everything is flushed on close (and at exit).
+
+	Rows queued less than `flush_interval` seconds before a hard crash
+	may be lost, unless `flush` returned after they were queued.
+	"""
+
+	def __init__(
+		self,
+		filepath: Path,
+		batch_size: int = 64,
+		flush_interval: float = 1.0,
+		fsync_interval: float = 5.0,
+		delimiter: str = ",",
+	) -> None:
+		self.filepath = filepath
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.fsync_interval = fsync_interval
+		self.delimiter = delimiter
+
+		self._queue: queue.Queue[Any] = queue.Queue()
+		self._closed = False
+		# why the writer thread died, the rows queued since are not written
+		self._error: BaseException | None = None
+		self._thread = threading.Thread(
+			target=self._run, name=f"csv-writer-{filepath.name}", daemon=True
+		)
+		self._thread.start()
+		atexit.register(self.close)
+
+	def _check_alive(self) -> None:
+		if not self._thread.is_alive():
+			raise OSError(f"Writer of {self.filepath} died: {self._error}")
+
+	def write(self, row: list[Any]) -> None:
+		"""
+		Queues a row, returns right away.
+
+		Raises:
+			ValueError: If the writer is closed.
+			OSError: If the writer thread died.
+		"""
+		if self._closed:
+			raise ValueError(f"Writer of {self.filepath} is closed!")
+		self._check_alive()
+		self._queue.put(row)
+
+	def flush(self) -> None:
+		"""
+		Blocks until every row queued so far is written and fsynced.
+
+		Raises:
+			OSError: If the writer thread died, the rows may not be written.
+		"""
+		if self._closed:
+			return
+		request = _FlushRequest()
+		self._queue.put(request)
+		while not request.done.wait(_FLUSH_CHECK_INTERVAL):
+			self._check_alive()
+
+	def close(self) -> None:
+		"""Writes the pending rows and stops the writer thread."""
+		if self._closed:
+			return
+		self._closed = True
+		self._queue.put(_CLOSE)
+		self._thread.join()
+
+	def _run(self) -> None:
+		try:
+			self._write_rows()
+		except BaseException as e:
+			self._error = e
+			raise
+
+	def _write_rows(self) -> None:
+		with open(self.filepath, mode="a", newline="", encoding="utf-8") as file:
+			writer = csv.writer(file, delimiter=self.delimiter)
+			pending: list[list[Any]] = []
+			first_pending_at: float = 0.0
+			last_fsync_at: float = time.monotonic()
+
+			def write_pending(force_fsync: bool = False) -> None:
+				nonlocal last_fsync_at
+				now = time.monotonic()
+				fsync: bool = force_fsync or now - last_fsync_at >= self.fsync_interval
+				if not (pending or fsync):
+					return
+
+				# the time the rows really take, save_metadata only queues them
+				with metrics.timer("stage", stage="metadata", sink=self.filepath.stem):
+					if pending:
+						writer.writerows(pending)
+						pending.clear()
+						file.flush()
+					if fsync:
+						os.fsync(file.fileno())
+						last_fsync_at = now
+
+			while True:
+				timeout: float | None = None
+				if pending:
+					waited = time.monotonic() - first_pending_at
+					timeout = max(self.flush_interval - waited, 0.0)
+
+				try:
+					item = self._queue.get(timeout=timeout)
+				except queue.Empty:
+					write_pending()
+					continue
+
+				if item is _CLOSE:
+					write_pending(force_fsync=True)
+					return
+
+				if isinstance(item, _FlushRequest):
+					write_pending(force_fsync=True)
+					item.done.set()
+					continue
+
+				if not pending:
+					first_pending_at = time.monotonic()
+				pending.append(item)
+				if len(pending) >= self.batch_size:
+					write_pending()
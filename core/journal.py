@@ -0,0 +1,211 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from enum import IntEnum
+from pathlib import Path
+
+from core.models import ImageIdea
+
+
+class JobState(IntEnum):
+	"""Progress of a job, every state implies the previous ones."""
+
+	PLANNED = 0
+	IDEA_GENERATED = 1
+	PAINTED = 2
+	METADATA_WRITTEN = 3
+
+
+@dataclass
+class JournalEntry:
+	job_key: str
+	image_name_stem: str
+	state: JobState
+	image_idea: ImageIdea | None
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+	run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+	started_at REAL NOT NULL,
+	finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+	run_id INTEGER NOT NULL REFERENCES runs(run_id),
+	job_key TEXT NOT NULL,
+	image_name_stem TEXT NOT NULL,
+	state INTEGER NOT NULL,
+	image_idea TEXT,
+	updated_at REAL NOT NULL,
+	PRIMARY KEY (run_id, job_key)
+);
+CREATE TABLE IF NOT EXISTS buffered_ideas (
+	idea_id INTEGER PRIMARY KEY AUTOINCREMENT,
+	run_id INTEGER NOT NULL REFERENCES runs(run_id),
+	buffer_key TEXT NOT NULL,
+	image_idea TEXT NOT NULL
+);
+"""
+
+
+class JobJournal:
+	"""
+	Durable record of every job of a run, stored in SQLite.
+
+	Each job is identified by a stable key (e.g. "wildcard/niche/prompt/3")
+	and moves through the JobState states. A resumed run skips the jobs whose
+	metadata was written, reuses the stored idea of the ones that were
+	brainstormed, and keeps their original image names.
+
+	Every update is committed right away, so a crash loses at most the
+	job stage that was running.
+
+	The ideas of a batch brain call that no job took yet are kept too (see
+	IdeaBuffer.attach), so a resumed run doesn't pay for them again.
+	"""
+
+	def __init__(self, db_path: Path, resume: bool = False) -> None:
+		"""
+		db_path: The SQLite file, created if it doesn't exist.
+		resume: Continue the latest unfinished run instead of starting a new one.
+		"""
+		db_path.parent.mkdir(parents=True, exist_ok=True)
+		self.path = db_path
+		# workers of the executors write from several threads
+		self._conn = sqlite3.connect(db_path, check_same_thread=False)
+		self._lock = threading.Lock()
+
+		with self._lock, self._conn:
+			self._conn.execute("PRAGMA journal_mode=WAL")
+			self._conn.execute("PRAGMA synchronous=NORMAL")
+			self._conn.executescript(_SCHEMA)
+
+		self.run_id: int = self._open_run(resume)
+
+	def _open_run(self, resume: bool) -> int:
+		with self._lock, self._conn:
+			if resume:
+				row = self._conn.execute(
+					"SELECT run_id FROM runs WHERE finished_at IS NULL "
+					"ORDER BY run_id DESC LIMIT 1"
+				).fetchone()
+				if row is not None:
+					print(f"Resuming run #{row[0]} from {self.path}")
+					return int(row[0])
+				print("Nothing to resume, starting a new run.")
+
+			cursor = self._conn.execute(
+				"INSERT INTO runs (started_at) VALUES (?)", (time.time(),)
+			)
+			assert cursor.lastrowid is not None
+			return cursor.lastrowid
+
+	def plan(self, job_key: str, image_name_stem: str) -> JournalEntry:
+		"""
+		Records a planned job, if it isn't known yet, and returns its entry.
+		For an already known job, the stored entry (and name) wins.
+		"""
+		with self._lock, self._conn:
+			self._conn.execute(
+				"INSERT OR IGNORE INTO jobs "
+				"(run_id, job_key, image_name_stem, state, updated_at) "
+				"VALUES (?, ?, ?, ?, ?)",
+				(self.run_id, job_key, image_name_stem, JobState.PLANNED, time.time()),
+			)
+		entry = self.get(job_key)
+		assert entry is not None
+		return entry
+
+	def get(self, job_key: str) -> JournalEntry | None:
+		with self._lock:
+			row = self._conn.execute(
+				"SELECT image_name_stem, state, image_idea FROM jobs "
+				"WHERE run_id = ? AND job_key = ?",
+				(self.run_id, job_key),
+			).fetchone()
+
+		if row is None:
+			return None
+
+		image_name_stem, state, raw_idea = row
+		image_idea = ImageIdea(**json.loads(raw_idea)) if raw_idea else None
+		return JournalEntry(job_key, image_name_stem, JobState(state), image_idea)
+
+	def _set_state(
+		self, job_key: str, state: JobState, image_idea: ImageIdea | None = None
+	) -> None:
+		raw_idea: str | None = json.dumps(asdict(image_idea)) if image_idea else None
+		with self._lock, self._conn:
+			self._conn.execute(
+				"UPDATE jobs SET state = ?, "
+				"image_idea = COALESCE(?, image_idea), updated_at = ? "
+				"WHERE run_id = ? AND job_key = ?",
+				(state, raw_idea, time.time(), self.run_id, job_key),
+			)
+
+	def record_idea(self, job_key: str, image_idea: ImageIdea) -> None:
+		self._set_state(job_key, JobState.IDEA_GENERATED, image_idea)
+
+	def mark_painted(self, job_key: str) -> None:
+		self._set_state(job_key, JobState.PAINTED)
+
+	def mark_metadata_written(self, job_key: str) -> None:
+		self._set_state(job_key, JobState.METADATA_WRITTEN)
+
+	def buffer_ideas(self, ideas: list[tuple[str, ImageIdea]]) -> list[int]:
+		"""Stores batched ideas by buffer key, returns their ids."""
+		ids: list[int] = []
+		with self._lock, self._conn:
+			for buffer_key, image_idea in ideas:
+				cursor = self._conn.execute(
+					"INSERT INTO buffered_ideas (run_id, buffer_key, image_idea) "
+					"VALUES (?, ?, ?)",
+					(self.run_id, buffer_key, json.dumps(asdict(image_idea))),
+				)
+				assert cursor.lastrowid is not None
+				ids.append(cursor.lastrowid)
+		return ids
+
+	def buffered_ideas(self) -> list[tuple[int, str, ImageIdea]]:
+		"""The stored batched ideas of the run: (id, buffer key, idea)."""
+		with self._lock:
+			rows = self._conn.execute(
+				"SELECT idea_id, buffer_key, image_idea FROM buffered_ideas "
+				"WHERE run_id = ? ORDER BY idea_id",
+				(self.run_id,),
+			).fetchall()
+		return [
+			(idea_id, buffer_key, ImageIdea(**json.loads(raw_idea)))
+			for idea_id, buffer_key, raw_idea in rows
+		]
+
+	def unbuffer_ideas(self, idea_ids: list[int]) -> None:
+		"""Deletes batched ideas that were taken by a job or dropped."""
+		with self._lock, self._conn:
+			self._conn.executemany(
+				"DELETE FROM buffered_ideas WHERE idea_id = ?",
+				[(idea_id,) for idea_id in idea_ids],
+			)
+
+	def counts(self) -> dict[JobState, int]:
+		"""Number of jobs of the current run in every state."""
+		with self._lock:
+			rows = self._conn.execute(
+				"SELECT state, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY state",
+				(self.run_id,),
+			).fetchall()
+		return {JobState(state): count for state, count in rows}
+
+	def finish_run(self) -> None:
+		"""Marks the run as finished, so it is not resumed anymore."""
+		with self._lock, self._conn:
+			self._conn.execute(
+				"UPDATE runs SET finished_at = ? WHERE run_id = ?",
+				(time.time(), self.run_id),
+			)
+
+	def close(self) -> None:
+		with self._lock:
+			self._conn.close()
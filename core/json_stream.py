@@ -0,0 +1,140 @@
+import json
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+
+class JsonObjectScanner:
+	"""
+	Finds the end of the first top-level json object (or array) in text that
+	arrives in pieces, e.g. the tokens of a streamed llm answer.
+
+	Every character is looked at once: the scanner only tracks the nesting
+	depth and whether it is inside a string, it doesn't parse the values.
+	Text before the opening bracket (like a ```json fence) is skipped.
+
+	accept, if given, checks each complete object: a rejected one (e.g. an
+	example the model wrote before its answer) is dropped and the scan goes
+	on with the next object.
+	"""
+
+	def __init__(self, accept: Callable[[str], bool] | None = None) -> None:
+		self.accept = accept
+		# the last complete object that accept rejected
+		self.rejected: str | None = None
+		self._parts: list[str] = []
+		self._depth: int = 0
+		self._started: bool = False
+		self._in_string: bool = False
+		self._escaped: bool = False
+		self.complete: bool = False
+
+	def feed(self, chunk: str) -> str | None:
+		"""
+		Scans the next piece of text.
+		Returns the whole object text once it is complete, else None.
+		"""
+		if self.complete:
+			return None
+
+		start: int = 0
+		for i, char in enumerate(chunk):
+			if not self._started:
+				if char in "{[":
+					self._started = True
+					self._depth = 1
+					start = i
+				continue
+
+			if self._in_string:
+				if self._escaped:
+					self._escaped = False
+				elif char == "\\":
+					self._escaped = True
+				elif char == '"':
+					self._in_string = False
+			elif char == '"':
+				self._in_string = True
+			elif char in "{[":
+				self._depth += 1
+			elif char in "}]":
+				self._depth -= 1
+				if self._depth == 0:
+					self._parts.append(chunk[start : i + 1])
+					text: str = "".join(self._parts)
+					if self.accept is None or self.accept(text):
+						self.complete = True
+						return text
+					self.rejected = text
+					self._parts = []
+					self._started = False
+
+		if self._started:
+			self._parts.append(chunk[start:])
+		return None
+
+	@property
+	def text(self) -> str:
+		"""
+		What was collected so far, from the opening bracket on, or the last
+		rejected object if no other one was completed.
+		"""
+		if not self.complete and self.rejected is not None:
+			return self.rejected
+		return "".join(self._parts)
+
+
+def extract_json_text(text: str) -> str | None:
+	"""The first complete top-level json object or array of the text."""
+	return JsonObjectScanner().feed(text)
+
+
+# characters that can end an array element, the others can't complete one
+_ELEMENT_ENDS = frozenset(",]}")
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+	"""
+	Yields the elements of a top-level json array that arrives in pieces
+	(e.g. a streamed http response) as soon as each one is complete, so only
+	one element at a time is held in memory.
+
+	Raises:
+		ValueError: If the text isn't a json array, or ends in the middle of it.
+	"""
+	decoder = json.JSONDecoder()
+	parts: list[str] = []
+	opened: bool = False
+	for chunk in chunks:
+		parts.append(chunk)
+		# e.g. the long base64 strings of images are not parsed again and again
+		if opened and _ELEMENT_ENDS.isdisjoint(chunk):
+			continue
+
+		text: str = "".join(parts)
+		pos: int = 0
+		while True:
+			while pos < len(text) and text[pos] in " \t\n\r,":
+				pos += 1
+			if pos == len(text):
+				break
+			if not opened:
+				if text[pos] != "[":
+					raise ValueError("Expected a json array!")
+				opened = True
+				pos += 1
+				continue
+			if text[pos] == "]":
+				return
+			try:
+				element, end = decoder.raw_decode(text, pos)
+			except json.JSONDecodeError:
+				# the element is not complete yet
+				break
+			if end == len(text):
+				# a number could go on in the next chunk
+				break
+			yield element
+			pos = end
+		parts = [text[pos:]]
+
+	raise ValueError("The json array is incomplete!")
@@ -1,9 +1,88 @@
+import json
 from typing import Any
+from core.json_stream import extract_json_text
 from core.models import ImageIdea
 
 
 DEFAULT_CATEGORY_NUMBER = 8  # Graphical Resources
 
+# the json an llm must answer with, for backends with constrained output
+IDEA_JSON_SCHEMA: dict[str, Any] = {
+	"type": "object",
+	"properties": {
+		"prompt": {"type": "string"},
+		"title": {"type": "string"},
+		"keywords": {"type": "string"},
+		"category": {"type": "integer"},
+	},
+	"required": ["prompt", "title", "keywords", "category"],
+}
+
+
+def batch_json_schema(n: int) -> dict[str, Any]:
+	"""The schema of a batch answer, {"ideas": [...]} with n ideas."""
+	return {
+		"type": "object",
+		"properties": {
+			"ideas": {
+				"type": "array",
+				"items": IDEA_JSON_SCHEMA,
+				"minItems": n,
+				"maxItems": n,
+			}
+		},
+		"required": ["ideas"],
+	}
+
+
+def _strip_trailing_commas(text: str) -> str:
+	"""Drops the commas right before a closing bracket, outside of strings."""
+	chars: list[str] = []
+	in_string: bool = False
+	escaped: bool = False
+	for i, char in enumerate(text):
+		if in_string:
+			if escaped:
+				escaped = False
+			elif char == "\\":
+				escaped = True
+			elif char == '"':
+				in_string = False
+		elif char == '"':
+			in_string = True
+		elif char == "," and text[i + 1 :].lstrip()[:1] in ("}", "]"):
+			continue
+		chars.append(char)
+	return "".join(chars)
+
+
+def load_llm_json(text: str) -> Any:
+	"""
+	Decodes the json of an llm answer, tolerating what backends without
+	constrained output add around it: markdown fences, text before or after
+	the object, trailing commas.
+	Raises:
+		ValueError: If no json can be recovered.
+	"""
+	try:
+		return json.loads(text)
+	except json.JSONDecodeError:
+		pass
+
+	json_text: str | None = extract_json_text(text)
+	if json_text is None:
+		raise ValueError("No JSON object in the answer.")
+
+	try:
+		return json.loads(json_text)
+	except json.JSONDecodeError:
+		pass
+
+	try:
+		return json.loads(_strip_trailing_commas(json_text))
+	except json.JSONDecodeError as e:
+		raise ValueError(f"Broken JSON: {e}") from e
+
 
 class IdeaMapper:
 	"""
@@ -50,3 +129,31 @@ class IdeaMapper:
 			keywords=keywords,
 			category=category,
 		)
+
+	@staticmethod
+	def from_llm_json_batch(raw_data: Any) -> list[ImageIdea | None]:
+		"""
+		Parses a batch of ideas from an LLM. Accepts a json array, an object
+		like {"ideas": [...]}, or a single idea object.
+		Every element is mapped on its own, invalid ones are None, so one
+		broken idea doesn't cost the whole batch and the others keep their
+		position (idea i was asked for the i-th resolved prompt).
+		"""
+
+		if isinstance(raw_data, dict):
+			raw_data = raw_data.get("ideas", [raw_data])
+
+		if not isinstance(raw_data, list):
+			raise ValueError("Invalid data: expected a list of ideas.")
+
+		ideas: list[ImageIdea | None] = []
+		for element in raw_data:
+			if not isinstance(element, dict):
+				ideas.append(None)
+				continue
+			try:
+				ideas.append(IdeaMapper.from_llm_json(element))
+			except (ValueError, TypeError, AttributeError):
+				ideas.append(None)
+
+		return ideas
@@ -0,0 +1,321 @@
+import bisect
+import json
+import os
+import statistics
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+
+PREFIX = "imagegen"
+
+# histogram buckets of the timers, in seconds
+BUCKETS: tuple[float, ...] = (
+	0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+)  # fmt: skip
+
+type Labels = tuple[tuple[str, str], ...]
+
+# labels of the current thread or task, see Metrics.scope
+_scope_labels: ContextVar[Labels] = ContextVar("metrics_scope_labels", default=())
+
+
+@dataclass(slots=True)
+class _Timer:
+	bucket_counts: list[int] = field(default_factory=lambda: [0] * len(BUCKETS))
+	samples: list[float] = field(default_factory=list)
+	total: float = 0.0
+
+	def observe(self, seconds: float) -> None:
+		# the +Inf bucket is the sample count
+		index: int = bisect.bisect_left(BUCKETS, seconds)
+		if index < len(BUCKETS):
+			self.bucket_counts[index] += 1
+		self.samples.append(seconds)
+		self.total += seconds
+
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+	parts: list[str] = [f'{key}="{_escape(value)}"' for key, value in labels]
+	if extra:
+		parts.append(extra)
+	return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+	"""
+	Timers and counters of a run, labelled e.g. by niche, brain and artist.
+	Safe to update from any worker thread or coroutine.
+
+	The constant labels (set_labels) are added to every series. Timers keep
+	their samples, so the run summary has exact percentiles.
+	"""
+
+	def __init__(self) -> None:
+		self._lock = threading.Lock()
+		self._labels: dict[str, str] = {}
+		self._timers: dict[tuple[str, Labels], _Timer] = {}
+		self._counters: dict[tuple[str, Labels], float] = {}
+		self.started_at: float = time.time()
+
+	def set_labels(self, **labels: str) -> None:
+		"""Labels of every series recorded from now on."""
+		with self._lock:
+			self._labels.update(labels)
+
+	@contextmanager
+	def scope(self, **labels: str) -> Iterator[None]:
+		"""
+		Adds the labels to the series recorded in the block, e.g. the niche to
+		the timers of an artist. Threads and tasks started with a copy of the
+		context (asyncio.to_thread, contextvars.copy_context) get them too.
+		"""
+		token = _scope_labels.set(tuple((dict(_scope_labels.get()) | labels).items()))
+		try:
+			yield
+		finally:
+			_scope_labels.reset(token)
+
+	def _key(self, name: str, labels: dict[str, str]) -> tuple[str, Labels]:
+		merged: dict[str, str] = self._labels | dict(_scope_labels.get()) | labels
+		return name, tuple(sorted(merged.items()))
+
+	def observe(self, name: str, seconds: float, **labels: str) -> None:
+		with self._lock:
+			key = self._key(name, labels)
+			timer: _Timer | None = self._timers.get(key)
+			if timer is None:
+				timer = self._timers[key] = _Timer()
+			timer.observe(seconds)
+
+	@contextmanager
+	def timer(self, name: str, **labels: str) -> Iterator[None]:
+		"""Times the block, also when it raises."""
+		start: float = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.observe(name, time.perf_counter() - start, **labels)
+
+	def count(self, name: str, n: float = 1, **labels: str) -> None:
+		with self._lock:
+			key = self._key(name, labels)
+			self._counters[key] = self._counters.get(key, 0) + n
+
+	def reset(self) -> None:
+		with self._lock:
+			self._timers.clear()
+			self._counters.clear()
+			self.started_at = time.time()
+
+	def prometheus(self) -> str:
+		"""All the series in the prometheus text exposition format."""
+		with self._lock:
+			timers = {
+				key: (list(t.bucket_counts), len(t.samples), t.total)
+				for key, t in self._timers.items()
+			}
+			counters = dict(self._counters)
+
+		lines: list[str] = []
+		typed: set[str] = set()
+		for (name, labels), (bucket_counts, n, total) in sorted(timers.items()):
+			metric: str = f"{PREFIX}_{name}_seconds"
+			if metric not in typed:
+				typed.add(metric)
+				lines.append(f"# TYPE {metric} histogram")
+			cumulative: int = 0
+			for bound, bucket_count in zip(BUCKETS, bucket_counts):
+				cumulative += bucket_count
+				le: str = _format_labels(labels, f'le="{bound}"')
+				lines.append(f"{metric}_bucket{le} {cumulative}")
+			inf: str = _format_labels(labels, 'le="+Inf"')
+			lines.append(f"{metric}_bucket{inf} {n}")
+			lines.append(f"{metric}_sum{_format_labels(labels)} {total}")
+			lines.append(f"{metric}_count{_format_labels(labels)} {n}")
+
+		for (name, labels), value in sorted(counters.items()):
+			metric = f"{PREFIX}_{name}_total"
+			if metric not in typed:
+				typed.add(metric)
+				lines.append(f"# TYPE {metric} counter")
+			lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+		return "\n".join(lines) + "\n"
+
+	def summary(self) -> dict[str, Any]:
+		"""The run as json: every timer with its percentiles, every counter."""
+		with self._lock:
+			timers = {key: list(t.samples) for key, t in self._timers.items()}
+			counters = dict(self._counters)
+			labels = dict(self._labels)
+
+		timer_rows: list[dict[str, Any]] = []
+		for (name, series_labels), samples in sorted(timers.items()):
+			cuts: list[float] = (
+				statistics.quantiles(samples, n=100, method="inclusive")
+				if len(samples) > 1
+				else samples * 99
+			)
+			timer_rows.append(
+				{
+					"name": name,
+					"labels": dict(series_labels),
+					"count": len(samples),
+					"total": sum(samples),
+					"mean": statistics.fmean(samples),
+					"p50": cuts[49],
+					"p90": cuts[89],
+					"p99": cuts[98],
+					"max": max(samples),
+				}
+			)
+		return {
+			"started_at": self.started_at,
+			"seconds": time.time() - self.started_at,
+			"labels": labels,
+			"timers": timer_rows,
+			"counters": [
+				{"name": name, "labels": dict(series_labels), "value": value}
+				for (name, series_labels), value in sorted(counters.items())
+			],
+		}
+
+	def summary_lines(self, by: str = "stage") -> list[str]:
+		"""
+		Where the time went: the timers summed per value of the label `by`
+		(over all other labels), slowest first.
+		"""
+		summary: dict[str, Any] = self.summary()
+		totals: dict[str, list[float]] = {}
+		for row in summary["timers"]:
+			key: str = row["labels"].get(by, row["name"])
+			entry: list[float] = totals.setdefault(key, [0.0, 0, 0.0])
+			entry[0] += row["total"]
+			entry[1] += row["count"]
+			entry[2] = max(entry[2], row["p90"])
+
+		lines: list[str] = []
+		for key, (total, n, p90) in sorted(totals.items(), key=lambda i: -i[1][0]):
+			lines.append(
+				f"{key:<10} {total:9.1f}s in {int(n):6d} calls, "
+				f"mean {total / n:7.3f}s, p90 up to {p90:7.3f}s"
+			)
+		return lines
+
+	def write_summary(self, path: Path) -> None:
+		path.parent.mkdir(parents=True, exist_ok=True)
+		path.write_text(json.dumps(self.summary(), indent=2), encoding="utf-8")
+
+
+# shared by the pipelines, the artists and main
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+	server: "_MetricsServer"
+
+	def do_GET(self) -> None:
+		if self.path == "/metrics":
+			body: bytes = self.server.metrics.prometheus().encode()
+			content_type = "text/plain; version=0.0.4; charset=utf-8"
+		elif self.path == "/summary":
+			body = json.dumps(self.server.metrics.summary()).encode()
+			content_type = "application/json"
+		else:
+			self.send_error(404)
+			return
+		self.send_response(200)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format: str, *args: object) -> None:
+		pass
+
+
+class _MetricsServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def __init__(self, port: int, metrics: Metrics) -> None:
+		super().__init__(("127.0.0.1", port), _MetricsHandler)
+		self.metrics = metrics
+
+
+class MetricsExporter:
+	"""
+	Exposes the metrics while the run goes on: as a prometheus textfile
+	(for the node_exporter textfile collector) rewritten every interval
+	seconds, and/or on http://127.0.0.1:<port>/metrics (and /summary).
+	"""
+
+	def __init__(
+		self,
+		metrics: Metrics,
+		textfile: Path | None = None,
+		port: int | None = None,
+		interval: float = 15.0,
+	) -> None:
+		self.metrics = metrics
+		self.textfile = textfile
+		self.port = port
+		self.interval = interval
+		self._stop = threading.Event()
+		self._writer: threading.Thread | None = None
+		self._server: _MetricsServer | None = None
+
+	def write_textfile(self) -> None:
+		"""Replaces the textfile at once, so it is never read half-written."""
+		if self.textfile is None:
+			return
+		self.textfile.parent.mkdir(parents=True, exist_ok=True)
+		tmp_path: Path = self.textfile.with_name(self.textfile.name + ".tmp")
+		tmp_path.write_text(self.metrics.prometheus(), encoding="utf-8")
+		os.replace(tmp_path, self.textfile)
+
+	def _write_loop(self) -> None:
+		while not self._stop.wait(self.interval):
+			try:
+				self.write_textfile()
+			except OSError as e:
+				print(f"📊 Metrics textfile not written: {e}")
+
+	def start(self) -> None:
+		if self.port is not None:
+			self._server = _MetricsServer(self.port, self.metrics)
+			threading.Thread(
+				target=self._server.serve_forever, name="metrics-http", daemon=True
+			).start()
+			print(f"📊 Metrics on http://127.0.0.1:{self.port}/metrics")
+
+		if self.textfile is not None:
+			self._stop.clear()
+			self._writer = threading.Thread(
+				target=self._write_loop, name="metrics-textfile", daemon=True
+			)
+			self._writer.start()
+
+	def stop(self) -> None:
+		"""Stops the exporters, after a last write of the textfile."""
+		if self._writer is not None:
+			self._stop.set()
+			self._writer.join()
+			self._writer = None
+		try:
+			self.write_textfile()
+		except OSError as e:
+			print(f"📊 Metrics textfile not written: {e}")
+		if self._server is not None:
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
@@ -0,0 +1,119 @@
+import asyncio
+from collections.abc import Iterable
+
+from core import transport
+from core.models import ImageIdea
+from core.pipeline.base import BasePipeline, JobConfig
+from core.pipeline.engine import EngineStats
+from logging_system.logger_config import app_logger
+
+
+class AsyncPipelineRunner[T_JobConfig: JobConfig]:
+	"""
+	Runs pipeline jobs on an asyncio event loop, keeping up to `max_in_flight`
+	jobs running at once. Each backend has its own semaphore, so a slow artist
+	never starves the brain of request slots (and the other way around).
+
+	Best suited for cloud backends (Gemini, Banana), where many requests can
+	be in flight at the same time.
+	"""
+
+	def __init__(
+		self,
+		pipeline: BasePipeline[T_JobConfig],
+		max_in_flight: int = 8,
+		brain_concurrency: int = 4,
+		artist_concurrency: int = 2,
+	) -> None:
+		"""
+		Raises:
+			ValueError: If any of the limits is smaller than 1.
+		"""
+		if min(max_in_flight, brain_concurrency, artist_concurrency) < 1:
+			raise ValueError(
+				"max_in_flight, brain_concurrency and artist_concurrency "
+				"must be at least 1"
+			)
+
+		self.pipeline = pipeline
+		self.max_in_flight = max_in_flight
+		self.brain_concurrency = brain_concurrency
+		self.artist_concurrency = artist_concurrency
+
+		self.stats = EngineStats()
+		# async clients are bound to the loop they were first used on,
+		# so every run reuses the same loop
+		self._loop = asyncio.new_event_loop()
+
+	async def _run_one(
+		self,
+		job: T_JobConfig,
+		brain_semaphore: asyncio.Semaphore,
+		artist_semaphore: asyncio.Semaphore,
+	) -> None:
+		try:
+			async with brain_semaphore:
+				image_idea: ImageIdea | None = await self.pipeline.abrainstorm(job)
+		except Exception as e:
+			app_logger.exception(f"❌ Brainstorm stage crashed: {e}")
+			image_idea = None
+
+		if image_idea is None:
+			self.stats.brainstorm_failures += 1
+			return
+		self.stats.ideas += 1
+
+		try:
+			async with artist_semaphore:
+				success: bool = await self.pipeline.arender(job, image_idea)
+		except Exception as e:
+			app_logger.exception(f"❌ Render stage crashed: {e}")
+			success = False
+
+		if success:
+			self.stats.rendered += 1
+		else:
+			self.stats.render_failures += 1
+
+	async def _run(self, jobs: Iterable[T_JobConfig]) -> None:
+		brain_semaphore = asyncio.Semaphore(self.brain_concurrency)
+		artist_semaphore = asyncio.Semaphore(self.artist_concurrency)
+		in_flight = asyncio.Semaphore(self.max_in_flight)
+		tasks: set[asyncio.Task[None]] = set()
+
+		def release(task: asyncio.Task[None]) -> None:
+			tasks.discard(task)
+			in_flight.release()
+
+		try:
+			for job in jobs:
+				await in_flight.acquire()
+				task = asyncio.create_task(
+					self._run_one(job, brain_semaphore, artist_semaphore)
+				)
+				tasks.add(task)
+				task.add_done_callback(release)
+				self.stats.submitted += 1
+		except BaseException:
+			# the job iterator raised or we were cancelled, don't leave orphan tasks
+			pending = list(tasks)
+			for task in pending:
+				task.cancel()
+			await asyncio.gather(*pending, return_exceptions=True)
+			raise
+
+		if tasks:
+			await asyncio.gather(*tasks)
+
+	def run(self, jobs: Iterable[T_JobConfig]) -> EngineStats:
+		"""
+		Runs all the given jobs and blocks until every one of them is finished.
+		Jobs are pulled lazily from the iterable.
+		"""
+		self._loop.run_until_complete(self._run(jobs))
+		return self.stats
+
+	def close(self) -> None:
+		"""Closes the event loop of the runner, and the async clients bound to it."""
+		self._loop.run_until_complete(transport.aclose())
+		self._loop.close()
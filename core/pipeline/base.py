@@ -1,6 +1,9 @@
+import asyncio
 from abc import ABC, abstractmethod
 from pydantic import BaseModel
 
+from core.models import ImageIdea
+
 
 class JobConfig(BaseModel):
 	"""
@@ -8,19 +11,89 @@ class JobConfig(BaseModel):
 	Pipelines can subclass this to define their own configs.
 	"""
 
-	pass
+	# stable identity of the job across runs, used by the job journal
+	job_key: str = ""
+	# labels the metrics of the job
+	niche: str = ""
 
 
 class BasePipeline[T_JobConfig: JobConfig](ABC):
 	"""
 	Base class for all pipelines.
-	Pipelines should implement the run_job method.
+	A job is split into two stages, so that executors can overlap them:
+	brainstorm (LLM) and render (artist + metadata).
 	"""
 
 	@abstractmethod
+	def brainstorm(self, config: T_JobConfig) -> ImageIdea | None:
+		"""
+		Asks the brain for an image idea for this job.
+		Returns None in case of failure.
+		"""
+		pass
+
+	@abstractmethod
+	def paint(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		"""
+		Asks the artist to paint the idea.
+		Returns True if the image generation was successful.
+		"""
+		pass
+
+	@abstractmethod
+	def save_metadata(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		"""
+		Writes the metadata of the painted images.
+		Returns True if it was written.
+		"""
+		pass
+
+	def flush_metadata(self) -> None:
+		"""
+		Blocks until the metadata written so far is on disk.
+		Pipelines whose metadata sinks buffer rows override it.
+		"""
+		pass
+
+	async def abrainstorm(self, config: T_JobConfig) -> ImageIdea | None:
+		"""
+		Async variant of brainstorm, runs the sync stage in a worker thread
+		unless a pipeline overrides it.
+		"""
+		return await asyncio.to_thread(self.brainstorm, config)
+
+	async def apaint(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		"""
+		Async variant of paint, runs the sync stage in a worker thread
+		unless a pipeline overrides it.
+		"""
+		return await asyncio.to_thread(self.paint, config, image_idea)
+
+	def render(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		"""
+		Paints the idea and writes its metadata.
+		Returns True if the whole stage was successful.
+		"""
+		if not self.paint(config, image_idea):
+			return False
+
+		return self.save_metadata(config, image_idea)
+
+	async def arender(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		"""
+		Async variant of render.
+		"""
+		if not await self.apaint(config, image_idea):
+			return False
+
+		return await asyncio.to_thread(self.save_metadata, config, image_idea)
+
 	def run_job(self, config: T_JobConfig) -> bool:
 		"""
 		Runs the full cycle for one single batch of images.
-		The implementation will be specific to each pipeline.
 		"""
-		pass
+		image_idea: ImageIdea | None = self.brainstorm(config)
+		if image_idea is None:
+			return False
+
+		return self.render(config, image_idea)
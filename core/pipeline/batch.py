@@ -0,0 +1,203 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from collections.abc import Awaitable, Callable, Hashable, Sequence
+from concurrent.futures import Future
+
+from core.journal import JobJournal
+from core.models import ImageIdea
+
+
+# the ideas of a batch call with the key each one was brainstormed for
+type KeyedIdeas = list[tuple[Hashable, ImageIdea]]
+
+# a buffered idea and its id in the journal, if it is journaled
+type _Buffered = tuple[ImageIdea, int | None]
+
+
+def _key_text(key: Hashable) -> str:
+	return json.dumps(key)
+
+
+def _key_from_text(text: str) -> Hashable:
+	"""The key of _key_text, a json array comes back as a tuple."""
+	key: object = json.loads(text)
+	if isinstance(key, list):
+		return tuple(key)
+	assert isinstance(key, Hashable)
+	return key
+
+
+class IdeaBuffer:
+	"""
+	Thread-safe buffer of ideas that were brainstormed in batches but not yet
+	used by a job. Ideas are grouped by a key (e.g. the raw prompt), so a job
+	only takes ideas that were generated for its own prompt.
+
+	At most one batch call per key runs at once: the jobs of a key that find
+	the buffer empty while it runs wait for its ideas instead of paying for
+	a batch of their own.
+
+	A key can also stand for a single job (e.g. a wildcard combination that
+	only one job renders): a call then brainstorms its own key and the
+	candidate keys of the next jobs, skipping those already buffered or
+	claimed by another call, so no key is brainstormed twice.
+
+	Attached to a journal, the buffered ideas are journaled too, so a crash
+	doesn't lose what was paid for. Keys must then be json serializable
+	(strings, numbers and tuples of them).
+	"""
+
+	def __init__(self) -> None:
+		self._ideas: dict[Hashable, deque[_Buffered]] = {}
+		# the batch calls running by claimed key, resolved once their ideas
+		# are buffered
+		self._in_flight: dict[Hashable, Future[None]] = {}
+		self._lock = threading.Lock()
+		self._journal: JobJournal | None = None
+
+	def attach(self, journal: JobJournal) -> int:
+		"""
+		Journals the buffered ideas from now on, and buffers the ones a
+		resumed run had journaled. Returns how many were restored.
+		"""
+		stored: list[tuple[int, str, ImageIdea]] = journal.buffered_ideas()
+		with self._lock:
+			self._journal = journal
+			for idea_id, key_text, image_idea in stored:
+				key: Hashable = _key_from_text(key_text)
+				self._ideas.setdefault(key, deque()).append((image_idea, idea_id))
+		return len(stored)
+
+	def _unjournal(self, buffered: list[_Buffered]) -> None:
+		idea_ids: list[int] = [idea_id for _, idea_id in buffered if idea_id]
+		if self._journal is not None and idea_ids:
+			self._journal.unbuffer_ideas(idea_ids)
+
+	def _take(self, ideas: deque[_Buffered]) -> ImageIdea:
+		"""
+		Pops the oldest idea. Its journal entry goes right away, the job's own
+		one is written as soon as the idea is returned (see JournaledPipeline).
+		"""
+		buffered: _Buffered = ideas.popleft()
+		self._unjournal([buffered])
+		return buffered[0]
+
+	def _take_or_claim(
+		self, key: Hashable, candidates: Sequence[Hashable], size: int
+	) -> ImageIdea | Future[None] | list[Hashable]:
+		"""
+		A buffered idea, or the batch call of the key to wait for.
+		If there is neither, claims the key and up to size - 1 of the
+		candidates for a new call, and returns the claimed keys.
+		"""
+		with self._lock:
+			ideas = self._ideas.get(key)
+			if ideas:
+				return self._take(ideas)
+			if key in self._in_flight:
+				return self._in_flight[key]
+
+			keys: list[Hashable] = [key]
+			for candidate in candidates:
+				if len(keys) >= size:
+					break
+				if candidate in keys or candidate in self._in_flight:
+					continue
+				if self._ideas.get(candidate):
+					continue
+				keys.append(candidate)
+
+			call: Future[None] = Future()
+			for claimed in keys:
+				self._in_flight[claimed] = call
+			return keys
+
+	def _release(
+		self, key: Hashable, keys: list[Hashable], ideas: KeyedIdeas
+	) -> ImageIdea | None:
+		"""
+		Buffers the ideas of a call, except the first one of the caller's key
+		which is returned, and wakes the jobs waiting for the claimed keys.
+		"""
+		own: ImageIdea | None = None
+		others: KeyedIdeas = []
+		for idea_key, idea in ideas:
+			if own is None and idea_key == key:
+				own = idea
+			else:
+				others.append((idea_key, idea))
+
+		idea_ids: list[int | None] = [None] * len(others)
+		if self._journal is not None and others:
+			idea_ids = list(
+				self._journal.buffer_ideas(
+					[(_key_text(idea_key), idea) for idea_key, idea in others]
+				)
+			)
+
+		with self._lock:
+			for (idea_key, idea), idea_id in zip(others, idea_ids):
+				self._ideas.setdefault(idea_key, deque()).append((idea, idea_id))
+			call: Future[None] = self._in_flight[key]
+			for claimed in keys:
+				del self._in_flight[claimed]
+			call.set_result(None)
+		return own
+
+	def get(
+		self,
+		key: Hashable,
+		fetch: Callable[[list[Hashable]], KeyedIdeas],
+		candidates: Sequence[Hashable] = (),
+		size: int = 1,
+	) -> ImageIdea | None:
+		"""
+		Takes a buffered idea for the key, or calls fetch for a new batch.
+		fetch gets the claimed keys (the key first, see _take_or_claim) and
+		returns the ideas with their keys, all but the caller's are buffered.
+		Returns None if the batch call brought no idea for the key.
+		"""
+		while isinstance(found := self._take_or_claim(key, candidates, size), Future):
+			# another job's call is running, then the buffer is tried again
+			found.result()
+		if isinstance(found, ImageIdea):
+			return found
+
+		ideas: KeyedIdeas = []
+		try:
+			ideas = fetch(found)
+		finally:
+			image_idea: ImageIdea | None = self._release(key, found, ideas)
+		return image_idea
+
+	async def aget(
+		self,
+		key: Hashable,
+		fetch: Callable[[list[Hashable]], Awaitable[KeyedIdeas]],
+		candidates: Sequence[Hashable] = (),
+		size: int = 1,
+	) -> ImageIdea | None:
+		"""Async variant of get."""
+		while isinstance(found := self._take_or_claim(key, candidates, size), Future):
+			# shielded, a cancelled waiter must not cancel the others
+			await asyncio.shield(asyncio.wrap_future(found))
+		if isinstance(found, ImageIdea):
+			return found
+
+		ideas: KeyedIdeas = []
+		try:
+			ideas = await fetch(found)
+		finally:
+			image_idea: ImageIdea | None = self._release(key, found, ideas)
+		return image_idea
+
+	def discard(self, matches: Callable[[Hashable], bool]) -> int:
+		"""Drops the buffered ideas of the matching keys, returns how many."""
+		with self._lock:
+			dropped: list[_Buffered] = []
+			for key in [key for key in self._ideas if matches(key)]:
+				dropped.extend(self._ideas.pop(key))
+		self._unjournal(dropped)
+		return len(dropped)
@@ -0,0 +1,192 @@
+import contextlib
+import queue
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any
+
+from core.models import ImageIdea
+from core.pipeline.base import BasePipeline, JobConfig
+from logging_system.logger_config import app_logger
+
+
+# marks the end of a queue for its consumers
+_DONE = None
+
+# seconds between checks that the consumers of a full queue are still alive
+_PUT_TIMEOUT = 1.0
+
+
+@dataclass
+class EngineStats:
+	"""Counters collected by the executor during one run."""
+
+	submitted: int = 0
+	ideas: int = 0
+	brainstorm_failures: int = 0
+	rendered: int = 0
+	render_failures: int = 0
+
+
+class PipelinedExecutor[T_JobConfig: JobConfig]:
+	"""
+	Runs pipeline jobs as a producer/consumer chain, so that brainstorming
+	(usually on the CPU) overlaps with painting (usually on the GPU).
+
+	Brain workers take jobs and put (job, ImageIdea) pairs in a bounded queue,
+	artist workers drain this queue and render them.
+	The queue depth bounds how far brainstorming can run ahead of painting.
+	"""
+
+	def __init__(
+		self,
+		pipeline: BasePipeline[T_JobConfig],
+		queue_depth: int = 4,
+		brain_workers: int = 1,
+		artist_workers: int = 1,
+	) -> None:
+		"""
+		Raises:
+			ValueError: If any of the sizes is smaller than 1.
+		"""
+		if min(queue_depth, brain_workers, artist_workers) < 1:
+			raise ValueError(
+				"queue_depth, brain_workers and artist_workers must be at least 1"
+			)
+
+		self.pipeline = pipeline
+		self.queue_depth = queue_depth
+		self.brain_workers = brain_workers
+		self.artist_workers = artist_workers
+
+		self.stats = EngineStats()
+		self._stats_lock = threading.Lock()
+
+	def _count(self, field: str) -> None:
+		with self._stats_lock:
+			setattr(self.stats, field, getattr(self.stats, field) + 1)
+
+	def _brain_worker(
+		self,
+		jobs: "queue.Queue[T_JobConfig | None]",
+		ideas: "queue.Queue[tuple[T_JobConfig, ImageIdea] | None]",
+		artist_threads: list[threading.Thread],
+	) -> None:
+		while (job := jobs.get()) is not _DONE:
+			try:
+				image_idea: ImageIdea | None = self.pipeline.brainstorm(job)
+			except Exception as e:
+				app_logger.exception(f"❌ Brainstorm stage crashed: {e}")
+				image_idea = None
+
+			if image_idea is None:
+				self._count("brainstorm_failures")
+				continue
+
+			self._count("ideas")
+			# blocks while the artists are behind, which is the back-pressure
+			if not self._put(ideas, (job, image_idea), artist_threads):
+				app_logger.error("❌ Every artist worker died!")
+				self._count("render_failures")
+
+	def _artist_worker(
+		self, ideas: "queue.Queue[tuple[T_JobConfig, ImageIdea] | None]"
+	) -> None:
+		while (item := ideas.get()) is not _DONE:
+			job, image_idea = item
+			try:
+				success: bool = self.pipeline.render(job, image_idea)
+			except Exception as e:
+				app_logger.exception(f"❌ Render stage crashed: {e}")
+				success = False
+
+			self._count("rendered" if success else "render_failures")
+
+	@staticmethod
+	def _put[T](
+		items: "queue.Queue[T]", item: T, consumers: list[threading.Thread]
+	) -> bool:
+		"""
+		Puts the item in the bounded queue, waiting while it is full.
+		Returns False if no consumer is left to make room.
+		"""
+		while True:
+			try:
+				items.put(item, timeout=_PUT_TIMEOUT)
+				return True
+			except queue.Full:
+				if not any(thread.is_alive() for thread in consumers):
+					return False
+
+	def _stop_workers(
+		self, items: "queue.Queue[Any]", workers: list[threading.Thread], drain: bool
+	) -> None:
+		"""
+		Sends every worker the end marker and waits for them to finish.
+		drain drops the items still waiting first, when the run was aborted.
+		"""
+		if drain:
+			with contextlib.suppress(queue.Empty):
+				while True:
+					items.get_nowait()
+		for _ in workers:
+			if not self._put(items, _DONE, workers):
+				# the workers died, nobody will take the marker
+				break
+		for thread in workers:
+			thread.join()
+
+	def run(self, jobs: Iterable[T_JobConfig]) -> EngineStats:
+		"""
+		Runs all the given jobs and blocks until every one of them is finished.
+		Jobs are pulled lazily from the iterable.
+		"""
+		job_queue: queue.Queue[T_JobConfig | None] = queue.Queue(
+			maxsize=self.queue_depth
+		)
+		idea_queue: queue.Queue[tuple[T_JobConfig, ImageIdea] | None] = queue.Queue(
+			maxsize=self.queue_depth
+		)
+
+		artist_threads = [
+			threading.Thread(
+				target=self._artist_worker,
+				args=(idea_queue,),
+				name=f"artist-worker-{i}",
+				daemon=True,
+			)
+			for i in range(self.artist_workers)
+		]
+		brain_threads = [
+			threading.Thread(
+				target=self._brain_worker,
+				args=(job_queue, idea_queue, artist_threads),
+				name=f"brain-worker-{i}",
+				daemon=True,
+			)
+			for i in range(self.brain_workers)
+		]
+		for thread in brain_threads + artist_threads:
+			thread.start()
+
+		aborted: bool = False
+		try:
+			for job in jobs:
+				if not self._put(job_queue, job, brain_threads):
+					raise RuntimeError("Every brain worker died!")
+				self._count("submitted")
+		except BaseException:
+			aborted = True
+			raise
+		finally:
+			# shut the chain down stage by stage, so no idea gets lost,
+			# unless the run was aborted: then the waiting jobs are dropped
+			# (the journal keeps them for --resume)
+			self._stop_workers(job_queue, brain_threads, drain=aborted)
+			self._stop_workers(idea_queue, artist_threads, drain=aborted)
+
+		return self.stats
+
+	def close(self) -> None:
+		"""Nothing to release, the worker threads end with every run."""
+		pass
@@ -0,0 +1,107 @@
+import asyncio
+
+from core.journal import JobJournal, JobState
+from core.models import ImageIdea
+from core.pipeline.base import BasePipeline, JobConfig
+from logging_system.logger_config import app_logger
+
+
+class JournaledPipeline[T_JobConfig: JobConfig](BasePipeline[T_JobConfig]):
+	"""
+	Wraps a pipeline and records the progress of every job in a JobJournal.
+
+	When a job was already brainstormed (e.g. in a crashed run), its stored
+	idea is reused instead of asking the brain again, and stages that were
+	already done are skipped. Jobs without a job_key are not journaled.
+	"""
+
+	def __init__(
+		self, pipeline: BasePipeline[T_JobConfig], journal: JobJournal
+	) -> None:
+		self.pipeline = pipeline
+		self.journal = journal
+
+	def _stored_idea(self, config: T_JobConfig) -> ImageIdea | None:
+		if not config.job_key:
+			return None
+
+		entry = self.journal.get(config.job_key)
+		if entry is None or entry.image_idea is None:
+			return None
+
+		app_logger.info(f"♻️ Reusing the journaled idea of {config.job_key}")
+		return entry.image_idea
+
+	def _record_idea(self, config: T_JobConfig, image_idea: ImageIdea | None) -> None:
+		if config.job_key and image_idea is not None:
+			self.journal.record_idea(config.job_key, image_idea)
+
+	def _state(self, config: T_JobConfig) -> JobState:
+		if not config.job_key:
+			return JobState.PLANNED
+
+		entry = self.journal.get(config.job_key)
+		return entry.state if entry is not None else JobState.PLANNED
+
+	def brainstorm(self, config: T_JobConfig) -> ImageIdea | None:
+		stored: ImageIdea | None = self._stored_idea(config)
+		if stored is not None:
+			return stored
+
+		image_idea: ImageIdea | None = self.pipeline.brainstorm(config)
+		self._record_idea(config, image_idea)
+		return image_idea
+
+	async def abrainstorm(self, config: T_JobConfig) -> ImageIdea | None:
+		stored: ImageIdea | None = self._stored_idea(config)
+		if stored is not None:
+			return stored
+
+		image_idea: ImageIdea | None = await self.pipeline.abrainstorm(config)
+		self._record_idea(config, image_idea)
+		return image_idea
+
+	def paint(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		success: bool = self.pipeline.paint(config, image_idea)
+		if success and config.job_key:
+			self.journal.mark_painted(config.job_key)
+		return success
+
+	async def apaint(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		success: bool = await self.pipeline.apaint(config, image_idea)
+		if success and config.job_key:
+			self.journal.mark_painted(config.job_key)
+		return success
+
+	def save_metadata(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		if not self.pipeline.save_metadata(config, image_idea):
+			# stays PAINTED, so --resume writes it again
+			return False
+		if config.job_key:
+			# the sinks buffer rows, they must be on disk before the journal
+			# says so, or a crash would lose them for good
+			self.pipeline.flush_metadata()
+			self.journal.mark_metadata_written(config.job_key)
+		return True
+
+	def flush_metadata(self) -> None:
+		self.pipeline.flush_metadata()
+
+	def render(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		state: JobState = self._state(config)
+		if state == JobState.METADATA_WRITTEN:
+			return True
+		if state == JobState.PAINTED:
+			# images are there, only the metadata is missing
+			return self.save_metadata(config, image_idea)
+
+		return super().render(config, image_idea)
+
+	async def arender(self, config: T_JobConfig, image_idea: ImageIdea) -> bool:
+		state: JobState = self._state(config)
+		if state == JobState.METADATA_WRITTEN:
+			return True
+		if state == JobState.PAINTED:
+			return await asyncio.to_thread(self.save_metadata, config, image_idea)
+
+		return await super().arender(config, image_idea)
@@ -1,11 +1,14 @@
+from collections.abc import Hashable
 from typing import Any
 
 from brains.base_brain import Brain
 from artists.base_artist import Artist
 from core.csv_manager import AdobeCsvManager
+from core.metrics import metrics
 
 from core.models import ImageIdea
 from core.pipeline.base import BasePipeline, JobConfig
+from core.pipeline.batch import IdeaBuffer, KeyedIdeas
 
 
 class MetaJobConfig(JobConfig):
@@ -16,29 +19,87 @@ class MetaJobConfig(JobConfig):
 
 class MetaPipeline(BasePipeline[MetaJobConfig]):
 	def __init__(
-		self, brain: Brain, artist: Artist, csv_manager: AdobeCsvManager
+		self,
+		brain: Brain,
+		artist: Artist,
+		csv_manager: AdobeCsvManager,
+		batch_size: int = 1,
 	) -> None:
+		"""
+		batch_size: How many ideas to ask the brain for in one call.
+			Extra ideas are buffered for the next jobs of the same meta prompt.
+		"""
 		self.brain = brain
 		self.artist = artist
 		self.csv_manager = csv_manager
+		self.batch_size = batch_size
+		self.idea_buffer = IdeaBuffer()
 
-	def run_job(self, config: MetaJobConfig) -> bool:
-		"""Runs the full cycle for one single batch of images."""
+	def _fetch_ideas(self, config: MetaJobConfig, keys: list[Hashable]) -> KeyedIdeas:
+		with metrics.timer("stage", stage="brain", niche=config.niche):
+			ideas = self.brain.get_responses(config.meta_prompt, self.batch_size)
+		return [(keys[0], idea) for idea in ideas if idea is not None]
 
+	async def _afetch_ideas(
+		self, config: MetaJobConfig, keys: list[Hashable]
+	) -> KeyedIdeas:
+		with metrics.timer("stage", stage="brain", niche=config.niche):
+			ideas = await self.brain.aget_responses(config.meta_prompt, self.batch_size)
+		return [(keys[0], idea) for idea in ideas if idea is not None]
+
+	def _get_idea(self, config: MetaJobConfig) -> ImageIdea | None:
+		if self.batch_size <= 1:
+			with metrics.timer("stage", stage="brain", niche=config.niche):
+				return self.brain.get_response(config.meta_prompt)
+
+		return self.idea_buffer.get(
+			config.meta_prompt, lambda keys: self._fetch_ideas(config, keys)
+		)
+
+	async def _aget_idea(self, config: MetaJobConfig) -> ImageIdea | None:
+		if self.batch_size <= 1:
+			with metrics.timer("stage", stage="brain", niche=config.niche):
+				return await self.brain.aget_response(config.meta_prompt)
+
+		return await self.idea_buffer.aget(
+			config.meta_prompt, lambda keys: self._afetch_ideas(config, keys)
+		)
+
+	def brainstorm(self, config: MetaJobConfig) -> ImageIdea | None:
 		print("🧠 Brainstorming... ", end="")
-		image_idea: ImageIdea | None = self.brain.get_response(config.meta_prompt)
+		image_idea: ImageIdea | None = self._get_idea(config)
 
 		if image_idea is None:
+			metrics.count("ideas", niche=config.niche, result="failed")
 			print("❌ LLM failed to generate idea!")
-			return False
+			return None
 
+		metrics.count("ideas", niche=config.niche, result="ok")
 		print("✅ Idea generated.")
+		return image_idea
+
+	async def abrainstorm(self, config: MetaJobConfig) -> ImageIdea | None:
+		image_idea: ImageIdea | None = await self._aget_idea(config)
+		if image_idea is None:
+			metrics.count("ideas", niche=config.niche, result="failed")
+			print("❌ LLM failed to generate idea!")
+		else:
+			metrics.count("ideas", niche=config.niche, result="ok")
+		return image_idea
 
+	def paint(self, config: MetaJobConfig, image_idea: ImageIdea) -> bool:
 		print("🎨 Painting ... ", end="")
-		success_paint: bool = self.artist.paint(
-			image_idea.prompt,
-			image_name_stem=config.image_name_stem,
-			paint_cfg=config.paint_config,
+		with (
+			metrics.timer("stage", stage="paint", niche=config.niche),
+			metrics.scope(niche=config.niche),
+		):
+			success_paint: bool = self.artist.paint(
+				image_idea.prompt,
+				image_name_stem=config.image_name_stem,
+				paint_cfg=config.paint_config,
+			)
+		metrics.count(
+			"paints", niche=config.niche, result="ok" if success_paint else "failed"
 		)
 
 		if not success_paint:
@@ -46,10 +107,39 @@ class MetaPipeline(BasePipeline[MetaJobConfig]):
 			return False
 
 		print("✅ Image generated.")
+		return True
 
-		self.csv_manager.save_job_metadata(
-			image_idea, config.image_name_stem, config.paint_config["N_images"]
+	async def apaint(self, config: MetaJobConfig, image_idea: ImageIdea) -> bool:
+		with (
+			metrics.timer("stage", stage="paint", niche=config.niche),
+			metrics.scope(niche=config.niche),
+		):
+			success_paint: bool = await self.artist.apaint(
+				image_idea.prompt,
+				image_name_stem=config.image_name_stem,
+				paint_cfg=config.paint_config,
+			)
+		metrics.count(
+			"paints", niche=config.niche, result="ok" if success_paint else "failed"
 		)
 
+		if not success_paint:
+			print("❌ Artist failed to generate image!")
+			return False
+
+		return True
+
+	def save_metadata(self, config: MetaJobConfig, image_idea: ImageIdea) -> bool:
+		n_images: int = config.paint_config["N_images"]
+		saved: bool = self.csv_manager.save_job_metadata(
+			image_idea, config.image_name_stem, n_images
+		)
+		if not saved:
+			return False
+		metrics.count("images", n_images, niche=config.niche)
+
 		print(f"✅ {'-' * 5} Finished cycle. {'-' * 5}\n")
 		return True
+
+	def flush_metadata(self) -> None:
+		self.csv_manager.flush()
@@ -1,8 +1,11 @@
-from typing import Any
+import random
+from collections.abc import Hashable
+from typing import Any, NamedTuple
 
 from brains.base_brain import Brain
 from artists.base_artist import Artist
 from core.csv_manager import AdobeCsvManager
+from core.metrics import metrics
 from core.models import ImageIdea
 from prompts.wildcard_manager import WildcardResolver
 from prompts.instruction_manager import InstructionManager
@@ -10,6 +13,7 @@ from logging_system.logger_config import app_logger
 from logging_system.prompt_logger import PromptLogManager
 
 from core.pipeline.base import BasePipeline, JobConfig
+from core.pipeline.batch import IdeaBuffer, KeyedIdeas
 
 
 class WildcardConfig(JobConfig):
@@ -17,6 +21,21 @@ class WildcardConfig(JobConfig):
 	image_name_stem: str
 	paint_config: dict[str, Any]
 	llm_instruction: str
+	# seeds the random draws of this job, the resolver's generator if None
+	seed: int | None = None
+	# combination indices of the prompt to use instead of random draws: the
+	# job's own one, then candidates of the next jobs that a batch call may
+	# brainstorm too (their ideas are buffered for them)
+	combinations: tuple[int, ...] = ()
+
+
+class _CombinationKey(NamedTuple):
+	"""Buffer key of the idea of one combination, only its job renders it."""
+
+	niche: str
+	llm_instruction: str
+	raw_prompt: str
+	combination: int
 
 
 class WildcardPipeline(BasePipeline[WildcardConfig]):
@@ -28,48 +47,233 @@ class WildcardPipeline(BasePipeline[WildcardConfig]):
 		wildcard_resolver: WildcardResolver,
 		instruction_manager: InstructionManager,
 		prompt_log_manager: PromptLogManager,
+		batch_size: int = 1,
 	) -> None:
+		"""
+		batch_size: How many resolved prompts to send to the brain in one call.
+			Extra ideas are buffered for the next jobs of the same raw prompt.
+		"""
 		self.brain = brain
 		self.artist = artist
 		self.csv_manager = csv_manager
 		self.wildcard_resolver = wildcard_resolver
 		self.instruction_manager = instruction_manager
 		self.prompt_log_manager = prompt_log_manager
+		self.batch_size = batch_size
+		self.idea_buffer = IdeaBuffer()
 
-	def run_job(self, config: WildcardConfig) -> bool:
-		resolved_prompt: str = self.wildcard_resolver.resolve(config.raw_prompt)
-		app_logger.info("🧠 Brainstorming...")
-
+	def _build_instruction(
+		self, config: WildcardConfig, combinations: list[int]
+	) -> tuple[str, str] | None:
+		"""
+		Resolves the raw prompt and appends it to the llm instruction.
+		In batch mode, the resolutions are appended as idea_1, idea_2...
+		Returns the whole prompt and its prefix shared by every job, the
+		instruction, which brains with prompt caching process only once.
+		"""
 		instruction: str | None = self.instruction_manager.get_instruction(
 			config.llm_instruction
 		)
 		if not instruction:
 			app_logger.error("❌ Instruction not found!")
-			return False
+			return None
+
+		with metrics.timer("stage", stage="resolve", niche=config.niche):
+			resolved_prompts: list[str] = self._resolve(config, combinations)
+		if self.batch_size <= 1:
+			return instruction + f"\nidea=```{resolved_prompts[0]}```", instruction
+
+		prompt: str = instruction
+		for i, resolved_prompt in enumerate(resolved_prompts, start=1):
+			prompt += f"\nidea_{i}=```{resolved_prompt}```"
+		return prompt, instruction
+
+	def _resolve(self, config: WildcardConfig, combinations: list[int]) -> list[str]:
+		"""
+		The resolved prompts of one brain call: the given combinations, or
+		batch_size random draws without any.
+		"""
+		if combinations:
+			return [
+				self.wildcard_resolver.combination(config.raw_prompt, index)
+				for index in combinations
+			]
+
+		rng: random.Random | None = None
+		if config.seed is not None:
+			rng = random.Random(config.seed)
+		return [
+			self.wildcard_resolver.resolve(config.raw_prompt, rng)
+			for _ in range(max(self.batch_size, 1))
+		]
+
+	@staticmethod
+	def _buffer_args(config: WildcardConfig) -> tuple[Hashable, list[Hashable]]:
+		"""
+		The buffer key of the job and the candidate keys of its batch.
+		Random draws of a prompt are interchangeable, they share one key.
+		Keys start with the niche, whose wildcards the ideas were resolved with.
+		"""
+		if not config.combinations:
+			return (config.niche, config.llm_instruction, config.raw_prompt), []
+
+		keys: list[Hashable] = [
+			_CombinationKey(
+				config.niche, config.llm_instruction, config.raw_prompt, combination
+			)
+			for combination in config.combinations
+		]
+		return keys[0], keys[1:]
+
+	def discard_ideas(self, niche: str) -> int:
+		"""Drops the buffered ideas of a niche, returns how many."""
+		return self.idea_buffer.discard(
+			lambda key: isinstance(key, tuple) and key[0] == niche
+		)
+
+	@staticmethod
+	def _keyed(keys: list[Hashable], ideas: list[ImageIdea | None]) -> KeyedIdeas:
+		"""Pairs the ideas with the keys they were brainstormed for."""
+		if not isinstance(keys[0], _CombinationKey):
+			return [(keys[0], idea) for idea in ideas if idea is not None]
+		return [(key, idea) for key, idea in zip(keys, ideas) if idea is not None]
+
+	@staticmethod
+	def _combinations(keys: list[Hashable]) -> list[int]:
+		return [key.combination for key in keys if isinstance(key, _CombinationKey)]
+
+	def _fetch_ideas(
+		self, config: WildcardConfig, keys: list[Hashable]
+	) -> list[ImageIdea | None]:
+		"""One brain call, one idea per key (batch_size of them for random draws)."""
+		combinations: list[int] = self._combinations(keys)
+		built: tuple[str, str] | None = self._build_instruction(config, combinations)
+		if built is None:
+			return []
+		prompt, instruction = built
+
+		with metrics.timer("stage", stage="brain", niche=config.niche):
+			if self.batch_size <= 1:
+				return [self.brain.get_response(prompt, prefix=instruction)]
+
+			n_ideas: int = len(combinations) or self.batch_size
+			return self.brain.get_responses(prompt, n_ideas, prefix=instruction)
+
+	async def _afetch_ideas(
+		self, config: WildcardConfig, keys: list[Hashable]
+	) -> list[ImageIdea | None]:
+		combinations: list[int] = self._combinations(keys)
+		built: tuple[str, str] | None = self._build_instruction(config, combinations)
+		if built is None:
+			return []
+		prompt, instruction = built
+
+		with metrics.timer("stage", stage="brain", niche=config.niche):
+			if self.batch_size <= 1:
+				return [await self.brain.aget_response(prompt, prefix=instruction)]
+
+			n_ideas: int = len(combinations) or self.batch_size
+			return await self.brain.aget_responses(prompt, n_ideas, prefix=instruction)
 
-		instruction += f"\nidea=```{resolved_prompt}```"
+	def _get_idea(self, config: WildcardConfig) -> ImageIdea | None:
+		key, candidates = self._buffer_args(config)
+		if self.batch_size <= 1:
+			ideas: list[ImageIdea | None] = self._fetch_ideas(config, [key])
+			return ideas[0] if ideas else None
 
-		image_idea: ImageIdea | None = self.brain.get_response(instruction)
+		return self.idea_buffer.get(
+			key,
+			lambda keys: self._keyed(keys, self._fetch_ideas(config, keys)),
+			candidates,
+			self.batch_size,
+		)
+
+	async def _aget_idea(self, config: WildcardConfig) -> ImageIdea | None:
+		key, candidates = self._buffer_args(config)
+		if self.batch_size <= 1:
+			ideas: list[ImageIdea | None] = await self._afetch_ideas(config, [key])
+			return ideas[0] if ideas else None
+
+		async def fetch(keys: list[Hashable]) -> KeyedIdeas:
+			return self._keyed(keys, await self._afetch_ideas(config, keys))
+
+		return await self.idea_buffer.aget(key, fetch, candidates, self.batch_size)
+
+	def brainstorm(self, config: WildcardConfig) -> ImageIdea | None:
+		app_logger.info("🧠 Brainstorming...")
+		image_idea: ImageIdea | None = self._get_idea(config)
 		if not image_idea:
+			metrics.count("ideas", niche=config.niche, result="failed")
 			app_logger.error("❌ LLM failed to generate idea!")
-			return False
+			return None
+		metrics.count("ideas", niche=config.niche, result="ok")
+		app_logger.success("✅ Idea generated.")
+		return image_idea
+
+	async def abrainstorm(self, config: WildcardConfig) -> ImageIdea | None:
+		image_idea: ImageIdea | None = await self._aget_idea(config)
+		if not image_idea:
+			metrics.count("ideas", niche=config.niche, result="failed")
+			app_logger.error("❌ LLM failed to generate idea!")
+			return None
+		metrics.count("ideas", niche=config.niche, result="ok")
 		app_logger.success("✅ Idea generated.")
+		return image_idea
+
+	def paint(self, config: WildcardConfig, image_idea: ImageIdea) -> bool:
 		app_logger.info("🎨 Painting ...")
-		success_paint: bool = self.artist.paint(
-			image_idea.prompt,
-			image_name_stem=config.image_name_stem,
-			paint_cfg=config.paint_config,
+		with (
+			metrics.timer("stage", stage="paint", niche=config.niche),
+			metrics.scope(niche=config.niche),
+		):
+			success_paint: bool = self.artist.paint(
+				image_idea.prompt,
+				image_name_stem=config.image_name_stem,
+				paint_cfg=config.paint_config,
+			)
+		metrics.count(
+			"paints", niche=config.niche, result="ok" if success_paint else "failed"
 		)
 		if not success_paint:
 			app_logger.error("❌ Artist failed to generate image!")
 			return False
 		app_logger.success("✅ Image generated.")
+		return True
 
-		self.csv_manager.save_job_metadata(
-			image_idea, config.image_name_stem, config.paint_config["N_images"]
+	async def apaint(self, config: WildcardConfig, image_idea: ImageIdea) -> bool:
+		with (
+			metrics.timer("stage", stage="paint", niche=config.niche),
+			metrics.scope(niche=config.niche),
+		):
+			success_paint: bool = await self.artist.apaint(
+				image_idea.prompt,
+				image_name_stem=config.image_name_stem,
+				paint_cfg=config.paint_config,
+			)
+		metrics.count(
+			"paints", niche=config.niche, result="ok" if success_paint else "failed"
 		)
+		if not success_paint:
+			app_logger.error("❌ Artist failed to generate image!")
+			return False
+		app_logger.success("✅ Image generated.")
+		return True
+
+	def save_metadata(self, config: WildcardConfig, image_idea: ImageIdea) -> bool:
+		n_images: int = config.paint_config["N_images"]
+		saved: bool = self.csv_manager.save_job_metadata(
+			image_idea, config.image_name_stem, n_images
+		)
+		if not saved:
+			return False
+		# only a job whose metadata was saved is logged, a resumed job is not
+		# logged twice
 		self.prompt_log_manager.log_job(image_idea, config.image_name_stem)
+		metrics.count("images", n_images, niche=config.niche)
 
 		app_logger.success(f"✅ {'-' * 5} Finished cycle. {'-' * 5}\n")
-
 		return True
+
+	def flush_metadata(self) -> None:
+		self.csv_manager.flush()
+		self.prompt_log_manager.flush()
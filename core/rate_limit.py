@@ -0,0 +1,240 @@
+import asyncio
+import random
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from email.utils import parsedate_to_datetime
+from typing import Any
+
+
+# "too many requests" and "service unavailable": slow down and retry
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+def _status(error: BaseException) -> int | None:
+	"""The http status of an sdk (genai), requests or urllib error."""
+	for attr in ("code", "status_code"):
+		value: Any = getattr(error, attr, None)
+		if isinstance(value, int):
+			return value
+	value = getattr(getattr(error, "response", None), "status_code", None)
+	return value if isinstance(value, int) else None
+
+
+def _parse_seconds(value: str) -> float | None:
+	"""Parses "17", "17s" (grpc RetryInfo) or an http date."""
+	try:
+		return max(float(value.strip().removesuffix("s")), 0.0)
+	except ValueError:
+		pass
+	try:
+		return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+	except (TypeError, ValueError):
+		return None
+
+
+def retry_after(error: BaseException) -> float | None:
+	"""
+	Seconds the server asked us to wait, from the Retry-After header or
+	the RetryInfo of a google api error. None if it didn't say.
+	"""
+	headers: Any = getattr(error, "headers", None)
+	if headers is None:
+		headers = getattr(getattr(error, "response", None), "headers", None)
+	if headers is not None:
+		value: Any = headers.get("retry-after")
+		if isinstance(value, str) and (seconds := _parse_seconds(value)) is not None:
+			return seconds
+
+	details: Any = getattr(error, "details", None)
+	if isinstance(details, dict):
+		body: Any = details.get("error", details)
+		for item in body.get("details", []) if isinstance(body, dict) else []:
+			if isinstance(item, dict) and isinstance(item.get("retryDelay"), str):
+				return _parse_seconds(item["retryDelay"])
+	return None
+
+
+def is_throttled(error: BaseException) -> bool:
+	return _status(error) in THROTTLE_STATUSES
+
+
+class AdaptiveLimiter:
+	"""
+	Paces the requests to one rate limited backend, shared by its workers.
+
+	A token bucket caps the request rate, and a concurrency limit caps the
+	requests in flight. Both adapt with AIMD: every success raises them a
+	little (up to the configured maximum), every throttling response (429,
+	503) halves them, once per burst of throttled requests. Throttled
+	requests are retried after the server's Retry-After, or an exponential
+	backoff with jitter if it gives none; meanwhile no request is sent.
+	"""
+
+	# how often a request waiting for a free concurrency slot checks again
+	SLOT_POLL = 0.05
+
+	def __init__(
+		self,
+		name: str,
+		requests_per_minute: float = 60.0,
+		burst: int = 5,
+		max_concurrency: int = 8,
+		max_retries: int = 5,
+		max_backoff: float = 60.0,
+	) -> None:
+		"""
+		requests_per_minute: Highest rate, e.g. the quota of the api key.
+		burst: Requests that may be sent at once after an idle time.
+		max_retries: Retries of a throttled request before its error is raised.
+		"""
+		self.name = name
+		self.max_rate: float = requests_per_minute / 60
+		self.burst: int = burst
+		self.max_concurrency: int = max_concurrency
+		self.max_retries: int = max_retries
+		self.max_backoff: float = max_backoff
+
+		# the current limits, they start at the maximum
+		self.rate: float = self.max_rate
+		self.concurrency: float = float(max_concurrency)
+		self.in_flight: int = 0
+
+		self.throttled: int = 0
+		self.retries: int = 0
+
+		self._tokens: float = float(burst)
+		self._refilled_at: float = time.monotonic()
+		self._paused_until: float = 0.0
+		self._decreased_at: float = 0.0
+		self._lock = threading.Lock()
+
+	def _try_acquire(self) -> float:
+		"""
+		Takes a token and a concurrency slot if both are available.
+		Returns 0 then, else how long to wait before trying again.
+		"""
+		with self._lock:
+			now: float = time.monotonic()
+			if now < self._paused_until:
+				return self._paused_until - now
+
+			self._tokens = min(
+				self._tokens + (now - self._refilled_at) * self.rate, self.burst
+			)
+			self._refilled_at = now
+
+			if self.in_flight >= int(self.concurrency):
+				return self.SLOT_POLL
+			if self._tokens < 1:
+				return (1 - self._tokens) / self.rate
+
+			self._tokens -= 1
+			self.in_flight += 1
+			return 0.0
+
+	def _release(self) -> None:
+		with self._lock:
+			self.in_flight -= 1
+
+	def _on_success(self) -> None:
+		with self._lock:
+			self.in_flight -= 1
+			# +1 slot per "window" of successes, +1/50 of the max rate each
+			self.concurrency = min(
+				self.concurrency + 1 / self.concurrency, self.max_concurrency
+			)
+			self.rate = min(self.rate + self.max_rate / 50, self.max_rate)
+
+	def _on_error(self, error: BaseException, started: float, attempt: int) -> bool:
+		"""
+		Frees the slot, and slows down if the error is a throttling response.
+		Returns whether the request should be retried.
+		"""
+		throttled: bool = is_throttled(error)
+		with self._lock:
+			self.in_flight -= 1
+			if not throttled:
+				return False
+			self.throttled += 1
+
+			now: float = time.monotonic()
+			# the requests sent before the last decrease don't count again
+			if started >= self._decreased_at:
+				self._decreased_at = now
+				self.concurrency = max(self.concurrency / 2, 1.0)
+				self.rate = max(self.rate / 2, self.max_rate / 64)
+				self._tokens = 0.0
+
+			if attempt >= self.max_retries:
+				return False
+
+			delay: float | None = retry_after(error)
+			if delay is None:
+				delay = random.uniform(0, min(2.0**attempt, self.max_backoff))
+			self._paused_until = max(self._paused_until, now + delay)
+			self.retries += 1
+
+		print(
+			f"⏳ {self.name} throttled ({_status(error)}), retrying in "
+			f"{delay:.1f}s at {self.rate * 60:.0f} rpm, "
+			f"concurrency {int(self.concurrency)}."
+		)
+		return True
+
+	def call[T](self, request: Callable[[], T]) -> T:
+		"""
+		Sends the request once the limits allow it, and again after a
+		throttling response (at most max_retries times).
+		Raises the request's errors, throttling ones once out of retries.
+		"""
+		attempt: int = 0
+		while True:
+			while (delay := self._try_acquire()) > 0:
+				time.sleep(delay)
+
+			started: float = time.monotonic()
+			try:
+				result: T = request()
+			except Exception as e:
+				if not self._on_error(e, started, attempt):
+					raise
+				attempt += 1
+				continue
+			except BaseException:
+				# e.g. the task was cancelled, the slot is free again
+				self._release()
+				raise
+
+			self._on_success()
+			return result
+
+	async def acall[T](self, request: Callable[[], Awaitable[T]]) -> T:
+		"""Async variant of call."""
+		attempt: int = 0
+		while True:
+			while (delay := self._try_acquire()) > 0:
+				await asyncio.sleep(delay)
+
+			started: float = time.monotonic()
+			try:
+				result: T = await request()
+			except Exception as e:
+				if not self._on_error(e, started, attempt):
+					raise
+				attempt += 1
+				continue
+			except BaseException:
+				# e.g. the task was cancelled, the slot is free again
+				self._release()
+				raise
+
+			self._on_success()
+			return result
+
+	def report(self) -> str:
+		return (
+			f"{self.name} rate limit: {self.throttled} throttled responses, "
+			f"{self.retries} retries, ended at {self.rate * 60:.0f} rpm "
+			f"and concurrency {int(self.concurrency)}"
+		)
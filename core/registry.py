@@ -0,0 +1,62 @@
+import importlib
+from collections.abc import Callable
+from typing import Any
+
+from artists.base_artist import Artist
+from brains.base_brain import Brain
+from settings import ArtistType, BrainType, settings
+
+
+# backend modules are imported on first use, so only the active brain and
+# artist (and their sdks) are ever loaded; the settings attribute of a
+# backend's config is named like its type
+BRAINS: dict[BrainType, str] = {
+	BrainType.OLLAMA: "brains.brain_ollama:OllamaBrain",
+	BrainType.GEMINI: "brains.brain_gemini:GeminiBrain",
+}
+
+ARTISTS: dict[ArtistType, str] = {
+	ArtistType.BANANA: "artists.artist_banana:BananaArtist",
+	ArtistType.FOOOCUS: "artists.artist_fooocus:FooocusArtist",
+}
+
+
+def _load_class(target: str) -> Any:
+	module_name, _, class_name = target.partition(":")
+	return getattr(importlib.import_module(module_name), class_name)
+
+
+def load_brain(brain_type: BrainType) -> Callable[[dict[str, Any]], Brain]:
+	"""
+	Imports the brain module and returns the brain class.
+	Raises:
+		ValueError: If no brain is registered for the type.
+	"""
+	if brain_type not in BRAINS:
+		raise ValueError(f"Unknown brain {brain_type}!")
+	cls: Callable[[dict[str, Any]], Brain] = _load_class(BRAINS[brain_type])
+	return cls
+
+
+def load_artist(artist_type: ArtistType) -> Callable[[dict[str, Any]], Artist]:
+	"""
+	Imports the artist module and returns the artist class.
+	Raises:
+		ValueError: If no artist is registered for the type.
+	"""
+	if artist_type not in ARTISTS:
+		raise ValueError(f"Unknown artist {artist_type}!")
+	cls: Callable[[dict[str, Any]], Artist] = _load_class(ARTISTS[artist_type])
+	return cls
+
+
+def create_brain(brain_type: BrainType) -> Brain:
+	"""Imports the brain and builds it from its settings."""
+	config: dict[str, Any] = getattr(settings, brain_type.value).model_dump()
+	return load_brain(brain_type)(config)
+
+
+def create_artist(artist_type: ArtistType) -> Artist:
+	"""Imports the artist and builds it from its settings."""
+	config: dict[str, Any] = getattr(settings, artist_type.value).model_dump()
+	return load_artist(artist_type)(config)
@@ -1,29 +1,70 @@
 import subprocess
 import os
+import random
 import sys
+import threading
 import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO
 import requests
 from pathlib import Path
 from settings import settings
+from core.transport import get_session
+from logging_system.logger_config import app_logger
+
+
+def _drain(name: str, stream: IO[bytes], tail: deque[str]) -> None:
+	"""
+	Reads a child's stderr until it closes, so the pipe never fills up and
+	blocks the child. Lines go to the log file, the last ones are kept.
+	"""
+	for raw_line in iter(stream.readline, b""):
+		line: str = raw_line.decode("utf-8", errors="replace").rstrip()
+		if line:
+			tail.append(line)
+			app_logger.debug(f"[{name}] {line}")
+	stream.close()
 
 
 class ServerRunner:
-	def __init__(self, run_ollama: bool, run_fooocus: bool):
+	"""
+	Attaches to Ollama and Fooocus-API, or starts them (concurrently) and
+	stops them on exit if they weren't running before.
+	"""
+
+	# readiness polling: exponential backoff between these bounds, with jitter
+	MIN_POLL_DELAY = 0.25
+	MAX_POLL_DELAY = 4.0
+
+	def __init__(
+		self, run_ollama: bool, run_fooocus: bool, startup_timeout: float = 120.0
+	):
+		"""
+		startup_timeout: Seconds a started service may take to come online.
+		"""
 		self.run_ollama = run_ollama
 		self.run_fooocus = run_fooocus
+		self.startup_timeout = startup_timeout
 
 		if run_ollama:
 			self.ollama_url: str = settings.ollama.url
 
 		if run_fooocus:
 			self.fooocus_url: str = f"{settings.fooocus.url.rstrip('/')}/docs"
-			self.fooocus_dir: Path = settings.fooocus.path.resolve()
+			# without a local installation we can only attach to a server
+			self.fooocus_dir: Path | None = None
+			if settings.fooocus.path is not None:
+				self.fooocus_dir = settings.fooocus.path.resolve()
 
-			# Detect OS for correct Python path inside venv
-			if os.name == "nt":
-				self.venv_python = self.fooocus_dir / "venv" / "Scripts" / "python.exe"
-			else:
-				self.venv_python = self.fooocus_dir / "venv" / "bin" / "python"
+				# Detect OS for correct Python path inside venv
+				if os.name == "nt":
+					self.venv_python = (
+						self.fooocus_dir / "venv" / "Scripts" / "python.exe"
+					)
+				else:
+					self.venv_python = self.fooocus_dir / "venv" / "bin" / "python"
 
 		# Process handles
 		self.proc_ollama: subprocess.Popen[bytes] | None = None
@@ -35,88 +76,188 @@ class ServerRunner:
 		self.owns_ollama: bool = False
 		self.owns_fooocus: bool = False
 
-	def _is_service_running(self, name: str, url: str) -> bool:
-		"""Checks if a service is already online."""
+		# seconds each service took to be ready, and how ("attached"/"started")
+		self.startup_times: dict[str, tuple[float, str]] = {}
+		# last stderr lines of the started services, shown if they fail
+		self._stderr_tails: dict[str, deque[str]] = {}
+
+	def _is_service_running(self, name: str, url: str) -> bool | None:
+		"""
+		Checks if a service is already online.
+		Returns None if something holds its port but doesn't answer (e.g. a
+		hung server): that is a failure, another instance couldn't start there.
+		"""
 		try:
-			requests.get(url, timeout=1)
+			get_session().get(url, timeout=5)
 			print(f"{name} is already online. Attaching...")
 			return True
 		except requests.ConnectionError:
 			return False
+		except requests.RequestException as e:
+			print(f"❌ {name} is listening at {url} but not answering: {e}")
+			return None
+
+	def _spawn(
+		self,
+		name: str,
+		args: list[str | Path],
+		env: dict[str, str] | None = None,
+		cwd: Path | None = None,
+	) -> subprocess.Popen[bytes]:
+		"""Starts a service, with its stderr drained into the logger."""
+		proc: subprocess.Popen[bytes] = subprocess.Popen(
+			args,
+			env=env,
+			cwd=cwd,
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.PIPE,
+			shell=False,
+		)
+		assert proc.stderr is not None
+		tail: deque[str] = deque(maxlen=20)
+		self._stderr_tails[name] = tail
+		threading.Thread(
+			target=_drain,
+			args=(name, proc.stderr, tail),
+			name=f"{name}-stderr",
+			daemon=True,
+		).start()
+		return proc
 
-	def _wait_for_service(self, name: str, url: str, retries: int = 30) -> bool:
-		"""Waits for a newly started service to come online."""
-		print(f"Waiting for {name} to warm up... ", end="")
-		for _ in range(retries):
+	def _wait_for_service(
+		self, name: str, url: str, proc: subprocess.Popen[bytes]
+	) -> bool:
+		"""
+		Waits for a newly started service to come online, polling with an
+		exponential backoff and jitter. Gives up early if the process died.
+		"""
+		print(f"Waiting for {name} to warm up...")
+		deadline: float = time.monotonic() + self.startup_timeout
+		delay: float = self.MIN_POLL_DELAY
+
+		while time.monotonic() < deadline:
 			try:
-				requests.get(url, timeout=5)
+				get_session().get(url, timeout=5)
 				print(f"✅ {name} is Ready!")
 				return True
+			except requests.RequestException:
+				pass
 
-			except requests.ConnectionError:
-				time.sleep(2)
+			if proc.poll() is not None:
+				print(f"❌ {name} exited with code {proc.returncode}.")
+				self._print_stderr_tail(name)
+				return False
 
-		print(f"\n❌ Timeout waiting for {name}.")
+			# full jitter, so polls don't line up with the service's own timers
+			time.sleep(random.uniform(0, delay))
+			delay = min(delay * 2, self.MAX_POLL_DELAY)
 
+		print(f"❌ Timeout waiting for {name}.")
+		self._print_stderr_tail(name)
 		return False
 
-	def __enter__(self) -> None:
-		print("🚀 Checking AI Infrastructure...")
+	def _print_stderr_tail(self, name: str) -> None:
+		tail = self._stderr_tails.get(name)
+		if tail:
+			print(f"Last {name} errors:\n" + "\n".join(f"  {line}" for line in tail))
 
-		if self.run_ollama:
-			# --- 1. OLLAMA LOGIC ---
-			if self._is_service_running("Ollama", self.ollama_url):
-				self.owns_ollama = False
-			else:
-				print("Starting Ollama (CPU Mode)...")
-				# Apply the CPU-Only fix
-				ollama_env = os.environ.copy()
-				ollama_env["CUDA_VISIBLE_DEVICES"] = ""
+	def _start_ollama(self) -> bool:
+		start: float = time.monotonic()
+		running: bool | None = self._is_service_running("Ollama", self.ollama_url)
+		if running is None:
+			return False
+		if running:
+			self.owns_ollama = False
+			self.startup_times["Ollama"] = (time.monotonic() - start, "attached")
+			return True
 
-				try:
-					self.proc_ollama = subprocess.Popen(
-						["ollama", "serve"],
-						env=ollama_env,
-						stdout=subprocess.DEVNULL,
-						stderr=subprocess.PIPE,
-					)
+		print("Starting Ollama (CPU Mode)...")
+		# Apply the CPU-Only fix
+		ollama_env = os.environ.copy()
+		ollama_env["CUDA_VISIBLE_DEVICES"] = ""
 
-					self.owns_ollama = True
+		try:
+			self.proc_ollama = self._spawn(
+				"Ollama", ["ollama", "serve"], env=ollama_env
+			)
+		except FileNotFoundError:
+			print("❌ Error: Ollama not installed.")
+			return False
+		self.owns_ollama = True
 
-					# Wait for it to actually start
-					if not self._wait_for_service("Ollama", self.ollama_url):
-						sys.exit(1)
-				except FileNotFoundError:
-					print("❌ Error: Ollama not installed.")
-					sys.exit(1)
+		# Wait for it to actually start
+		if not self._wait_for_service("Ollama", self.ollama_url, self.proc_ollama):
+			return False
+		self.startup_times["Ollama"] = (time.monotonic() - start, "started")
+		return True
 
+	def _start_fooocus(self) -> bool:
+		start: float = time.monotonic()
+		running: bool | None = self._is_service_running("Fooocus-API", self.fooocus_url)
+		if running is None:
+			return False
+		if running:
+			self.owns_fooocus = False
+			self.startup_times["Fooocus"] = (time.monotonic() - start, "attached")
+			return True
+
+		if self.fooocus_dir is None:
+			print("❌ Error: Fooocus-API is offline and FOOOCUS__PATH is not set.")
+			return False
+
+		print("Starting Fooocus-API...")
+		if not os.path.exists(self.venv_python):
+			print(f"❌ Error: Python not found at {self.venv_python}")
+			return False
+
+		self.proc_fooocus = self._spawn(
+			"Fooocus", [self.venv_python, "main.py"], cwd=self.fooocus_dir
+		)
+		self.owns_fooocus = True
+
+		if not self._wait_for_service("Fooocus", self.fooocus_url, self.proc_fooocus):
+			return False
+		self.startup_times["Fooocus"] = (time.monotonic() - start, "started")
+		return True
+
+	def startup_report(self) -> str:
+		parts: list[str] = [
+			f"{name} {seconds:.1f}s ({how})"
+			for name, (seconds, how) in self.startup_times.items()
+		]
+		return "⏱️ Startup: " + ", ".join(parts)
+
+	def __enter__(self) -> None:
+		print("🚀 Checking AI Infrastructure...")
+		start: float = time.monotonic()
+
+		# the services don't depend on each other, so they warm up together
+		starters: list[Callable[[], bool]] = []
+		if self.run_ollama:
+			starters.append(self._start_ollama)
 		if self.run_fooocus:
-			# --- 2. FOOOCUS LOGIC ---
-			if self._is_service_running("Fooocus-API", self.fooocus_url):
-				self.owns_fooocus = False
-			else:
-				print("Starting Fooocus-API...")
-				if not os.path.exists(self.venv_python):
-					print(f"❌ Error: Python not found at {self.venv_python}")
-					# If we started Ollama, kill it before exiting
-					if self.proc_ollama and self.owns_ollama:
-						self.proc_ollama.terminate()
-					sys.exit(1)
-
-				self.proc_fooocus = subprocess.Popen(
-					[self.venv_python, "main.py"],
-					cwd=self.fooocus_dir,
-					stdout=subprocess.DEVNULL,
-					stderr=subprocess.PIPE,
-					shell=False,
+			starters.append(self._start_fooocus)
+
+		try:
+			with ThreadPoolExecutor(
+				max_workers=2, thread_name_prefix="startup"
+			) as pool:
+				results: list[bool] = list(
+					pool.map(lambda starter: starter(), starters)
 				)
-				self.owns_fooocus = True
+		except BaseException:
+			# __exit__ won't run, stop what the other starter may have spawned
+			self.__exit__(None, None, None)
+			raise
+
+		if not all(results):
+			# stop whatever we started before giving up
+			self.__exit__(None, None, None)
+			sys.exit(1)
 
-				if not self._wait_for_service("Fooocus", self.fooocus_url):
-					# Cleanup if Fooocus fails
-					if self.proc_ollama and self.owns_ollama:
-						self.proc_ollama.terminate()
-					sys.exit(1)
+		if self.startup_times:
+			total: float = time.monotonic() - start
+			print(f"{self.startup_report()}, total {total:.1f}s")
 
 	def __exit__(self, exc_type, exc_val, exc_tb) -> None:  # type: ignore
 		if self.run_fooocus:
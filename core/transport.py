@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING
+
+from settings import settings
+
+if TYPE_CHECKING:
+	import requests
+	from google import genai
+
+
+_lock = threading.Lock()
+_session: requests.Session | None = None
+_genai_client: genai.Client | None = None
+
+
+def _build_session() -> requests.Session:
+	import requests
+	from requests.adapters import HTTPAdapter
+
+	http = settings.http
+	adapter = HTTPAdapter(
+		# number of hosts to keep a pool for
+		pool_connections=http.pool_connections,
+		# kept-alive connections per host
+		pool_maxsize=http.pool_maxsize,
+		# wait for a free connection instead of exceeding the per-host limit
+		pool_block=http.pool_block,
+	)
+
+	session = requests.Session()
+	session.mount("http://", adapter)
+	session.mount("https://", adapter)
+	return session
+
+
+def get_session() -> requests.Session:
+	"""
+	Returns the session shared by all workers. Its connections are pooled and
+	kept alive, so concurrent jobs don't pay the connection setup every call.
+	Safe to use from any thread.
+	"""
+	global _session
+	with _lock:
+		if _session is None:
+			_session = _build_session()
+		return _session
+
+
+def get_genai_client() -> genai.Client:
+	"""
+	Returns the genai client shared by all gemini backends (brain and artist),
+	with the same pool limits as the requests session.
+	"""
+	global _genai_client
+	with _lock:
+		if _genai_client is None:
+			import httpx
+			from google import genai
+			from google.genai.types import HttpOptions
+
+			http = settings.http
+			limits = httpx.Limits(
+				max_connections=http.pool_maxsize,
+				max_keepalive_connections=http.pool_maxsize,
+			)
+			_genai_client = genai.Client(
+				http_options=HttpOptions(
+					base_url=http.genai_base_url,
+					client_args={"limits": limits},
+					async_client_args={"limits": limits},
+				)
+			)
+		return _genai_client
+
+
+def close() -> None:
+	"""Closes the pooled connections, e.g. at the end of a run."""
+	global _session, _genai_client
+	with _lock:
+		if _session is not None:
+			_session.close()
+			_session = None
+		if _genai_client is not None:
+			# closes the client's own httpx client, the async one is closed by
+			# aclose on the loop that used it
+			_genai_client.close()
+			_genai_client = None
+
+
+async def aclose() -> None:
+	"""
+	Closes the genai client, sync and async connections. Must be awaited on the
+	loop the async client ran on, before that loop is closed.
+	"""
+	global _genai_client
+	with _lock:
+		client: genai.Client | None = _genai_client
+		_genai_client = None
+	if client is not None:
+		client.close()
+		await client.aio.aclose()
@@ -1,10 +1,16 @@
 from __future__ import annotations
 import sys
-import loguru
+import threading
+from typing import TYPE_CHECKING, Any, cast
 from settings import settings
 
+if TYPE_CHECKING:
+	import loguru
+
 
 def setup_logger() -> loguru.Logger:
+	import loguru
+
 	# Create a "log" directory if it doesn't exist
 	log_path = settings.log_path
 	log_path.mkdir(parents=True, exist_ok=True)
@@ -35,4 +41,23 @@ def setup_logger() -> loguru.Logger:
 	return loguru.logger
 
 
-app_logger = setup_logger()
+_lock = threading.Lock()
+_logger: loguru.Logger | None = None
+
+
+def get_logger() -> loguru.Logger:
+	global _logger
+	with _lock:
+		if _logger is None:
+			_logger = setup_logger()
+		return _logger
+
+
+class _LazyLogger:
+	"""Sets the logger up (log directory, file handler) on first use."""
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(get_logger(), name)
+
+
+app_logger = cast("loguru.Logger", _LazyLogger())
@@ -1,6 +1,8 @@
 from pathlib import Path
 import csv
+from core.csv_writer import BufferedCsvWriter
 from core.models import ImageIdea
+from settings import settings
 
 
 class PromptLogManager:
@@ -11,6 +13,8 @@ class PromptLogManager:
 	def __init__(self, filepath: Path) -> None:
 		self.filepath = filepath
 		self._initialize_csv()
+		# one writer thread, since artist workers log jobs concurrently
+		self._writer = BufferedCsvWriter(filepath, **settings.csv_sink.model_dump())
 
 	def _initialize_csv(self) -> None:
 		"""
@@ -37,15 +41,20 @@ class PromptLogManager:
 		"""
 		Logs the details of an image generation job to the CSV file.
 		"""
-		with open(self.filepath, mode="a", newline="", encoding="utf-8") as file:
-			writer = csv.writer(file)
+		self._writer.write(
+			[
+				image_name_stem,
+				image_idea.title,
+				image_idea.keywords,
+				image_idea.category,
+				image_idea.prompt,
+			]
+		)
 
-			writer.writerow(
-				[
-					image_name_stem,
-					image_idea.title,
-					image_idea.keywords,
-					image_idea.category,
-					image_idea.prompt,
-				]
-			)
+	def flush(self) -> None:
+		"""Blocks until the jobs logged so far are on disk."""
+		self._writer.flush()
+
+	def close(self) -> None:
+		"""Writes the pending rows to disk and stops the writer."""
+		self._writer.close()
@@ -1,74 +1,183 @@
-import copy
+import argparse
+import time
+from collections.abc import Callable, Generator, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from settings import settings, ArtistType, BrainType, PipelineType
+from typing import TYPE_CHECKING, Any
+from settings import (
+	settings,
+	ArtistType,
+	BrainType,
+	EngineMode,
+	PipelineType,
+	WildcardMode,
+)
 
 from brains.base_brain import Brain
 from artists.base_artist import Artist
 
-from brains.brain_ollama import OllamaBrain
-from brains.brain_gemini import GeminiBrain
-from artists.artist_fooocus import FooocusArtist
-from artists.artist_banana import BananaArtist
-
 from core.csv_manager import AdobeCsvManager
+from core.journal import JobJournal, JobState
+from core.metrics import MetricsExporter, metrics
+from core.registry import create_artist, create_brain
 
-from core.services import ServerRunner
+from core import transport
 
+from core.pipeline.base import BasePipeline, JobConfig
+from core.pipeline.batch import IdeaBuffer
+from core.pipeline.engine import PipelinedExecutor
+from core.pipeline.journaled import JournaledPipeline
 from core.pipeline.meta import MetaPipeline, MetaJobConfig
 from core.pipeline.wildcard import WildcardPipeline, WildcardConfig
+from prompts.wildcard_graph import WildcardGraphError
 from prompts.wildcard_manager import WildcardResolver
+from prompts.wildcard_sampling import derive_seed
+from prompts.wildcard_space import IndexPermutation
+from prompts.file_cache import file_cache
 from prompts.instruction_manager import InstructionManager
 from prompts.config_manager import ConfigManager
-from prompts.prompt_manager import MetaPromptManager, NicheManager
+from prompts.prompt_manager import MetaPromptManager, Niche, NicheManager
 from logging_system.logger_config import app_logger
 from logging_system.prompt_logger import PromptLogManager
 
+# the backends, the asyncio engine and the server runner are imported when
+# used, so a run only loads what its settings need
+if TYPE_CHECKING:
+	from core.pipeline.async_engine import AsyncPipelineRunner
+
 
 def formatted_datetime() -> str:
 	return datetime.now().strftime("%m%d%H%M%S")
 
 
 def get_workers() -> tuple[Brain, Artist]:
-	brain: Brain
-	if settings.active_brain == BrainType.OLLAMA:
-		brain = OllamaBrain(config=settings.ollama.model_dump())
-	elif settings.active_brain == BrainType.GEMINI:
-		brain = GeminiBrain(config=settings.gemini.model_dump())
-	else:
-		app_logger.error(f"Unknown brain {settings.active_brain}!")
-		exit(1)
+	try:
+		brain: Brain = create_brain(settings.active_brain)
 
-	artist: Artist
-	if settings.active_artist == ArtistType.BANANA:
-		artist = BananaArtist(config=settings.banana.model_dump())
-	elif settings.active_artist == ArtistType.FOOOCUS:
-		artist = FooocusArtist(config=settings.fooocus.model_dump())
-	else:
-		app_logger.error(f"Unknown artist {settings.active_artist}!")
+		artist: Artist
+		if settings.active_artist == ArtistType.FOOOCUS and settings.fooocus.urls:
+			from artists.artist_pool import ArtistPool
+
+			artist = ArtistPool.from_fooocus_config(settings.fooocus.model_dump())
+		else:
+			artist = create_artist(settings.active_artist)
+	except ValueError as e:
+		app_logger.error(str(e))
 		exit(1)
 
 	return brain, artist
 
 
+def get_executor[T: JobConfig](
+	pipeline: BasePipeline[T],
+) -> "PipelinedExecutor[T] | AsyncPipelineRunner[T]":
+	engine = settings.engine
+	if engine.mode == EngineMode.ASYNCIO:
+		from core.pipeline.async_engine import AsyncPipelineRunner
+
+		return AsyncPipelineRunner(
+			pipeline,
+			max_in_flight=engine.max_in_flight,
+			brain_concurrency=engine.brain_concurrency,
+			artist_concurrency=engine.artist_concurrency,
+		)
+
+	return PipelinedExecutor(
+		pipeline,
+		queue_depth=engine.queue_depth,
+		brain_workers=engine.brain_workers,
+		artist_workers=engine.artist_workers,
+	)
+
+
+def plan_job(journal: JobJournal | None, job_key: str, image_name: str) -> str | None:
+	"""
+	Records the job in the journal and returns the image name to use,
+	which is the original one for a resumed job.
+	Returns None if the job was already finished.
+	"""
+	if journal is None:
+		return image_name
+
+	entry = journal.plan(job_key, image_name)
+	if entry.state == JobState.METADATA_WRITTEN:
+		return None
+	return entry.image_name_stem
+
+
+def attach_idea_buffer(idea_buffer: IdeaBuffer, journal: JobJournal | None) -> None:
+	"""Journals the batched ideas, and restores those of a resumed run."""
+	if journal is None:
+		return
+	n_restored: int = idea_buffer.attach(journal)
+	if n_restored:
+		app_logger.info(f"♻️ Restored {n_restored} journaled batched ideas.")
+
+
+def with_journal[T: JobConfig](
+	pipeline: BasePipeline[T], journal: JobJournal | None
+) -> BasePipeline[T]:
+	if journal is None:
+		return pipeline
+	return JournaledPipeline(pipeline, journal)
+
+
 def run_meta_pipeline(
 	brain: Brain,
 	artist: Artist,
 	csv_manager: AdobeCsvManager,
 	n_image_per_niche: int = 1,
+	journal: JobJournal | None = None,
 ) -> None:
 	meta_prompt_manager = MetaPromptManager(settings.meta_prompts_path)
-	pipeline = MetaPipeline(brain, artist, csv_manager)
-	cfg = ConfigManager(settings.niche_configs_path).get_config()
-
-	for niche_name, meta_prompt in meta_prompt_manager.meta_prompts():
-		for i in range(1, n_image_per_niche + 1):
-			image_name: str = f"{niche_name}_{i}_{formatted_datetime()}"
-			job_config = MetaJobConfig(
-				meta_prompt=meta_prompt,
-				image_name_stem=image_name,
-				paint_config=cfg,
-			)
-			pipeline.run_job(job_config)
+	pipeline = MetaPipeline(
+		brain, artist, csv_manager, batch_size=settings.engine.brain_batch_size
+	)
+	attach_idea_buffer(pipeline.idea_buffer, journal)
+	executor = get_executor(with_journal(pipeline, journal))
+	config_manager = ConfigManager(settings.niche_configs_path)
+
+	def jobs() -> Generator[MetaJobConfig, None, None]:
+		for niche_name, meta_prompt in meta_prompt_manager.meta_prompts():
+			# read per niche, so config edits are picked up during the run
+			cfg: dict[str, Any] = config_manager.get_config()
+			for i in range(1, n_image_per_niche + 1):
+				job_key: str = f"meta/{niche_name}/{i}"
+				image_name: str | None = plan_job(
+					journal, job_key, f"{niche_name}_{i}_{formatted_datetime()}"
+				)
+				if image_name is None:
+					continue
+
+				yield MetaJobConfig(
+					meta_prompt=meta_prompt,
+					image_name_stem=image_name,
+					paint_config=cfg,
+					job_key=job_key,
+					niche=niche_name,
+				)
+
+	stats = executor.run(jobs())
+	executor.close()
+	app_logger.info(f"Meta pipeline finished: {stats}")
+
+
+def combination_order(
+	wildcard_resolver: WildcardResolver, raw_prompt: str, prompt_key: str
+) -> Sequence[int]:
+	"""
+	The order in which the combinations of a prompt are used.
+	The shuffled order is reproducible when WILDCARD_SEED is set.
+	"""
+	size: int = wildcard_resolver.space_size(raw_prompt)
+	if settings.wildcard_mode == WildcardMode.EXHAUSTIVE:
+		return range(size)
+
+	if settings.wildcard_seed is None:
+		seed: int = wildcard_resolver.rng.getrandbits(64)
+	else:
+		seed = derive_seed(settings.wildcard_seed, prompt_key)
+	return IndexPermutation(size, seed)
 
 
 def run_wildcard_pipeline(
@@ -77,12 +186,26 @@ def run_wildcard_pipeline(
 	csv_manager: AdobeCsvManager,
 	prompt_log_manager: PromptLogManager,
 	n_image_per_niche: int = 1,
+	journal: JobJournal | None = None,
 ) -> None:
-	wildcard_resolver = WildcardResolver(settings.wildcards_path)
+	wildcard_resolver = WildcardResolver(
+		settings.wildcards_path,
+		seed=settings.wildcard_seed,
+		mmap_threshold=settings.wildcard_mmap_threshold,
+	)
 	instruction_manager = InstructionManager(settings.instruction_path)
 	config_manager = ConfigManager(settings.niche_configs_path)
 	niche_manager = NicheManager(settings.wildcard_prompts_path, config_manager)
-	default_config = config_manager.get_config()
+
+	# fail before any GPU time is spent on broken wildcards
+	try:
+		wildcard_graph = wildcard_resolver.compile()
+		for niche in niche_manager.niches():
+			wildcard_graph.check_prompts(niche.name, niche.prompts)
+	except WildcardGraphError as e:
+		app_logger.error(f"❌ {e}")
+		exit(1)
+	app_logger.info(f"🕸️ Wildcards compiled:\n{wildcard_graph.summary()}")
 
 	pipeline = WildcardPipeline(
 		brain,
@@ -91,24 +214,131 @@ def run_wildcard_pipeline(
 		wildcard_resolver,
 		instruction_manager,
 		prompt_log_manager,
+		batch_size=settings.engine.brain_batch_size,
 	)
+	attach_idea_buffer(pipeline.idea_buffer, journal)
+	executor = get_executor(with_journal(pipeline, journal))
 
-	for niche in niche_manager.niches():
-		app_logger.info(f"Processing niche: {niche.name}")
-		wildcard_resolver.set_niche(niche.name)
-		merged_config = copy.deepcopy(default_config)
+	n_batch: int = max(settings.engine.brain_batch_size, 1)
+
+	def needs_idea(job_key: str) -> bool:
+		"""False for a resumed job whose idea is in the journal."""
+		if journal is None:
+			return True
+		entry = journal.get(job_key)
+		return entry is None or entry.image_idea is None
+
+	def jobs(niche: Niche) -> Generator[WildcardConfig, None, None]:
+		merged_config: dict[str, Any] = config_manager.get_config()
 		merged_config.update(niche.config)
 
 		for prompt_name, raw_prompt in niche.prompts:
-			for i in range(1, n_image_per_niche + 1):
-				image_name: str = f"{niche.name}_{prompt_name}_{i}_{formatted_datetime()}"
-				job_config = WildcardConfig(
+			n_images: int = n_image_per_niche
+			order: Sequence[int] = ()
+			if settings.wildcard_mode != WildcardMode.RANDOM:
+				prompt_key: str = f"wildcard/{niche.name}/{prompt_name}"
+				try:
+					order = combination_order(wildcard_resolver, raw_prompt, prompt_key)
+				except ValueError as e:
+					app_logger.error(f"❌ Skipping prompt {prompt_name}: {e}")
+					continue
+				app_logger.info(f"🔢 {prompt_name}: {len(order)} combinations")
+				if len(order) < n_images:
+					app_logger.warning(
+						f"Only {len(order)} distinct combinations for {prompt_name}, "
+						f"generating {len(order)} images instead of {n_images}."
+					)
+					n_images = len(order)
+
+			# (job number, job key, image name) of the unfinished jobs
+			planned: list[tuple[int, str, str]] = []
+			for i in range(1, n_images + 1):
+				job_key: str = f"wildcard/{niche.name}/{prompt_name}/{i}"
+				image_name: str | None = plan_job(
+					journal,
+					job_key,
+					f"{niche.name}_{prompt_name}_{i}_{formatted_datetime()}",
+				)
+				if image_name is not None:
+					planned.append((i, job_key, image_name))
+
+			# the combinations of the jobs that still need an idea, a batched
+			# job also offers the next ones to its brain call, which buffers
+			# their ideas (the buffer skips those another call already took)
+			brainstormed: list[int] = []
+			if order:
+				brainstormed = [
+					order[i - 1] for i, job_key, _ in planned if needs_idea(job_key)
+				]
+			positions: dict[int, int] = {c: k for k, c in enumerate(brainstormed)}
+
+			for i, job_key, image_name in planned:
+				combinations: tuple[int, ...] = ()
+				if order:
+					combination: int = order[i - 1]
+					next_position: int = positions.get(combination, -1) + 1
+					combinations = (combination,) + tuple(
+						brainstormed[next_position : next_position + n_batch - 1]
+					)
+
+				yield WildcardConfig(
 					raw_prompt=raw_prompt,
 					image_name_stem=image_name,
 					paint_config=merged_config,
 					llm_instruction="sdxl_instruction",
+					job_key=job_key,
+					niche=niche.name,
+					seed=(
+						None
+						if settings.wildcard_seed is None
+						else derive_seed(settings.wildcard_seed, job_key)
+					),
+					combinations=combinations,
 				)
-				pipeline.run_job(job_config)
+
+	# the niches are read again as the run reaches them, so edits of the
+	# prompts and configs are picked up, a prompt edited into a broken one
+	# skips its niche
+	for niche in niche_manager.niches():
+		try:
+			wildcard_graph.check_prompts(niche.name, niche.prompts)
+		except WildcardGraphError as e:
+			app_logger.error(f"❌ Skipping niche {niche.name}: {e}")
+			continue
+
+		app_logger.info(f"Processing niche: {niche.name}")
+		# the resolver holds the niche wildcards, so the executor is drained
+		# before switching to the next niche
+		wildcard_resolver.set_niche(niche.name)
+		executor.run(jobs(niche))
+
+		# buffered ideas were resolved with this niche's wildcards, the
+		# restored ideas of the other niches are kept for their turn
+		n_dropped: int = pipeline.discard_ideas(niche.name)
+		if n_dropped:
+			app_logger.warning(f"Dropped {n_dropped} unused batched ideas.")
+
+	executor.close()
+	app_logger.info(f"Wildcard pipeline finished: {executor.stats}")
+
+
+def warm_up(brain: Brain, artist: Artist) -> None:
+	"""
+	Loads the brain's and the artist's models at the same time, and reports
+	how long it took, apart from the job timings of the run.
+	"""
+
+	def timed(name: str, warm: Callable[[], bool]) -> str:
+		start: float = time.monotonic()
+		ready: bool = warm()
+		return f"{name} {time.monotonic() - start:.1f}s {'✅' if ready else '❌'}"
+
+	app_logger.info("🔥 Warming up the models...")
+	with ThreadPoolExecutor(max_workers=2, thread_name_prefix="warm-up") as pool:
+		brain_timing = pool.submit(timed, type(brain).__name__, brain.warm_up)
+		artist_timing = pool.submit(timed, type(artist).__name__, artist.warm_up)
+		timings: list[str] = [brain_timing.result(), artist_timing.result()]
+	app_logger.info(f"🔥 Warm-up: {', '.join(timings)}")
 
 
 def run_pipeline(
@@ -117,29 +347,119 @@ def run_pipeline(
 	csv_manager: AdobeCsvManager,
 	prompt_log_manager: PromptLogManager,
 	n_image_per_niche: int = 1,
+	journal: JobJournal | None = None,
 ) -> None:
 	if settings.active_pipeline == PipelineType.META:
-		run_meta_pipeline(brain, artist, csv_manager, n_image_per_niche)
+		run_meta_pipeline(brain, artist, csv_manager, n_image_per_niche, journal)
 	elif settings.active_pipeline == PipelineType.WILDCARD:
 		run_wildcard_pipeline(
-			brain, artist, csv_manager, prompt_log_manager, n_image_per_niche
+			brain,
+			artist,
+			csv_manager,
+			prompt_log_manager,
+			n_image_per_niche,
+			journal,
 		)
 	else:
 		app_logger.error(f"Unknown pipeline {settings.active_pipeline}!")
 		exit(1)
 
 
+def parse_args() -> argparse.Namespace:
+	parser = argparse.ArgumentParser(
+		description="Batch image generation using llms and a image generation AI."
+	)
+	parser.add_argument(
+		"--resume",
+		action="store_true",
+		help="continue the last unfinished run, skipping the finished jobs",
+	)
+	return parser.parse_args()
+
+
 def main() -> None:
+	from core.services import ServerRunner
+
+	args = parse_args()
+	settings.ensure_paths()
 	N_image_per_niche: int = 20
 	brain, artist = get_workers()
 	csv_manager = AdobeCsvManager(filepath=settings.csv_path / "metadata.csv")
 	prompt_log_manager = PromptLogManager(filepath=settings.log_path / "log.csv")
+	journal = JobJournal(settings.csv_path / "journal.sqlite3", resume=args.resume)
 
-	need_fooocus: bool = settings.active_artist == ArtistType.FOOOCUS
+	# a pool of Fooocus servers is managed outside of this machine
+	need_fooocus: bool = (
+		settings.active_artist == ArtistType.FOOOCUS and not settings.fooocus.urls
+	)
 	need_ollama: bool = settings.active_brain == BrainType.OLLAMA
 
-	with ServerRunner(run_ollama=need_ollama, run_fooocus=need_fooocus):
-		run_pipeline(brain, artist, csv_manager, prompt_log_manager, N_image_per_niche)
+	if settings.prompt_watch_interval > 0:
+		file_cache.watch(settings.prompt_watch_interval)
+
+	metrics.set_labels(
+		brain=settings.active_brain.value, artist=settings.active_artist.value
+	)
+	exporter = MetricsExporter(
+		metrics,
+		textfile=settings.metrics.textfile,
+		port=settings.metrics.port,
+		interval=settings.metrics.export_interval,
+	)
+
+	try:
+		exporter.start()
+		with ServerRunner(
+			run_ollama=need_ollama,
+			run_fooocus=need_fooocus,
+			startup_timeout=settings.service_startup_timeout,
+		):
+			if settings.warm_up:
+				warm_up(brain, artist)
+			run_pipeline(
+				brain,
+				artist,
+				csv_manager,
+				prompt_log_manager,
+				N_image_per_niche,
+				journal,
+			)
+	finally:
+		# flush the buffered metadata, even if the run crashed
+		csv_manager.close()
+		prompt_log_manager.close()
+		file_cache.stop_watching()
+		brain.close()
+		exporter.stop()
+
+	counts: dict[JobState, int] = journal.counts()
+	n_unfinished: int = sum(
+		n for state, n in counts.items() if state != JobState.METADATA_WRITTEN
+	)
+	if n_unfinished:
+		# failed jobs stay in the journal, a --resume run retries them
+		app_logger.warning(f"{n_unfinished} jobs unfinished, rerun with --resume.")
+	else:
+		journal.finish_run()
+	journal.close()
+
+	brain_report: str | None = brain.report()
+	if brain_report:
+		app_logger.info(f"🧠 {brain_report}")
+
+	artist_report: str | None = artist.report()
+	if artist_report:
+		app_logger.info(f"🎨 {artist_report}")
+
+	# where the time went, per stage
+	for line in metrics.summary_lines():
+		app_logger.info(f"📊 {line}")
+	if settings.metrics.summary:
+		summary_path = settings.log_path / f"metrics_{formatted_datetime()}.json"
+		metrics.write_summary(summary_path)
+		app_logger.info(f"📊 Metrics summary written to {summary_path}")
+
+	transport.close()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,19 @@
 from pathlib import Path
+import copy
 import json
 from typing import Any
 
+from prompts.file_cache import FileCache, file_cache
+
 
 class ConfigManager:
-	def __init__(self, config_path: Path) -> None:
+	def __init__(self, config_path: Path, cache: FileCache = file_cache) -> None:
+		"""
+		cache: Where the parsed configs are kept, a config is parsed again
+			only when its file changed.
+		"""
 		self.path = config_path
+		self.cache = cache
 
 	def get_config(self, name: str = "default") -> dict[str, Any]:
 		"""Load config for specific niche, fallback to default."""
@@ -24,5 +32,9 @@ class ConfigManager:
 				f"Neither '{name}.json' nor 'default.json' found in {self.path}"
 			)
 
-		with open(config_to_load, mode="r", encoding="utf-8") as file:
-			return dict(json.load(file))
+		# callers update their config, the cached one must stay untouched
+		return copy.deepcopy(self.cache.get(config_to_load, _parse_config))
+
+
+def _parse_config(text: str) -> dict[str, Any]:
+	return dict(json.loads(text))
@@ -0,0 +1,114 @@
+import os
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, cast
+
+
+type Signature = tuple[int, int, int]
+
+
+def _signature(path: Path) -> Signature:
+	stat: os.stat_result = path.stat()
+	return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+@dataclass(frozen=True, slots=True)
+class _Entry:
+	signature: Signature
+	value: Any
+
+
+class FileCache:
+	"""
+	Parsed contents of text files, keyed by path.
+
+	By default every get stats the file and rereads it only if its mtime,
+	size or inode changed. In watcher mode (see watch) a background thread
+	does the stat calls every `interval` seconds instead, and a get of a
+	cached file doesn't touch the disk at all.
+	"""
+
+	def __init__(self) -> None:
+		self._entries: dict[Path, _Entry] = {}
+		self._lock = threading.Lock()
+		self._stop = threading.Event()
+		self._watcher: threading.Thread | None = None
+
+	@property
+	def watching(self) -> bool:
+		return self._watcher is not None
+
+	def get[T](self, path: Path, parse: Callable[[str], T]) -> T:
+		"""
+		The parsed content of the file, reread only if it changed.
+		A path must always be read with the same parse function.
+		Raises:
+			OSError: If the file can't be read (e.g. it was deleted).
+		"""
+		entry: _Entry | None = self._entries.get(path)
+		if entry is not None and self.watching:
+			return cast(T, entry.value)
+
+		try:
+			signature: Signature = _signature(path)
+		except OSError:
+			self.invalidate(path)
+			raise
+		if entry is not None and entry.signature == signature:
+			return cast(T, entry.value)
+
+		value: T = parse(path.read_text(encoding="utf-8"))
+		with self._lock:
+			self._entries[path] = _Entry(signature, value)
+		return value
+
+	def invalidate(self, path: Path) -> None:
+		with self._lock:
+			self._entries.pop(path, None)
+
+	def refresh(self) -> list[Path]:
+		"""Drops the cached files that changed on disk, and returns them."""
+		with self._lock:
+			entries: list[tuple[Path, _Entry]] = list(self._entries.items())
+
+		changed: list[Path] = []
+		for path, entry in entries:
+			try:
+				if _signature(path) == entry.signature:
+					continue
+			except OSError:
+				pass
+			changed.append(path)
+
+		with self._lock:
+			for path in changed:
+				self._entries.pop(path, None)
+		return changed
+
+	def watch(self, interval: float) -> None:
+		"""Starts the watcher thread, which refreshes every interval seconds."""
+		if self._watcher is not None:
+			return
+		self._stop.clear()
+		self._watcher = threading.Thread(
+			target=self._watch, args=(interval,), name="file-cache-watcher", daemon=True
+		)
+		self._watcher.start()
+
+	def _watch(self, interval: float) -> None:
+		while not self._stop.wait(interval):
+			for path in self.refresh():
+				print(f"🔄 {path} changed, it will be reloaded.")
+
+	def stop_watching(self) -> None:
+		if self._watcher is None:
+			return
+		self._stop.set()
+		self._watcher.join()
+		self._watcher = None
+
+
+# shared by the prompt, config and instruction managers
+file_cache = FileCache()
@@ -1,13 +1,19 @@
 from pathlib import Path
 
+from prompts.file_cache import FileCache, file_cache
+
 
 class InstructionManager:
-	"""Manages loading instructions from files."""
+	"""
+	Manages loading instructions from files.
+	Instructions are read on first use and reread when their file changes.
+	"""
 
-	def __init__(self, instructions_path: Path) -> None:
+	def __init__(self, instructions_path: Path, cache: FileCache = file_cache) -> None:
 		"""
 		Args:
 			instructions_path: Path to the directory containing instruction files.
+			cache: Where the instructions are kept between reads.
 		Raises:
 			ValueError: If instructions_path is not a valid directory.
 		"""
@@ -18,18 +24,7 @@ class InstructionManager:
 			)
 
 		self.path = instructions_path
-		self._instructions: dict[str, str] = {}
-		self._load_instructions()
-
-	def _load_instructions(self) -> None:
-		"""Loads all .txt files from the instructions directory."""
-		for filepath in self.path.glob("*.txt"):
-			instruction_name = filepath.stem
-			try:
-				with filepath.open(mode="r", encoding="utf-8") as file:
-					self._instructions[instruction_name] = file.read()
-			except (IOError, UnicodeDecodeError) as e:
-				print(f"Could not read or decode instruction file {filepath}: {e}")
+		self.cache = cache
 
 	def get_instruction(self, name: str) -> str | None:
 		"""
@@ -41,4 +36,12 @@ class InstructionManager:
 		Returns:
 			The instruction string, or None if not found.
 		"""
-		return self._instructions.get(name)
+		filepath: Path = self.path / f"{name}.txt"
+		if not filepath.is_file():
+			return None
+
+		try:
+			return self.cache.get(filepath, str)
+		except (IOError, UnicodeDecodeError) as e:
+			print(f"Could not read or decode instruction file {filepath}: {e}")
+			return None
@@ -5,13 +5,16 @@ from typing import Any
 from pydantic import BaseModel, Field
 
 from prompts.config_manager import ConfigManager
+from prompts.file_cache import FileCache, file_cache
 
 
 class MetaPromptManager:
-	def __init__(self, meta_prompts_path: Path) -> None:
+	def __init__(self, meta_prompts_path: Path, cache: FileCache = file_cache) -> None:
 		"""
 		meta_prompts_path: Path to directory containing meta-prompt files,
 		where each file contains a complete meta-prompt.
+		cache: Where the prompts are kept, a prompt file is reread only when
+			it changed.
 
 		Raises:
 			ValueError: If meta_prompts_path is not a valid directory.
@@ -21,14 +24,14 @@ class MetaPromptManager:
 				f"meta_prompts_path must be a valid directory: {meta_prompts_path}"
 			)
 		self.path = meta_prompts_path
+		self.cache = cache
 
 	def meta_prompts(self) -> Generator[tuple[str, str], None, None]:
 		for prompt_path in sorted(self.path.iterdir()):
 			if prompt_path.suffix != ".txt":
 				continue
 
-			with open(prompt_path, mode="r", encoding="utf-8") as file:
-				prompt: str = file.read()
+			prompt: str = self.cache.get(prompt_path, str)
 
 			niche_name: str = prompt_path.stem
 
@@ -36,16 +39,16 @@ class MetaPromptManager:
 
 
 class WildcardPromptManager:
-	def __init__(self, prompts_path: Path) -> None:
+	def __init__(self, prompts_path: Path, cache: FileCache = file_cache) -> None:
 		self.path = prompts_path
+		self.cache = cache
 
 	def prompts(self) -> Generator[tuple[str, str], None, None]:
 		for prompt_path in sorted(self.path.iterdir()):
 			if prompt_path.suffix != ".txt":
 				continue
 
-			with open(prompt_path, mode="r", encoding="utf-8") as file:
-				raw_prompt: str = file.read()
+			raw_prompt: str = self.cache.get(prompt_path, str)
 
 			niche_name: str = prompt_path.stem
 
@@ -61,9 +64,19 @@ class Niche(BaseModel):
 
 
 class NicheManager:
-	def __init__(self, niche_path: Path, config_manager: ConfigManager) -> None:
+	def __init__(
+		self,
+		niche_path: Path,
+		config_manager: ConfigManager,
+		cache: FileCache = file_cache,
+	) -> None:
+		"""
+		cache: Where the prompts are kept, so iterating the niches again only
+			rereads the prompt files that changed.
+		"""
 		self.path = niche_path
 		self.config_manager = config_manager
+		self.cache = cache
 
 	def niches(self) -> Generator[Niche, None, None]:
 		for niche_dir in sorted(self.path.iterdir()):
@@ -75,11 +88,8 @@ class NicheManager:
 
 			prompts: list[tuple[str, str]] = []
 			for prompt_file in sorted(niche_dir.glob("*.txt")):
-				with open(prompt_file, mode="r", encoding="utf-8") as file:
-					prompt_name: str = prompt_file.stem
-					prompts.append(
-						(prompt_name, file.read())
-					)
+				prompt_name: str = prompt_file.stem
+				prompts.append((prompt_name, self.cache.get(prompt_file, str)))
 
 			if not prompts:
 				print(f"Warning: Niche '{niche_name}' has no prompts, skipping.")
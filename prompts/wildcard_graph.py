@@ -0,0 +1,250 @@
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+
+from prompts.wildcard_sampling import WildcardEntries
+from prompts.wildcard_store import MappedWildcardFile
+from prompts.wildcard_template import Template, compile_template
+
+
+# how deep wildcards may be nested inside other wildcards
+MAX_NESTING_DEPTH = 20
+
+
+class WildcardGraphError(ValueError):
+	"""The wildcards have cycles, unknown names or are nested too deep."""
+
+	def __init__(self, problems: list[str]) -> None:
+		self.problems = problems
+		details: str = "\n".join(f"  - {problem}" for problem in problems)
+		super().__init__(f"Invalid wildcards:\n{details}")
+
+
+@dataclass(frozen=True, slots=True)
+class WildcardSpace:
+	"""
+	Number of expansions of a wildcard and, when some of its lines expand
+	further, the cumulative expansions per line (None: one per line).
+	"""
+
+	size: int
+	cumulative: list[int] | None
+
+
+def wildcard_references(entries: WildcardEntries) -> frozenset[str]:
+	"""Names of the wildcards used by the lines of a wildcard."""
+	lines = entries.lines
+	if isinstance(lines, MappedWildcardFile) and not lines.contains(b"__"):
+		# big plain text files are skipped without decoding them
+		return frozenset()
+
+	names: set[str] = set()
+	for line in lines:
+		if "__" in line:
+			names.update(compile_template(line).references)
+	return frozenset(names)
+
+
+def measure_space(
+	entries: WildcardEntries, template_size: Callable[[Template], int]
+) -> WildcardSpace:
+	"""Counts the expansions of every line of a wildcard."""
+	cumulative: list[int] = []
+	total: int = 0
+	for line in entries:
+		total += template_size(compile_template(line)) if "__" in line else 1
+		cumulative.append(total)
+
+	return WildcardSpace(total, None if total == len(entries) else cumulative)
+
+
+@dataclass
+class ScopeGraph:
+	"""The compiled wildcards seen by one niche (or the common ones)."""
+
+	references: dict[str, frozenset[str]]
+	spaces: dict[str, WildcardSpace]
+	# how many levels of wildcards are nested below each wildcard
+	depths: dict[str, int]
+
+	def template_size(self, template: Template) -> int:
+		size: int = 1
+		for name in template.references:
+			if name in self.spaces:
+				size *= self.spaces[name].size
+		return size
+
+	def prompt_problems(self, raw_prompt: str) -> list[str]:
+		template: Template = compile_template(raw_prompt)
+		problems: list[str] = []
+		for name in sorted(set(template.references)):
+			if name not in self.spaces:
+				problems.append(f"unknown wildcard __{name}__")
+			elif self.depths[name] >= MAX_NESTING_DEPTH:
+				problems.append(f"__{name}__ is nested too deep")
+		return problems
+
+
+@dataclass
+class WildcardGraph:
+	"""Compiled wildcards of the common directory and of every niche."""
+
+	common: ScopeGraph
+	niches: dict[str, ScopeGraph] = field(default_factory=dict)
+
+	def scope(self, niche_name: str | None) -> ScopeGraph:
+		if niche_name and niche_name in self.niches:
+			return self.niches[niche_name]
+		return self.common
+
+	def check_prompts(
+		self, niche_name: str | None, prompts: Iterable[tuple[str, str]]
+	) -> None:
+		"""
+		Raises:
+			WildcardGraphError: If a prompt uses a wildcard that doesn't exist.
+		"""
+		scope = self.scope(niche_name)
+		problems: list[str] = [
+			f"{niche_name or 'common'}/{prompt_name}: {problem}"
+			for prompt_name, raw_prompt in prompts
+			for problem in scope.prompt_problems(raw_prompt)
+		]
+		if problems:
+			raise WildcardGraphError(problems)
+
+	def summary(self) -> str:
+		"""One line per scope: wildcards, deepest nesting, biggest space."""
+		lines: list[str] = []
+		scopes = [("common", self.common), *sorted(self.niches.items())]
+		for label, scope in scopes:
+			line: str = f"{label}: {len(scope.spaces)} wildcards"
+			if scope.spaces:
+				biggest = max(scope.spaces, key=lambda name: scope.spaces[name].size)
+				line += (
+					f", nesting depth {max(scope.depths.values())}"
+					f", largest __{biggest}__ ({scope.spaces[biggest].size} expansions)"
+				)
+			lines.append(line)
+		return "\n".join(lines)
+
+
+def _compile_scope(
+	label: str,
+	wildcards: Mapping[str, WildcardEntries],
+	references_of: Callable[[WildcardEntries], frozenset[str]],
+	problems: list[str],
+	base: ScopeGraph | None = None,
+	overrides: frozenset[str] = frozenset(),
+) -> ScopeGraph:
+	"""
+	Checks and measures the wildcards of one scope, appending what's wrong
+	to problems. The wildcards of `base` that don't depend on `overrides`
+	are reused as they are.
+	"""
+	references: dict[str, frozenset[str]] = {
+		name: references_of(entries) for name, entries in wildcards.items()
+	}
+	graph = ScopeGraph(references, {}, {})
+	n_problems: int = len(problems)
+
+	for name in sorted(references):
+		for unknown in sorted(references[name] - references.keys()):
+			problems.append(f"{label}: __{name}__ uses unknown wildcard __{unknown}__")
+
+	# depth first search, a reference to a wildcard on the stack is a cycle
+	visiting: list[str] = []
+	visited: set[str] = set()
+
+	def visit(name: str) -> None:
+		visiting.append(name)
+		for ref in sorted(references[name] & references.keys()):
+			if ref in visiting:
+				cycle = visiting[visiting.index(ref) :] + [ref]
+				problems.append(
+					f"{label}: cycle " + " -> ".join(f"__{n}__" for n in cycle)
+				)
+			elif ref not in visited:
+				visit(ref)
+		visiting.pop()
+		visited.add(name)
+
+	for name in sorted(references):
+		if name not in visited:
+			visit(name)
+
+	if len(problems) > n_problems:
+		return graph
+
+	affected: dict[str, bool] = {}
+
+	def depends_on_overrides(name: str) -> bool:
+		if name not in affected:
+			affected[name] = name in overrides or any(
+				depends_on_overrides(ref) for ref in references[name]
+			)
+		return affected[name]
+
+	def measure(name: str) -> None:
+		if name in graph.spaces:
+			return
+		for ref in references[name]:
+			measure(ref)
+
+		graph.depths[name] = 1 + max(
+			(graph.depths[ref] for ref in references[name]), default=-1
+		)
+		if base is not None and not depends_on_overrides(name):
+			graph.spaces[name] = base.spaces[name]
+		elif not references[name]:
+			graph.spaces[name] = WildcardSpace(len(wildcards[name]), None)
+		else:
+			graph.spaces[name] = measure_space(wildcards[name], graph.template_size)
+
+	for name in sorted(references):
+		measure(name)
+		if graph.depths[name] >= MAX_NESTING_DEPTH:
+			problems.append(
+				f"{label}: __{name}__ nests {graph.depths[name]} levels of "
+				f"wildcards, the limit is {MAX_NESTING_DEPTH - 1}"
+			)
+
+	return graph
+
+
+def compile_wildcard_graph(
+	common: Mapping[str, WildcardEntries],
+	niches: Mapping[str, Mapping[str, WildcardEntries]],
+) -> WildcardGraph:
+	"""
+	Builds the reference graph of the common wildcards and of every niche
+	(its own wildcards over the common ones), then measures every wildcard.
+	Raises:
+		WildcardGraphError: With every cycle, unknown name and too deep
+			nesting that was found.
+	"""
+	# the references only depend on the lines, not on the scope
+	cache: dict[int, frozenset[str]] = {}
+
+	def references_of(entries: WildcardEntries) -> frozenset[str]:
+		if id(entries) not in cache:
+			cache[id(entries)] = wildcard_references(entries)
+		return cache[id(entries)]
+
+	problems: list[str] = []
+	graph = WildcardGraph(_compile_scope("common", common, references_of, problems))
+	if problems:
+		raise WildcardGraphError(problems)
+
+	for niche_name, niche_wildcards in sorted(niches.items()):
+		graph.niches[niche_name] = _compile_scope(
+			niche_name,
+			{**common, **niche_wildcards},
+			references_of,
+			problems,
+			base=graph.common,
+			overrides=frozenset(niche_wildcards),
+		)
+
+	if problems:
+		raise WildcardGraphError(problems)
+	return graph
@@ -1,7 +1,21 @@
+import bisect
 import random
-import re
+from collections import ChainMap
+from collections.abc import Iterator, Mapping
 from pathlib import Path
 
+from prompts.wildcard_graph import (
+	MAX_NESTING_DEPTH,
+	WildcardGraph,
+	WildcardSpace,
+	compile_wildcard_graph,
+	measure_space,
+)
+from prompts.wildcard_sampling import WildcardEntries
+from prompts.wildcard_space import IndexPermutation
+from prompts.wildcard_store import MappedWildcardFile
+from prompts.wildcard_template import Template, WildcardRef, compile_template
+
 
 class WildcardResolver:
 	"""
@@ -12,104 +26,287 @@ class WildcardResolver:
 
 	Wildcards are loaded from a base directory. Niche-specific wildcards can be
 	loaded from subdirectories, which will override the base wildcards.
+
+	Files bigger than `mmap_threshold` bytes are not read into memory, they are
+	memory-mapped with an offset index instead (see MappedWildcardFile).
+
+	A line can carry a weight, like `0.3::golden hour` (the default is 1).
+	Weighted wildcards are sampled in O(1) with an alias table.
+
+	Each resolver draws from its own random generator, and a resolve can be
+	given its own generator (e.g. seeded per job), so resolving from several
+	threads stays reproducible.
+
+	Instead of random draws, the combinations of a prompt can also be
+	enumerated, exhaustively or shuffled, so none of them is used twice
+	(see space_size and combinations). Weights don't apply there.
+
+	compile() checks every wildcard upfront and precomputes the sizes of
+	their combination spaces (see WildcardGraph).
 	"""
 
-	def __init__(self, wildcards_path: Path, seed: int | None = None) -> None:
+	def __init__(
+		self,
+		wildcards_path: Path,
+		seed: int | None = None,
+		mmap_threshold: int = 1 << 20,
+	) -> None:
 		"""
 		wildcards_path: Path to directory containing wildcard files.
 			It searches for .txt files in the base directory and in niche-specific
 			subdirectories.
+		mmap_threshold: Size in bytes from which a wildcard file is mapped.
 		Raises:
 			ValueError: If wildcards_path is not a valid directory.
 		"""
-		if seed is not None:
-			random.seed(seed)
+		self.rng = random.Random(seed)
 
 		if not wildcards_path.is_dir():
 			raise ValueError(
 				f"wildcards_path must be a valid directory: {wildcards_path}"
 			)
 		self.path = wildcards_path
-		self._wildcards: dict[str, list[str]] = {}
+		self.mmap_threshold = mmap_threshold
+		self._wildcards: Mapping[str, WildcardEntries] = {}
 		self._common_wildcards = self._load_wildcards_from_path(self.path)
+		# niche wildcards are loaded once, when the niche is first used
+		self._niche_wildcards: dict[str, dict[str, WildcardEntries]] = {}
+		self.graph: WildcardGraph | None = None
+		# combination spaces of the wildcards of the current niche
+		self._spaces: dict[str, WildcardSpace] = {}
+		self.niche: str | None = None
 		self.set_niche(None)
 
 	def set_seed(self, seed: int | None = None) -> None:
 		"""
-		Sets the random seed for wildcard resolution.
+		Sets the random seed of this resolver's generator.
 		Args:
 			seed: The seed value to set.
 				If None, the random generator acts randomly.
 		"""
-		random.seed(seed)
+		self.rng.seed(seed)
 
 	def set_niche(self, niche_name: str | None) -> None:
 		"""
 		Sets the current niche, loading niche-specific wildcards.
 
 		Niche wildcards override common wildcards if they share the same name.
+		The override is a layered view, the common wildcards are never copied.
 		If niche_name is None, only common wildcards are used.
 
 		Args:
 			niche_name: The name of the niche, corresponding to a subdirectory.
 		"""
-		self._wildcards = self._common_wildcards.copy()
-		if niche_name:
+		self.niche = niche_name or None
+		self._spaces = {} if self.graph is None else self.graph.scope(self.niche).spaces
+		if not niche_name:
+			self._wildcards = self._common_wildcards
+			return
+
+		self._wildcards = ChainMap(self._load_niche(niche_name), self._common_wildcards)
+
+	def _load_niche(self, niche_name: str) -> dict[str, WildcardEntries]:
+		"""The wildcards of a niche subdirectory, loaded on first use."""
+		if niche_name not in self._niche_wildcards:
 			niche_path = self.path / niche_name
 			if niche_path.is_dir():
 				niche_wildcards = self._load_wildcards_from_path(niche_path)
-				self._wildcards.update(niche_wildcards)
 			else:
 				print(f"Warning: Niche directory not found: {niche_path}")
+				niche_wildcards = {}
+			self._niche_wildcards[niche_name] = niche_wildcards
+		return self._niche_wildcards[niche_name]
+
+	def compile(self) -> WildcardGraph:
+		"""
+		Loads the wildcards of every niche subdirectory and compiles the
+		reference graph of all of them. From then on, the combination spaces
+		are taken from the graph instead of being measured on the fly.
+		Raises:
+			WildcardGraphError: On cycles, unknown names or too deep nesting.
+		"""
+		niches = {
+			niche_path.name: self._load_niche(niche_path.name)
+			for niche_path in sorted(self.path.iterdir())
+			if niche_path.is_dir()
+		}
+		self.graph = compile_wildcard_graph(self._common_wildcards, niches)
+		self.set_niche(self.niche)
+		return self.graph
 
 	def _get_wildcard_files(self, path: Path) -> list[Path]:
 		"""Gets all .txt files directly under the given path."""
 		return [f for f in path.iterdir() if f.is_file() and f.suffix == ".txt"]
 
-	def _load_wildcards_from_path(
-		self, path: Path
-	) -> dict[str, list[str]]:
+	def _load_wildcards_from_path(self, path: Path) -> dict[str, WildcardEntries]:
 		"""Loads all wildcards from .txt files in a given directory."""
-		wildcards: dict[str, list[str]] = {}
+		wildcards: dict[str, WildcardEntries] = {}
 		for filepath in self._get_wildcard_files(path):
 			wildcard_name = filepath.stem
 			try:
+				if filepath.stat().st_size >= self.mmap_threshold:
+					mapped = MappedWildcardFile(filepath)
+					if len(mapped):
+						wildcards[wildcard_name] = WildcardEntries(
+							mapped, mapped.weights
+						)
+					continue
+
 				with filepath.open(mode="r", encoding="utf-8") as f:
 					lines = [line.strip() for line in f.readlines() if line.strip()]
 
 				if lines:
-					wildcards[wildcard_name] = lines
-			except (IOError, UnicodeDecodeError) as e:
+					wildcards[wildcard_name] = WildcardEntries.from_raw_lines(lines)
+			except (IOError, UnicodeDecodeError, ValueError) as e:
 				print(f"Could not read or decode wildcard file {filepath}: {e}")
 		return wildcards
 
-	def _replacer(self, match: re.Match[str]) -> str:
-		wildcard_name = match.group(1)
-		if wildcard_name in self._wildcards:
-			return random.choice(self._wildcards[wildcard_name])
-		return ""
+	def _expand(
+		self, template: Template, depth: int, parts: list[str], rng: random.Random
+	) -> bool:
+		"""
+		Appends the resolved text of the template to parts.
+		Returns False if the nesting limit was hit somewhere in the tree.
+		"""
+		complete = True
+		for segment in template.segments:
+			if not isinstance(segment, WildcardRef):
+				parts.append(segment)
+				continue
+
+			choices = self._wildcards.get(segment.name)
+			if choices is None:
+				# unknown wildcards resolve to nothing
+				continue
+
+			if depth >= MAX_NESTING_DEPTH:
+				parts.append(f"__{segment.name}__")
+				complete = False
+				continue
 
-	def resolve(self, raw_prompt: str) -> str:
+			line: str = choices.choose(rng)
+			if "__" not in line:
+				# most lines are plain text, no need to compile them
+				parts.append(line)
+				continue
+
+			complete &= self._expand(compile_template(line), depth + 1, parts, rng)
+
+		return complete
+
+	def resolve(self, raw_prompt: str, rng: random.Random | None = None) -> str:
 		"""
 		Resolves wildcards in the given raw prompt by replacing
 		wildcard placeholders with random choices from corresponding files.
 
+		The prompt (and every wildcard line) is compiled once into a template,
+		so a resolve is one walk over the template tree.
+
 		Args:
 			raw_prompt: The prompt containing wildcard placeholders.
+			rng: The random generator to draw from, the resolver's one if None.
+		"""
+		parts: list[str] = []
+		if not self._expand(compile_template(raw_prompt), 0, parts, rng or self.rng):
+			print(f"Warning: Wildcard recursion limit reached for prompt: {raw_prompt}")
+
+		return "".join(parts)
+
+	def _wildcard_space(
+		self, name: str, choices: WildcardEntries, depth: int
+	) -> WildcardSpace:
+		space = self._spaces.get(name)
+		if space is not None:
+			return space
+
+		# not compiled, measured on first use
+		if depth >= MAX_NESTING_DEPTH:
+			raise ValueError(f"Wildcard __{name}__ is nested too deep to enumerate.")
+
+		space = measure_space(
+			choices, lambda template: self._template_size(template, depth + 1)
+		)
+		self._spaces[name] = space
+		return space
+
+	def _template_size(self, template: Template, depth: int) -> int:
+		size: int = 1
+		for name in template.references:
+			choices = self._wildcards.get(name)
+			if choices is not None:
+				size *= self._wildcard_space(name, choices, depth).size
+		return size
+
+	def _unrank(
+		self, template: Template, index: int, depth: int, parts: list[str]
+	) -> None:
+		"""
+		Appends the expansion number `index` of the template to parts.
+		The references are the digits of a mixed radix number, the first
+		reference being the least significant one.
 		"""
-		resolved_prompt: str = raw_prompt
+		for segment in template.segments:
+			if not isinstance(segment, WildcardRef):
+				parts.append(segment)
+				continue
 
-		for _ in range(20):  # recursion limit
-			if "__" not in resolved_prompt:
-				break
+			choices = self._wildcards.get(segment.name)
+			if choices is None:
+				continue
 
-			previous_prompt = resolved_prompt
-			resolved_prompt = re.sub(r"__(.*?)__", self._replacer, resolved_prompt)
+			space = self._wildcard_space(segment.name, choices, depth)
+			index, digit = divmod(index, space.size)
+			cumulative = space.cumulative
+			if cumulative is None:
+				line: str = choices[digit]
+			else:
+				line_number: int = bisect.bisect_right(cumulative, digit)
+				line = choices[line_number]
+				if line_number:
+					digit -= cumulative[line_number - 1]
+				if "__" in line:
+					self._unrank(compile_template(line), digit, depth + 1, parts)
+					continue
+			parts.append(line)
 
-			# This prevents infinite loops for non-existent wildcards.
-			if previous_prompt == resolved_prompt:
-				break
-		else:
-			print(f"Warning: Wildcard recursion limit reached for prompt: {raw_prompt}")
+	def space_size(self, raw_prompt: str) -> int:
+		"""
+		Number of distinct combinations the prompt expands to, with the
+		wildcards of the current niche.
+		Raises:
+			ValueError: If wildcards are nested deeper than MAX_NESTING_DEPTH.
+		"""
+		return self._template_size(compile_template(raw_prompt), 0)
+
+	def combination(self, raw_prompt: str, index: int) -> str:
+		"""
+		The combination number `index` of the prompt, 0 <= index < space_size.
+		Raises:
+			IndexError: If the index is out of the combination space.
+			ValueError: If wildcards are nested deeper than MAX_NESTING_DEPTH.
+		"""
+		if not 0 <= index < self.space_size(raw_prompt):
+			raise IndexError(f"No combination {index} for prompt: {raw_prompt}")
+
+		parts: list[str] = []
+		self._unrank(compile_template(raw_prompt), index, 0, parts)
+		return "".join(parts)
+
+	def combinations(
+		self, raw_prompt: str, shuffle: bool = True, seed: int | None = None
+	) -> Iterator[str]:
+		"""
+		Lazily yields every combination of the prompt exactly once.
+		Args:
+			shuffle: Yield them in a pseudo-random order, else in index order.
+			seed: Seeds the shuffled order, drawn from the resolver if None.
+		"""
+		size: int = self.space_size(raw_prompt)
+		order: IndexPermutation | range = range(size)
+		if shuffle:
+			if seed is None:
+				seed = self.rng.getrandbits(64)
+			order = IndexPermutation(size, seed)
 
-		return resolved_prompt
+		for index in order:
+			yield self.combination(raw_prompt, index)
@@ -0,0 +1,106 @@
+import hashlib
+import random
+import re
+from collections.abc import Sequence
+from typing import overload
+
+
+# "0.3::golden hour" gives the line a weight of 0.3, the default is 1
+WEIGHT_PATTERN = re.compile(r"^\s*(\d+(?:\.\d*)?|\.\d+)\s*::(.*)$", re.DOTALL)
+
+
+def parse_weighted_line(line: str) -> tuple[float, str]:
+	"""Splits a wildcard line into its weight and its text."""
+	match = WEIGHT_PATTERN.match(line)
+	if match is None:
+		return 1.0, line.strip()
+	return float(match.group(1)), match.group(2).strip()
+
+
+def derive_seed(base_seed: int, key: str) -> int:
+	"""
+	A stable 64 bit seed for one job, derived from the run seed and the
+	job key, so every job gets its own reproducible random stream.
+	"""
+	digest = hashlib.blake2b(f"{base_seed}:{key}".encode(), digest_size=8).digest()
+	return int.from_bytes(digest, "little")
+
+
+class AliasTable:
+	"""
+	Walker's alias method (Vose's variant): O(n) to build, then every
+	weighted sample costs one randrange and one random call.
+	"""
+
+	def __init__(self, weights: Sequence[float]) -> None:
+		"""
+		Raises:
+			ValueError: If there are no weights, or they are negative or all zero.
+		"""
+		n: int = len(weights)
+		total: float = float(sum(weights))
+		if n == 0 or total <= 0 or min(weights) < 0:
+			raise ValueError("Weights must be non-negative, with a positive sum.")
+
+		self.probability: list[float] = [0.0] * n
+		self.alias: list[int] = [0] * n
+
+		scaled: list[float] = [w * n / total for w in weights]
+		small: list[int] = [i for i, p in enumerate(scaled) if p < 1.0]
+		large: list[int] = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+		while small and large:
+			less, more = small.pop(), large.pop()
+			self.probability[less] = scaled[less]
+			self.alias[less] = more
+			scaled[more] = scaled[more] + scaled[less] - 1.0
+			(small if scaled[more] < 1.0 else large).append(more)
+
+		# leftovers are 1 up to floating point errors
+		for i in large + small:
+			self.probability[i] = 1.0
+
+	def __len__(self) -> int:
+		return len(self.probability)
+
+	def sample(self, rng: random.Random) -> int:
+		"""Index of a weighted random entry."""
+		i: int = rng.randrange(len(self.probability))
+		return i if rng.random() < self.probability[i] else self.alias[i]
+
+
+class WildcardEntries(Sequence[str]):
+	"""
+	The lines of one wildcard, with an optional alias table when any of them
+	has a weight. Indexing gives the lines without their weight prefix.
+	"""
+
+	def __init__(self, lines: Sequence[str], weights: Sequence[float] | None) -> None:
+		self.lines = lines
+		self.table: AliasTable | None = None
+		if weights is not None and any(w != 1.0 for w in weights):
+			self.table = AliasTable(weights)
+
+	@classmethod
+	def from_raw_lines(cls, raw_lines: Sequence[str]) -> "WildcardEntries":
+		"""Parses the optional `weight::` prefix of every line."""
+		parsed: list[tuple[float, str]] = [parse_weighted_line(ln) for ln in raw_lines]
+		return cls([text for _, text in parsed], [weight for weight, _ in parsed])
+
+	def choose(self, rng: random.Random) -> str:
+		"""A random line, according to the weights if there are any."""
+		if self.table is None:
+			return self.lines[rng.randrange(len(self.lines))]
+		return self.lines[self.table.sample(rng)]
+
+	def __len__(self) -> int:
+		return len(self.lines)
+
+	@overload
+	def __getitem__(self, index: int) -> str: ...
+
+	@overload
+	def __getitem__(self, index: slice) -> Sequence[str]: ...
+
+	def __getitem__(self, index: int | slice) -> str | Sequence[str]:
+		return self.lines[index]
@@ -0,0 +1,65 @@
+import hashlib
+from collections.abc import Iterator, Sequence
+from typing import overload
+
+
+class IndexPermutation(Sequence[int]):
+	"""
+	A seeded pseudo-random bijection of range(size), computed per index.
+
+	It is a small Feistel network over the smallest even number of bits that
+	holds size, plus cycle walking for the values that fall outside the range
+	(at most 3 of 4, so a lookup takes a few rounds on average). Nothing is
+	stored, so it works just as well for spaces of 10**30 combinations.
+	"""
+
+	ROUNDS = 4
+
+	def __init__(self, size: int, seed: int) -> None:
+		if size < 0:
+			raise ValueError("The size of a permutation can't be negative.")
+		self.size = size
+		self._half_bits: int = max((size - 1).bit_length() + 1, 2) // 2
+		self._mask: int = (1 << self._half_bits) - 1
+		self._n_bytes: int = (self._half_bits + 7) // 8
+		self._digest_size: int = min(max(self._n_bytes, 8), 64)
+		self._key: bytes = (seed & (2**64 - 1)).to_bytes(8, "little")
+
+	def _round(self, round_index: int, value: int) -> int:
+		digest = hashlib.blake2b(
+			value.to_bytes(self._n_bytes, "little"),
+			digest_size=self._digest_size,
+			key=self._key,
+			person=round_index.to_bytes(16, "little"),
+		).digest()
+		return int.from_bytes(digest, "little") & self._mask
+
+	def _encrypt(self, value: int) -> int:
+		left, right = value >> self._half_bits, value & self._mask
+		for round_index in range(self.ROUNDS):
+			left, right = right, left ^ self._round(round_index, right)
+		return (left << self._half_bits) | right
+
+	def __len__(self) -> int:
+		return self.size
+
+	@overload
+	def __getitem__(self, position: int) -> int: ...
+
+	@overload
+	def __getitem__(self, position: slice) -> list[int]: ...
+
+	def __getitem__(self, position: int | slice) -> int | list[int]:
+		if isinstance(position, slice):
+			return [self[i] for i in range(self.size)[position]]
+		if not 0 <= position < self.size:
+			raise IndexError("permutation position out of range")
+
+		value: int = self._encrypt(position)
+		while value >= self.size:
+			value = self._encrypt(value)
+		return value
+
+	def __iter__(self) -> Iterator[int]:
+		for position in range(self.size):
+			yield self[position]
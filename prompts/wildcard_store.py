@@ -0,0 +1,170 @@
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Sequence
+from pathlib import Path
+from typing import overload
+
+from prompts.wildcard_sampling import WEIGHT_PATTERN
+
+
+# magic, mtime_ns and size of the indexed file, if it has weights, and the
+# number of lines (a truncated index doesn't match it)
+_INDEX_HEADER = struct.Struct("<8sQQ?Q")
+_INDEX_MAGIC = b"WCIDX003"
+
+
+class MappedWildcardFile(Sequence[str]):
+	"""
+	The non-empty lines of a wildcard file, read from a memory map.
+
+	Instead of holding every line as a Python string, it keeps the start and
+	end offset of each line in an array, so picking a line is an O(1) lookup
+	plus decoding only that line. The offset index is cached on disk next to
+	the file (`<name>.txt.idx`) and rebuilt when the file changes.
+
+	Lines with a `weight::` prefix are indexed past the prefix, and their
+	weights are kept in `weights` (None when no line has one).
+	"""
+
+	def __init__(self, path: Path) -> None:
+		"""
+		Raises:
+			ValueError: If the file is empty (an empty file can't be mapped).
+		"""
+		self.path = path
+		stat = path.stat()
+		if stat.st_size == 0:
+			raise ValueError(f"Cannot map an empty wildcard file: {path}")
+
+		with path.open(mode="rb") as file:
+			# the map stays valid after the file is closed
+			self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+		self.weights: array[float] | None = None
+		self._offsets: array[int] = self._load_index(stat.st_mtime_ns, stat.st_size)
+
+	@property
+	def index_path(self) -> Path:
+		return self.path.with_name(self.path.name + ".idx")
+
+	def _load_index(self, mtime_ns: int, size: int) -> "array[int]":
+		"""Reads the cached index, or builds (and caches) a fresh one."""
+		try:
+			raw: bytes = self.index_path.read_bytes()
+			magic, cached_mtime, cached_size, weighted, n_lines = (
+				_INDEX_HEADER.unpack_from(raw)
+			)
+			body: bytes = raw[_INDEX_HEADER.size :]
+			# 2 offsets (8 bytes each) and maybe 1 weight (8 bytes) per line
+			expected_size: int = n_lines * (24 if weighted else 16)
+			fresh: bool = (magic, cached_mtime, cached_size) == (
+				_INDEX_MAGIC,
+				mtime_ns,
+				size,
+			)
+			if fresh and len(body) == expected_size:
+				offsets: array[int] = array("Q")
+				offsets.frombytes(body[: n_lines * 16])
+				if weighted:
+					self.weights = array("d")
+					self.weights.frombytes(body[n_lines * 16 :])
+				return offsets
+		except (OSError, struct.error, ValueError):
+			pass
+
+		offsets = self._build_index()
+		self._write_index(offsets, mtime_ns, size)
+		return offsets
+
+	def _write_index(self, offsets: "array[int]", mtime_ns: int, size: int) -> None:
+		"""
+		Caches the index. It is written to a temporary file that replaces the
+		old index once complete, so a crash never leaves a truncated one.
+		"""
+		tmp_path: Path = self.index_path.with_name(
+			f"{self.index_path.name}.{os.getpid()}.tmp"
+		)
+		try:
+			with tmp_path.open(mode="wb") as file:
+				file.write(
+					_INDEX_HEADER.pack(
+						_INDEX_MAGIC,
+						mtime_ns,
+						size,
+						self.weights is not None,
+						len(offsets) // 2,
+					)
+				)
+				offsets.tofile(file)
+				if self.weights is not None:
+					self.weights.tofile(file)
+			os.replace(tmp_path, self.index_path)
+		except OSError:
+			# a read-only wildcards directory just means no cache
+			tmp_path.unlink(missing_ok=True)
+
+	def _build_index(self) -> "array[int]":
+		"""
+		Start and end offsets of every non-blank line, flattened.
+		Also fills the weights of the lines.
+		"""
+		offsets: array[int] = array("Q")
+		weights: array[float] = array("d")
+		has_weights: bool = False
+		data = self._map
+		size: int = len(data)
+		start: int = 0
+
+		while start < size:
+			end: int = data.find(b"\n", start)
+			if end == -1:
+				end = size
+
+			line: bytes = data[start:end]
+			if line.strip():
+				weight: float = 1.0
+				text_start: int = start
+				if b"::" in line:
+					match = WEIGHT_PATTERN.match(line.decode("utf-8", errors="replace"))
+					if match is not None:
+						weight = float(match.group(1))
+						text_start = start + line.index(b"::") + 2
+						has_weights = True
+
+				offsets.append(text_start)
+				offsets.append(end)
+				weights.append(weight)
+			start = end + 1
+
+		self.weights = weights if has_weights else None
+		return offsets
+
+	def __len__(self) -> int:
+		return len(self._offsets) // 2
+
+	@overload
+	def __getitem__(self, index: int) -> str: ...
+
+	@overload
+	def __getitem__(self, index: slice) -> Sequence[str]: ...
+
+	def __getitem__(self, index: int | slice) -> str | Sequence[str]:
+		if isinstance(index, slice):
+			return [self[i] for i in range(*index.indices(len(self)))]
+
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError("wildcard line index out of range")
+
+		start, end = self._offsets[2 * index], self._offsets[2 * index + 1]
+		return self._map[start:end].decode("utf-8", errors="replace").strip()
+
+	def contains(self, text: bytes) -> bool:
+		"""If the raw file contains the bytes, without decoding anything."""
+		return self._map.find(text) != -1
+
+	def close(self) -> None:
+		self._map.close()
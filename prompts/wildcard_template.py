@@ -0,0 +1,58 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+
+WILDCARD_PATTERN = re.compile(r"__(.*?)__")
+
+
+@dataclass(frozen=True, slots=True)
+class WildcardRef:
+	"""A `__name__` placeholder inside a template."""
+
+	name: str
+
+
+type Segment = str | WildcardRef
+
+
+@dataclass(frozen=True, slots=True)
+class Template:
+	"""
+	A prompt split once into literal text and wildcard references.
+
+	Nested wildcards are not expanded here: the lines of a wildcard file are
+	templates too, so resolving is a walk down this tree of templates.
+	"""
+
+	segments: tuple[Segment, ...]
+
+	@property
+	def is_literal(self) -> bool:
+		return not any(isinstance(seg, WildcardRef) for seg in self.segments)
+
+	@property
+	def references(self) -> tuple[str, ...]:
+		return tuple(seg.name for seg in self.segments if isinstance(seg, WildcardRef))
+
+
+@lru_cache(maxsize=65536)
+def compile_template(text: str) -> Template:
+	"""
+	Splits the text into literals and wildcard references.
+	Results are cached, so every distinct prompt or wildcard line is parsed
+	only once per process.
+	"""
+	segments: list[Segment] = []
+	position: int = 0
+
+	for match in WILDCARD_PATTERN.finditer(text):
+		if match.start() > position:
+			segments.append(text[position : match.start()])
+		segments.append(WildcardRef(match.group(1)))
+		position = match.end()
+
+	if position < len(text):
+		segments.append(text[position:])
+
+	return Template(tuple(segments))
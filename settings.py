@@ -1,5 +1,6 @@
+import functools
 from pathlib import Path
-from typing import Any
+from typing import Any, cast
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from enum import StrEnum
@@ -26,13 +27,64 @@ class PipelineType(StrEnum):
 	WILDCARD = "wildcard"
 
 
+class EngineMode(StrEnum):
+	THREADED = "threaded"
+	ASYNCIO = "asyncio"
+
+
+class TransferMode(StrEnum):
+	# rename on the local disk if the images are there, else download them
+	AUTO = "auto"
+	# Fooocus shares our filesystem
+	MOVE = "move"
+	# stream the images from the Fooocus url
+	DOWNLOAD = "download"
+	# receive the images inside the api response
+	BASE64 = "base64"
+
+
+class WildcardMode(StrEnum):
+	# independent random draws, combinations may repeat
+	RANDOM = "random"
+	# every combination at most once, in a seeded pseudo-random order
+	SHUFFLED = "shuffled"
+	# every combination at most once, in order
+	EXHAUSTIVE = "exhaustive"
+
+
+class RateLimitConfig(BaseModel):
+	# highest request rate, e.g. the quota of the api key; the limiter backs
+	# off below it on 429/503 responses and creeps back up afterwards
+	requests_per_minute: float = 60.0
+	burst: int = 5
+	max_concurrency: int = 8
+	# retries of a throttled request before its job fails
+	max_retries: int = 5
+	max_backoff: float = 60.0
+
+
 class GeminiConfig(BaseModel):
 	model: str = "gemini-2.5-flash"
+	# extra calls allowed to fix an answer that isn't a usable idea
+	max_repairs: int = 1
+	# keep the llm instruction in a cached content, reused by every prompt
+	cache_prefix: bool = True
+	# lifetime of that cache in seconds, it is renewed before it expires
+	cache_ttl: int = 3600
+	rate_limit: RateLimitConfig = RateLimitConfig()
 
 
 class OllamaConfig(BaseModel):
 	url: str = "http://127.0.0.1:11434"
 	model: str = "llama3.2"
+	# how long ollama keeps the model loaded after a request ("-1": forever)
+	keep_alive: str = "30m"
+	# stream the answer and stop it as soon as the json is complete
+	stream: bool = True
+	# constrain the output to the idea json schema, not just any json
+	structured_output: bool = True
+	# extra calls allowed to fix an answer that isn't a usable idea
+	max_repairs: int = 1
 
 
 class BananaConfig(BaseModel):
@@ -40,12 +92,71 @@ class BananaConfig(BaseModel):
 	model: str = "gemini-2.5-flash-image"
 	gpu_slug: str = "a100-80gb"
 	gpu_type: str = "A100"
+	rate_limit: RateLimitConfig = RateLimitConfig(requests_per_minute=10.0)
 
 
 class FooocusConfig(BaseModel):
 	url: str = "http://127.0.0.1:8888"
 	checkpoint: str = "juggernautXL_v8Rundiffusion.safetensors"
-	path: Path
+	# root of the local Fooocus installation, not needed for remote servers
+	path: Path | None = None
+	transfer_mode: TransferMode = TransferMode.AUTO
+
+	# several servers (e.g. one per GPU host) are driven as one ArtistPool
+	urls: list[str] = []
+	# failures in a row before an endpoint gets no more jobs
+	max_endpoint_failures: int = 3
+
+	# queue jobs on the server and poll for their results
+	async_jobs: bool = False
+	max_queued_jobs: int = 4
+	poll_interval: float = 1.0
+	# seconds a submission, status query or download may take
+	request_timeout: float = 30.0
+
+
+class EngineConfig(BaseModel):
+	mode: EngineMode = EngineMode.THREADED
+
+	# how many ideas the brain is asked for in a single call
+	brain_batch_size: int = 1
+
+	# threaded mode: how many jobs/ideas may wait between two stages
+	queue_depth: int = 4
+	brain_workers: int = 1
+	artist_workers: int = 1
+
+	# asyncio mode: jobs in flight, and requests in flight per backend
+	max_in_flight: int = 8
+	brain_concurrency: int = 4
+	artist_concurrency: int = 2
+
+
+class HttpConfig(BaseModel):
+	# number of hosts to keep a connection pool for
+	pool_connections: int = 4
+	# kept-alive connections per host, also the per-host limit if pool_block
+	pool_maxsize: int = 8
+	pool_block: bool = True
+	# another endpoint for the genai api, e.g. a proxy or a local stand-in
+	genai_base_url: str | None = None
+
+
+class CsvSinkConfig(BaseModel):
+	# rows written at once, or after flush_interval seconds at the latest
+	batch_size: int = 64
+	flush_interval: float = 1.0
+	fsync_interval: float = 5.0
+
+
+class MetricsConfig(BaseModel):
+	# prometheus textfile rewritten every export_interval seconds
+	textfile: Path | None = None
+	export_interval: float = 15.0
+	# serves /metrics and /summary on 127.0.0.1
+	port: int | None = None
+	# write the json summary of the run to the log folder
+	summary: bool = True
 
 
 class Settings(BaseSettings):
@@ -54,6 +165,18 @@ class Settings(BaseSettings):
 	active_pipeline: PipelineType = PipelineType.WILDCARD
 
 	metadata_image_extension: str = "jpg"
+	# wildcard files from this size (bytes) on are memory-mapped
+	wildcard_mmap_threshold: int = 1 << 20
+	# makes the wildcard draws reproducible, every job gets a seed derived from it
+	wildcard_seed: int | None = None
+	wildcard_mode: WildcardMode = WildcardMode.RANDOM
+	# seconds between checks for edited prompts, configs and instructions,
+	# with 0 a file is checked every time it is read
+	prompt_watch_interval: float = 0.0
+	# load the models (tiny generation) before the first job
+	warm_up: bool = True
+	# seconds a started Ollama or Fooocus server may take to come online
+	service_startup_timeout: float = 120.0
 
 	csv_path: Path = Path("./metadata")
 	meta_prompts_path: Path = Path("./prompts/meta_prompts")
@@ -66,6 +189,11 @@ class Settings(BaseSettings):
 	gemini: GeminiConfig = GeminiConfig()
 	ollama: OllamaConfig = OllamaConfig()
 
+	engine: EngineConfig = EngineConfig()
+	http: HttpConfig = HttpConfig()
+	csv_sink: CsvSinkConfig = CsvSinkConfig()
+	metrics: MetricsConfig = MetricsConfig()
+
 	banana: BananaConfig
 	fooocus: FooocusConfig
 
@@ -76,7 +204,7 @@ class Settings(BaseSettings):
 		extra="ignore",
 	)
 
-	def model_post_init(self, __context: Any) -> None:
+	def ensure_paths(self) -> None:
 		"""Ensuring all paths exist"""
 
 		# all paths to check
@@ -88,5 +216,22 @@ class Settings(BaseSettings):
 			path.mkdir(parents=True, exist_ok=True)
 
 
-# Singleton Instance
-settings = Settings()  # type: ignore
+@functools.cache
+def get_settings() -> Settings:
+	"""Reads the settings (.env and environment) on first use."""
+	return Settings()  # type: ignore
+
+
+class _LazySettings:
+	"""
+	Stands for the Settings until an attribute is used, so importing a
+	module that uses the settings neither reads .env nor fails on a
+	missing key.
+	"""
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(get_settings(), name)
+
+
+# Singleton Instance, built on first use
+settings: Settings = cast(Settings, _LazySettings())
@@ -0,0 +1,54 @@
+import asyncio
+import unittest
+from collections.abc import Iterator
+
+from core.models import ImageIdea
+from core.pipeline.async_engine import AsyncPipelineRunner
+from core.pipeline.base import BasePipeline, JobConfig
+
+
+class SlowPipeline(BasePipeline[JobConfig]):
+	"""Brainstorms forever, so every submitted job is still running."""
+
+	def __init__(self) -> None:
+		self.started = 0
+		self.cancelled = 0
+
+	def brainstorm(self, config: JobConfig) -> ImageIdea | None:
+		raise NotImplementedError
+
+	def paint(self, config: JobConfig, image_idea: ImageIdea) -> bool:
+		raise NotImplementedError
+
+	def save_metadata(self, config: JobConfig, image_idea: ImageIdea) -> bool:
+		raise NotImplementedError
+
+	async def abrainstorm(self, config: JobConfig) -> ImageIdea | None:
+		self.started += 1
+		try:
+			await asyncio.sleep(60)
+		except asyncio.CancelledError:
+			self.cancelled += 1
+			raise
+		return None
+
+
+class FailingJobsTest(unittest.TestCase):
+	def test_running_jobs_are_cancelled(self) -> None:
+		def jobs() -> Iterator[JobConfig]:
+			yield JobConfig(job_key="a")
+			yield JobConfig(job_key="b")
+			raise RuntimeError("no more jobs")
+
+		pipeline = SlowPipeline()
+		runner = AsyncPipelineRunner(pipeline, max_in_flight=4)
+		self.addCleanup(runner.close)
+		with self.assertRaises(RuntimeError):
+			runner.run(jobs())
+
+		self.assertEqual(pipeline.cancelled, pipeline.started)
+		self.assertEqual(asyncio.all_tasks(runner._loop), set())
+
+
+if __name__ == "__main__":
+	unittest.main()
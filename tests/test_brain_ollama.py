@@ -0,0 +1,58 @@
+import os
+import threading
+import unittest
+
+from benchmarks.bench_micro import REQUIRED_ENV
+from benchmarks.fake_servers import FakeBehaviour, FakeOllamaServer
+
+for name, value in REQUIRED_ENV.items():
+	os.environ.setdefault(name, value)
+
+from brains.brain_ollama import OllamaBrain  # noqa: E402
+
+
+INSTRUCTION: str = "You write stock photo ideas. " * 20
+
+
+class PrefixCacheTest(unittest.TestCase):
+	def setUp(self) -> None:
+		self.server = FakeOllamaServer(FakeBehaviour(latency=0, token_latency=0))
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		self.addCleanup(self.server.server_close)
+		self.addCleanup(self.server.shutdown)
+
+	def brain(self, stream: bool) -> OllamaBrain:
+		return OllamaBrain({"model": "fake", "url": self.server.url, "stream": stream})
+
+	def assert_hits(self, stream: bool) -> None:
+		brain = self.brain(stream)
+		for subject in ("a harbor", "a forest", "a storm"):
+			idea = brain.get_response(INSTRUCTION + subject, prefix=INSTRUCTION)
+			self.assertIsNotNone(idea)
+		self.assertEqual(brain.stats.counts["cache_lookups"], 3)
+		# the first call evaluates the instruction, the next ones reuse it
+		self.assertEqual(brain.stats.counts["cache_hits"], 2)
+
+	def test_repeated_prefix_is_a_hit_streamed(self) -> None:
+		self.assert_hits(stream=True)
+
+	def test_repeated_prefix_is_a_hit(self) -> None:
+		self.assert_hits(stream=False)
+
+	def test_other_prefix_is_a_miss(self) -> None:
+		brain = self.brain(stream=True)
+		brain.get_response(INSTRUCTION + "a harbor", prefix=INSTRUCTION)
+		other: str = "Describe a product photo. " * 20
+		brain.get_response(other + "a lamp", prefix=other)
+		self.assertEqual(brain.stats.counts["cache_lookups"], 2)
+		self.assertEqual(brain.stats.counts["cache_hits"], 0)
+
+	def test_stream_without_prefix_stops_early(self) -> None:
+		brain = self.brain(stream=True)
+		self.assertIsNotNone(brain.get_response("Any idea"))
+		self.assertTrue(brain.stats.timings[0].stopped_early)
+		self.assertEqual(brain.stats.counts["cache_lookups"], 0)
+
+
+if __name__ == "__main__":
+	unittest.main()
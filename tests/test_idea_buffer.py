@@ -0,0 +1,60 @@
+import tempfile
+import unittest
+from collections.abc import Hashable
+from pathlib import Path
+
+from core.journal import JobJournal
+from core.models import ImageIdea
+from core.pipeline.batch import IdeaBuffer, KeyedIdeas
+
+
+def idea(name: str) -> ImageIdea:
+	return ImageIdea(prompt=name, title=name, keywords=name, category=1)
+
+
+class JournaledBufferTest(unittest.TestCase):
+	def setUp(self) -> None:
+		tmp = tempfile.TemporaryDirectory()
+		self.addCleanup(tmp.cleanup)
+		self.db_path = Path(tmp.name) / "journal.sqlite3"
+		self.calls: list[list[Hashable]] = []
+
+	def fetch(self, keys: list[Hashable]) -> KeyedIdeas:
+		self.calls.append(keys)
+		return [(key, idea(f"{key}")) for key in keys]
+
+	def journal(self, resume: bool) -> JobJournal:
+		journal = JobJournal(self.db_path, resume=resume)
+		self.addCleanup(journal.close)
+		return journal
+
+	def test_resumed_run_reuses_the_batch(self) -> None:
+		buffer = IdeaBuffer()
+		buffer.attach(self.journal(resume=False))
+		keys: list[Hashable] = [("cats", 0), ("cats", 1), ("cats", 2)]
+		first = buffer.get(keys[0], self.fetch, keys[1:], size=3)
+		self.assertEqual(first, idea("('cats', 0)"))
+
+		# the run crashes here, the resumed one gets the other two for free
+		resumed = IdeaBuffer()
+		self.assertEqual(resumed.attach(self.journal(resume=True)), 2)
+		self.assertEqual(resumed.get(keys[1], self.fetch), idea("('cats', 1)"))
+		self.assertEqual(resumed.get(keys[2], self.fetch), idea("('cats', 2)"))
+		self.assertEqual(len(self.calls), 1)
+
+		# taken ideas are gone from the journal
+		self.assertEqual(IdeaBuffer().attach(self.journal(resume=True)), 0)
+
+	def test_discard_drops_the_journaled_ideas(self) -> None:
+		buffer = IdeaBuffer()
+		buffer.attach(self.journal(resume=False))
+		buffer.get(("cats", 0), self.fetch, [("cats", 1), ("dogs", 0)], size=3)
+
+		self.assertEqual(buffer.discard(lambda key: key == ("cats", 1)), 1)
+		resumed = IdeaBuffer()
+		self.assertEqual(resumed.attach(self.journal(resume=True)), 1)
+		self.assertEqual(resumed.get(("dogs", 0), self.fetch), idea("('dogs', 0)"))
+
+
+if __name__ == "__main__":
+	unittest.main()
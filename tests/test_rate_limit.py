@@ -0,0 +1,113 @@
+import threading
+import time
+import unittest
+import urllib.error
+from email.message import Message
+
+from benchmarks.bench_rate_limit import FakeQuotaServer, post
+from core.rate_limit import AdaptiveLimiter
+
+
+def throttled_error(retry_after: str = "0") -> urllib.error.HTTPError:
+	headers = Message()
+	headers["Retry-After"] = retry_after
+	return urllib.error.HTTPError("http://fake", 429, "quota", headers, None)
+
+
+class AimdTest(unittest.TestCase):
+	def setUp(self) -> None:
+		# fast enough that the pacing itself never waits in these tests
+		self.limiter = AdaptiveLimiter(
+			"test", requests_per_minute=6000, burst=50, max_concurrency=8
+		)
+
+	def test_throttling_halves_the_limits(self) -> None:
+		limits: list[tuple[float, float]] = []
+
+		def request() -> str:
+			limits.append((self.limiter.rate, self.limiter.concurrency))
+			if len(limits) == 1:
+				raise throttled_error()
+			return "ok"
+
+		self.assertEqual(self.limiter.call(request), "ok")
+		self.assertEqual(limits, [(100.0, 8.0), (50.0, 4.0)])
+		self.assertEqual((self.limiter.throttled, self.limiter.retries), (1, 1))
+
+	def test_successes_raise_the_limits_step_by_step(self) -> None:
+		attempts: list[int] = []
+
+		def throttled_once() -> None:
+			attempts.append(1)
+			if len(attempts) == 1:
+				raise throttled_error()
+
+		self.limiter.call(throttled_once)
+		# the retry that got through was the first step back up
+		rates: list[float] = [self.limiter.rate]
+		for _ in range(30):
+			self.limiter.call(lambda: None)
+			rates.append(self.limiter.rate)
+
+		step: float = self.limiter.max_rate / 50
+		self.assertAlmostEqual(rates[0], 50.0 + step)
+		for before, after in zip(rates, rates[1:]):
+			self.assertAlmostEqual(after, min(before + step, 100.0))
+		self.assertEqual(rates[-1], 100.0)
+		self.assertEqual(self.limiter.concurrency, 8.0)
+
+	def test_out_of_retries_raises(self) -> None:
+		limiter = AdaptiveLimiter("test", requests_per_minute=6000, max_retries=2)
+
+		def request() -> None:
+			raise throttled_error()
+
+		with self.assertRaises(urllib.error.HTTPError):
+			limiter.call(request)
+		self.assertEqual((limiter.throttled, limiter.retries), (3, 2))
+
+	def test_other_errors_are_not_retried(self) -> None:
+		def request() -> None:
+			raise ValueError("broken answer")
+
+		with self.assertRaises(ValueError):
+			self.limiter.call(request)
+		self.assertEqual(self.limiter.rate, self.limiter.max_rate)
+		self.assertEqual(self.limiter.in_flight, 0)
+
+
+class QuotaServerTest(unittest.TestCase):
+	def setUp(self) -> None:
+		# one request per second, the second one in a row gets a 429
+		self.server = FakeQuotaServer(quota=1, latency=0, retry_after=1)
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		self.addCleanup(self.server.server_close)
+		self.addCleanup(self.server.shutdown)
+		self.limiter = AdaptiveLimiter("fake api", requests_per_minute=6000)
+
+	def test_retry_after_is_honoured(self) -> None:
+		post(self.server.url)
+		start: float = time.monotonic()
+		body: bytes = self.limiter.call(lambda: post(self.server.url))
+		waited: float = time.monotonic() - start
+
+		self.assertEqual(body, b'{"ok": true}')
+		self.assertEqual(self.server.throttled, 1)
+		self.assertEqual(self.limiter.retries, 1)
+		self.assertGreaterEqual(waited, 1.0)
+
+	def test_requests_get_through_once_throttling_stops(self) -> None:
+		post(self.server.url)
+		with self.assertRaises(urllib.error.HTTPError) as caught:
+			post(self.server.url)
+		self.assertEqual(caught.exception.code, 429)
+
+		results: list[bytes] = [
+			self.limiter.call(lambda: post(self.server.url)) for _ in range(2)
+		]
+		self.assertEqual(results, [b'{"ok": true}'] * 2)
+		self.assertEqual(self.server.served, 3)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,28 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+from core import transport
+
+
+@mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "test"})
+class GenaiCloseTest(unittest.TestCase):
+	def test_close_closes_the_httpx_client(self) -> None:
+		api_client = transport.get_genai_client()._api_client
+		transport.close()
+		self.assertTrue(api_client._httpx_client.is_closed)
+		self.assertIsNot(transport.get_genai_client()._api_client, api_client)
+		transport.close()
+
+	def test_aclose_closes_the_async_client_too(self) -> None:
+		api_client = transport.get_genai_client()._api_client
+		asyncio.run(transport.aclose())
+		self.assertTrue(api_client._httpx_client.is_closed)
+		self.assertTrue(api_client._async_httpx_client.is_closed)
+		# nothing left for close() to do
+		transport.close()
+
+
+if __name__ == "__main__":
+	unittest.main()